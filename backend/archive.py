@@ -0,0 +1,310 @@
+"""
+Cold storage for old sales.
+
+Sales older than ARCHIVE_HORIZON_DAYS are moved out of the hot tables into
+zstd-compressed Parquet files, one directory per tenant and month:
+
+    ARCHIVE_DIR/tenant_<id>/<YYYY-MM>/transactions.parquet
+                                       items.parquet
+
+Archiving a month writes its files, stores per-day totals in
+daily_sales_summary and deletes the rows, all in one database transaction.
+If the transaction fails the files are rewritten on the next run. A month
+can be archived again when late sales land in it (store pushes keep their
+original created_at): the new rows are merged with the files already there
+and the month's summaries are rebuilt from the union. The summary rows also
+act as the manifest of archived months: read paths only open files for
+months that have them.
+
+Analytics ranges that reach past the horizon call daily_sales(), which
+scans the archived months memory-mapped, reading only the columns it needs.
+Without pyarrow, or for a month whose files are not on this host, the
+whole-day summary rows are used instead.
+
+Usage:
+    python archive.py                          # archive everything past the horizon
+    python archive.py --horizon-days 365 --dry-run
+"""
+import argparse
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import delete, func, select
+
+import models
+import money
+from partitions import add_months, month_start
+from settings import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # optional - archiving needs it, reads fall back to summaries
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_COLUMNS = (
+    "id", "tenant_id", "user_id", "customer_id", "subtotal", "discount_amount",
+    "discount_type", "discount_value", "total_amount", "payment_method", "created_at", "refund_of",
+)
+ITEM_COLUMNS = (
+    "id", "transaction_id", "product_id", "product_name", "quantity", "unit_price", "total_price",
+    "discount_amount", "promotion_id", "tenant_id", "created_at", "refund_of", "restocked",
+)
+
+def _arrow_type(column):
+    if getattr(column.type, "scale", None) == 2:
+        return pa.decimal128(12, 2)
+    python_type = column.type.python_type
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is datetime:
+        return pa.timestamp("us")
+    return pa.string()
+
+def _schema(model, columns):
+    table = model.__table__
+    return pa.schema([(name, _arrow_type(table.c[name])) for name in columns])
+
+def month_dir(tenant_id: int, month: date) -> str:
+    return os.path.join(settings.ARCHIVE_DIR, f"tenant_{tenant_id}", f"{month.year}-{month.month:02d}")
+
+def horizon() -> datetime:
+    """Sales before this instant may live in the archive"""
+    return datetime.now(timezone.utc) - timedelta(days=settings.ARCHIVE_HORIZON_DAYS)
+
+def naive_utc(value: datetime) -> datetime:
+    # created_at columns hold naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+# ==========================================
+# ARCHIVING
+# ==========================================
+
+def _write(path: str, rows, model, columns):
+    schema = _schema(model, columns)
+    table = pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+def _merge(path: str, rows, columns, order_by):
+    """Rows already archived at path plus rows, the new ones replacing the same sale rows"""
+    if not os.path.exists(path):
+        return rows
+    archived = pq.read_table(path, columns=list(columns)).to_pylist()
+    # SQLite hands out the ids of deleted rows again, so an id alone does not
+    # identify an archived row
+    key = [columns.index("id"), columns.index("created_at")]
+    merged = {tuple(row[columns[k]] for k in key): tuple(row[name] for name in columns) for row in archived}
+    merged.update((tuple(row[k] for k in key), tuple(row)) for row in rows)
+    keys = [columns.index(name) for name in order_by]
+    return sorted(merged.values(), key=lambda row: tuple(row[k] for k in keys))
+
+def _summaries(tenant_id: int, txn_rows, item_rows):
+    created = TRANSACTION_COLUMNS.index("created_at")
+    total = TRANSACTION_COLUMNS.index("total_amount")
+    discount = TRANSACTION_COLUMNS.index("discount_amount")
+    days = defaultdict(lambda: {"total": 0, "discount": 0, "count": 0, "items": 0})
+    for row in txn_rows:
+        entry = days[row[created].date()]
+        entry["total"] += money.to_cents(row[total])
+        entry["discount"] += money.to_cents(row[discount])
+        entry["count"] += 1
+    item_created = ITEM_COLUMNS.index("created_at")
+    quantity = ITEM_COLUMNS.index("quantity")
+    for row in item_rows:
+        days[row[item_created].date()]["items"] += row[quantity]
+    return [
+        {
+            "tenant_id": tenant_id,
+            "day": day,
+            "total_sales": money.from_cents(entry["total"]),
+            "discount_total": money.from_cents(entry["discount"]),
+            "transaction_count": entry["count"],
+            "items_sold": entry["items"],
+        }
+        for day, entry in sorted(days.items())
+    ]
+
+def archive_month(conn, tenant_id: int, month: date) -> int:
+    """Move one tenant-month of sales to Parquet; returns the number of sales moved"""
+    start, end = datetime.combine(month, datetime.min.time()), datetime.combine(add_months(month, 1), datetime.min.time())
+    txn, item = models.Transaction.__table__, models.TransactionItem.__table__
+
+    txn_rows = conn.execute(
+        select(*[txn.c[name] for name in TRANSACTION_COLUMNS])
+        .where(txn.c.tenant_id == tenant_id, txn.c.created_at >= start, txn.c.created_at < end)
+        .order_by(txn.c.created_at)
+    ).all()
+    if not txn_rows:
+        return 0
+    item_rows = conn.execute(
+        select(*[item.c[name] for name in ITEM_COLUMNS])
+        .where(item.c.tenant_id == tenant_id, item.c.created_at >= start, item.c.created_at < end)
+        .order_by(item.c.transaction_id, item.c.id)
+    ).all()
+
+    directory = month_dir(tenant_id, month)
+    txn_path = os.path.join(directory, "transactions.parquet")
+    item_path = os.path.join(directory, "items.parquet")
+    summary = models.DailySalesSummary.__table__
+    in_month = (summary.c.tenant_id == tenant_id, summary.c.day >= month, summary.c.day < add_months(month, 1))
+    archived = conn.execute(select(func.count()).select_from(summary).where(*in_month)).scalar()
+    if archived and not os.path.exists(txn_path):
+        # Rewriting the month from the late rows alone would lose the earlier sales
+        raise RuntimeError(f"Archive file {txn_path} not found; run this where ARCHIVE_DIR is mounted")
+
+    # Late sales join the month's archive; rows of a failed earlier run are replaced
+    all_txn_rows = _merge(txn_path, txn_rows, TRANSACTION_COLUMNS, ("created_at", "id"))
+    all_item_rows = _merge(item_path, item_rows, ITEM_COLUMNS, ("transaction_id", "id"))
+    os.makedirs(directory, exist_ok=True)
+    _write(txn_path, all_txn_rows, models.Transaction, TRANSACTION_COLUMNS)
+    _write(item_path, all_item_rows, models.TransactionItem, ITEM_COLUMNS)
+
+    conn.execute(delete(summary).where(*in_month))
+    conn.execute(summary.insert(), _summaries(tenant_id, all_txn_rows, all_item_rows))
+
+    conn.execute(delete(item).where(
+        item.c.tenant_id == tenant_id, item.c.created_at >= start, item.c.created_at < end
+    ))
+    conn.execute(delete(txn).where(
+        txn.c.tenant_id == tenant_id, txn.c.created_at >= start, txn.c.created_at < end
+    ))
+    return len(txn_rows)
+
+def archive_old_sales(engine, horizon_days: int = None, dry_run: bool = False, log=print):
+    """Archive every whole month that ended before the horizon, one transaction per tenant-month"""
+    if pa is None:
+        raise RuntimeError("pyarrow is required to write the sales archive (pip install pyarrow)")
+    horizon_days = settings.ARCHIVE_HORIZON_DAYS if horizon_days is None else horizon_days
+    cutoff = month_start(datetime.now(timezone.utc) - timedelta(days=horizon_days))
+    txn = models.Transaction.__table__
+
+    with engine.connect() as conn:
+        oldest = conn.execute(
+            select(txn.c.tenant_id, func.min(txn.c.created_at))
+            .where(txn.c.created_at < datetime.combine(cutoff, datetime.min.time()))
+            .group_by(txn.c.tenant_id)
+        ).all()
+
+    moved = 0
+    for tenant_id, first_sale in oldest:
+        month = month_start(first_sale)
+        while month < cutoff:
+            if dry_run:
+                log(f"Would archive tenant {tenant_id} {month:%Y-%m}")
+            else:
+                with engine.begin() as conn:
+                    count = archive_month(conn, tenant_id, month)
+                if count:
+                    log(f"✓ Archived tenant {tenant_id} {month:%Y-%m}: {count} sales")
+                moved += count
+            month = add_months(month, 1)
+    return moved
+
+# ==========================================
+# READ PATH
+# ==========================================
+
+def daily_sales(db, tenant_id: int, start: datetime, end: datetime = None):
+    """
+    {date: (total_sales Decimal, transaction_count)} for archived sales in
+    [start, end). Partial first/last days are exact when pyarrow is available.
+    """
+    start = naive_utc(start)
+    end = naive_utc(end) if end else None
+    summary = models.DailySalesSummary
+    query = db.query(summary.day, summary.total_sales, summary.transaction_count).filter(
+        summary.tenant_id == tenant_id, summary.day >= start.date()
+    )
+    if end is not None:
+        query = query.filter(summary.day <= end.date())
+    rows = query.all()
+    if pa is None:
+        return {day: (Decimal(total_sales), count) for day, total_sales, count in rows}
+
+    result = defaultdict(lambda: [Decimal(0), 0])
+    for month in sorted({month_start(day) for day, _, _ in rows}):
+        path = os.path.join(month_dir(tenant_id, month), "transactions.parquet")
+        filters = [("created_at", ">=", start)]
+        if end is not None:
+            filters.append(("created_at", "<", end))
+        try:
+            table = pq.read_table(path, columns=["created_at", "total_amount"], memory_map=True, filters=filters)
+        except FileNotFoundError:
+            # Archived on another host: whole-day totals are all we have here
+            logger.warning(f"Archive file {path} not found; using daily summaries for {month:%Y-%m}")
+            for day, total_sales, count in rows:
+                if month_start(day) == month:
+                    result[day][0] += Decimal(total_sales)
+                    result[day][1] += count
+            continue
+        if table.num_rows == 0:
+            continue
+        table = table.append_column("day", pc.cast(table["created_at"], pa.date32()))
+        grouped = table.group_by("day").aggregate([("total_amount", "sum"), ("total_amount", "count")])
+        for day, total, count in zip(
+            grouped["day"].to_pylist(),
+            grouped["total_amount_sum"].to_pylist(),
+            grouped["total_amount_count"].to_pylist(),
+        ):
+            result[day][0] += total
+            result[day][1] += count
+    return {day: tuple(entry) for day, entry in result.items()}
+
+def archived_months(conn, tenant_id: int):
+    summary = models.DailySalesSummary.__table__
+    days = conn.scalars(select(summary.c.day).where(summary.c.tenant_id == tenant_id)).all()
+    return sorted({month_start(day) for day in days})
+
+def customer_sales(conn, tenant_id: int):
+    """
+    {(customer_id, sale id): [net cents, last purchase]} over archived sales;
+    refunds count towards the sale they refund
+    """
+    months = archived_months(conn, tenant_id)
+    if months and pa is None:
+        raise RuntimeError("pyarrow is required to read the sales archive (pip install pyarrow)")
+    sales = {}
+    for month in months:
+        path = os.path.join(month_dir(tenant_id, month), "transactions.parquet")
+        try:
+            table = pq.read_table(path, columns=["id", "customer_id", "refund_of", "total_amount", "created_at"],
+                                  memory_map=True)
+        except FileNotFoundError:
+            # Summaries carry no customers, so there is nothing to fall back to
+            raise RuntimeError(f"Archive file {path} not found; run this where ARCHIVE_DIR is mounted") from None
+        for transaction_id, customer_id, refund_of, amount, created_at in zip(
+            table["id"].to_pylist(), table["customer_id"].to_pylist(), table["refund_of"].to_pylist(),
+            table["total_amount"].to_pylist(), table["created_at"].to_pylist()
+        ):
+            if customer_id is None:
+                continue
+            entry = sales.setdefault((customer_id, refund_of or transaction_id), [0, created_at])
+            entry[0] += money.to_cents(amount)
+            entry[1] = max(entry[1], created_at)
+    return sales
+
+if __name__ == "__main__":
+    import database
+
+    parser = argparse.ArgumentParser(description="Move old sales to Parquet cold storage")
+    parser.add_argument("--horizon-days", type=int, default=settings.ARCHIVE_HORIZON_DAYS)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    total = archive_old_sales(database.engine, args.horizon_days, dry_run=args.dry_run)
+    if not args.dry_run:
+        print(f"✅ Archived {total} sales to {os.path.abspath(settings.ARCHIVE_DIR)}")
@@ -1,9 +1,10 @@
+import hmac
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 import models
 import database
 
@@ -49,9 +50,21 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    # Check if user exists in DB
-    user = db.query(models.User).filter(models.User.email == email).first()
+    # Check if user exists in DB (tenant is joined: routes use it for ETags/receipts)
+    user = db.query(models.User).options(
+        joinedload(models.User.tenant)
+    ).filter(models.User.email == email).first()
     if user is None:
         raise credentials_exception
         
-    return user
\ No newline at end of file
+    return user
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Guards admin endpoints: X-Admin-Token must match ADMIN_TOKEN. They look
+    absent (404) otherwise, and when no ADMIN_TOKEN is configured.
+    """
+    if not settings.ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(
+        x_admin_token.encode(), settings.ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
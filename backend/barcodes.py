@@ -0,0 +1,184 @@
+"""
+Variable-measure barcode decoding (scale labels for produce, deli, meat).
+
+In-store EAN-13 labels start with a restricted prefix (20-29) and carry a
+PLU plus the weight or the price of the item instead of a fixed product
+code. The digit layout differs by country and by scale vendor, so each
+tenant configures its own schemes (barcode_schemes), for example:
+
+    prefix "21", PLU digits 2-6, weight in grams at digits 7-11
+        2 1 0 4 0 1 1 | 0 0 7 5 0 | 4   ->  PLU 04011, 0.750 kg
+    prefix "22", PLU digits 2-6, price in cents at digits 7-11
+        2 2 0 0 1 2 3 | 0 0 4 9 9 | 2   ->  PLU 00123, 4.99
+
+A scanned code is matched against the schemes (longest prefix first), its
+check digit verified, and the PLU resolved through the (tenant_id, plu)
+index on products. Codes that match no scheme fall back to an exact
+product barcode lookup. Schemes are cached per tenant for
+BARCODE_SCHEME_CACHE_SECONDS.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import models
+import money
+from settings import settings
+
+WEIGHT = "weight"
+PRICE = "price"
+VALUE_TYPES = (WEIGHT, PRICE)
+
+@dataclass(frozen=True)
+class Scheme:
+    prefix: str
+    length: int
+    plu_start: int
+    plu_length: int
+    value_start: int
+    value_length: int
+    value_type: str
+    value_decimals: int
+
+@dataclass(frozen=True)
+class Decoded:
+    plu: str
+    value: int                  # raw embedded digits, e.g. grams or cents
+    value_type: str
+    value_decimals: int
+
+    @property
+    def quantity(self) -> float:
+        """Embedded value in display units (kg or currency)"""
+        return self.value / 10 ** self.value_decimals
+
+def check_digit_ok(code: str) -> bool:
+    """GS1 mod-10 check (EAN-8/12/13, UPC-A)"""
+    digits = [int(ch) for ch in code]
+    body, check = digits[:-1], digits[-1]
+    # Weights 3,1,3,1... from the digit next to the check digit
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return (10 - total % 10) % 10 == check
+
+def decode(code: str, schemes: List[Scheme]) -> Optional[Decoded]:
+    """PLU and embedded value of a variable-measure code, or None"""
+    code = code.strip()
+    if not code.isdigit():
+        return None
+    for scheme in schemes:
+        if len(code) != scheme.length or not code.startswith(scheme.prefix):
+            continue
+        if not check_digit_ok(code):
+            return None
+        return Decoded(
+            plu=code[scheme.plu_start:scheme.plu_start + scheme.plu_length],
+            value=int(code[scheme.value_start:scheme.value_start + scheme.value_length]),
+            value_type=scheme.value_type,
+            value_decimals=scheme.value_decimals,
+        )
+    return None
+
+def line_cents(decoded: Decoded, unit_cents: int) -> int:
+    """Price of one label: embedded price, or per-kg price times embedded weight (half up)"""
+    scale = 10 ** decoded.value_decimals
+    per_unit = money.MINOR_UNITS if decoded.value_type == PRICE else unit_cents
+    # Integer math: round(per_unit * value / scale) with halves rounded up
+    return (per_unit * decoded.value * 2 + scale) // (2 * scale)
+
+# ==========================================
+# PER-TENANT SCHEME CACHE
+# ==========================================
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def load_schemes(db, tenant_id: int) -> List[Scheme]:
+    rows = db.query(models.BarcodeScheme).filter(models.BarcodeScheme.tenant_id == tenant_id).all()
+    schemes = [
+        Scheme(row.prefix, row.length, row.plu_start, row.plu_length, row.value_start,
+               row.value_length, row.value_type, row.value_decimals)
+        for row in rows
+    ]
+    # Longest prefix wins, so "212" can override "21"
+    return sorted(schemes, key=lambda scheme: len(scheme.prefix), reverse=True)
+
+def schemes_for(db, tenant_id: int) -> List[Scheme]:
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(tenant_id)
+        if entry and now - entry[0] < settings.BARCODE_SCHEME_CACHE_SECONDS:
+            return entry[1]
+    schemes = load_schemes(db, tenant_id)
+    with _cache_lock:
+        _cache[tenant_id] = (now, schemes)
+    return schemes
+
+def invalidate(tenant_id: int = None):
+    with _cache_lock:
+        if tenant_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(tenant_id, None)
+
+# ==========================================
+# SCANNING
+# ==========================================
+
+def _active_products(db, tenant_id: int):
+    return db.query(models.Product).filter(
+        models.Product.tenant_id == tenant_id,
+        models.Product.is_active == True
+    )
+
+def _label_name(product, decoded: Decoded) -> str:
+    if decoded.value_type == WEIGHT:
+        return f"{product.name} ({decoded.quantity:.{decoded.value_decimals}f} kg)"
+    return product.name
+
+def scan(db, tenant_id: int, code: str) -> Optional[dict]:
+    """
+    Cart line for a scanned code: decoded through the tenant's schemes and
+    resolved by PLU, or an exact barcode match. None when nothing matches.
+    """
+    code = code.strip()
+    decoded = decode(code, schemes_for(db, tenant_id))
+    if decoded is not None:
+        product = _active_products(db, tenant_id).filter(models.Product.plu == decoded.plu).first()
+        if product is not None:
+            cents = line_cents(decoded, money.to_cents(product.selling_price))
+            return {
+                "product_id": product.id,
+                "product_name": _label_name(product, decoded),
+                "quantity": 1,
+                "unit_price": money.from_cents(cents),
+                "barcode": code,
+                "plu": decoded.plu,
+                "weight": decoded.quantity if decoded.value_type == WEIGHT else None,
+                "stock_quantity": product.stock_quantity or 0,
+            }
+
+    product = _active_products(db, tenant_id).filter(models.Product.barcode == code).first()
+    if product is None:
+        return None
+    return {
+        "product_id": product.id,
+        "product_name": product.name,
+        "quantity": 1,
+        "unit_price": product.selling_price,
+        "barcode": None,
+        "plu": product.plu,
+        "weight": None,
+        "stock_quantity": product.stock_quantity or 0,
+    }
+
+def checkout_price(db, tenant_id: int, product, code: str):
+    """
+    (unit cents, line name) for a cart line added from a scale label, or
+    None when the code is not a variable-measure label for this product
+    (the line is then priced normally)
+    """
+    decoded = decode(code, schemes_for(db, tenant_id))
+    if decoded is None or product.plu is None or decoded.plu != product.plu:
+        return None
+    return line_cents(decoded, money.to_cents(product.selling_price)), _label_name(product, decoded)
@@ -0,0 +1,234 @@
+"""
+Market-basket mining: "frequently bought together" per product.
+
+Baskets are streamed from transaction_items in transaction order, in chunks
+of BASKET_CHUNK_ROWS. Each chunk is turned into product-pair keys with NumPy
+(no Python loop over baskets), and per-pair counts are merged into a sorted
+key/count array pair. The pair table is bounded by BASKET_MAX_PAIRS: when it
+grows past that, the rarest pairs are dropped and pairs under that count are
+left out of the results, so memory stays flat however many line items there
+are. With a budget well above the number of frequent pairs this only ever
+removes noise.
+
+For every pair (a, b) with at least BASKET_MIN_PAIR_COUNT baskets:
+    support    = baskets(a, b) / baskets
+    confidence = baskets(a, b) / baskets(a)
+    lift       = confidence / (baskets(b) / baskets)
+The top BASKET_TOP_K partners of each product by lift are stored in
+product_associations, replacing the tenant's previous results.
+
+Usage:
+    python basket.py --tenant 1             # or --all; mines in this process
+    python basket.py --all --enqueue        # queue 'basket_mine' jobs for the job runners
+
+The nightly cron in DEPLOYMENT.md runs the --enqueue form. A tenant that
+already has a mining job waiting or running gets no second one, and the job
+holds its claim for BASKET_MINE_LEASE_SECONDS instead of the default lease.
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import delete, select
+
+import jobs
+import models
+from settings import settings
+
+class PairCounter:
+    """Bounded accumulator of co-occurrence counts keyed by a * n_products + b (a < b)"""
+
+    def __init__(self, n_products: int, max_pairs: int):
+        self.n_products = n_products
+        self.max_pairs = max_pairs
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.item_counts = np.zeros(n_products, dtype=np.int64)
+        self.baskets = 0
+        self.pruned_below = 0
+
+    def add_chunk(self, basket_ids: np.ndarray, products: np.ndarray):
+        """Count one chunk of (basket id, product index) rows; baskets must not span chunks"""
+        if len(products) == 0:
+            return
+        # One row per distinct product in a basket, sorted by basket then product
+        rows = np.unique(np.stack([basket_ids, products], axis=1), axis=0)
+        basket_ids, products = rows[:, 0], rows[:, 1]
+        starts = np.flatnonzero(np.r_[True, basket_ids[1:] != basket_ids[:-1]])
+        sizes = np.diff(np.r_[starts, len(rows)])
+        self.baskets += len(starts)
+        self.item_counts += np.bincount(products, minlength=self.n_products)
+
+        # Each row pairs with every later row of its basket
+        position = np.arange(len(rows)) - np.repeat(starts, sizes)
+        partners = np.repeat(sizes, sizes) - position - 1
+        total = int(partners.sum())
+        if total == 0:
+            return
+        left = np.repeat(np.arange(len(rows)), partners)
+        offsets = np.repeat(np.cumsum(partners) - partners, partners)
+        right = left + 1 + (np.arange(total) - offsets)
+        keys, counts = np.unique(products[left] * self.n_products + products[right], return_counts=True)
+        self._merge(keys, counts)
+
+    def _merge(self, keys: np.ndarray, counts: np.ndarray):
+        all_keys = np.concatenate([self.keys, keys])
+        all_counts = np.concatenate([self.counts, counts])
+        self.keys, inverse = np.unique(all_keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=all_counts).astype(np.int64)
+        if len(self.keys) > self.max_pairs:
+            # Keep the max_pairs most frequent pairs
+            floor = np.partition(self.counts, len(self.counts) - self.max_pairs)[len(self.counts) - self.max_pairs]
+            keep = self.counts > floor
+            self.pruned_below = max(self.pruned_below, int(floor) + 1)
+            self.keys, self.counts = self.keys[keep], self.counts[keep]
+
+    def associations(self, min_count: int, top_k: int):
+        """(product a, product b, pair count, support, confidence, lift, rank) arrays, both directions"""
+        keep = self.counts >= max(min_count, self.pruned_below)
+        a, b = np.divmod(self.keys[keep], self.n_products)
+        counts = self.counts[keep]
+        # Both directions: a -> b and b -> a
+        source = np.concatenate([a, b])
+        target = np.concatenate([b, a])
+        pair_counts = np.concatenate([counts, counts])
+        baskets = max(self.baskets, 1)
+        support = pair_counts / baskets
+        confidence = pair_counts / self.item_counts[source]
+        lift = confidence / (self.item_counts[target] / baskets)
+
+        # Rank partners per source product by lift, then pair count
+        order = np.lexsort((-pair_counts, -lift, source))
+        source, target, pair_counts = source[order], target[order], pair_counts[order]
+        support, confidence, lift = support[order], confidence[order], lift[order]
+        group_start = np.flatnonzero(np.r_[True, source[1:] != source[:-1]])
+        rank = np.arange(len(source)) - np.repeat(group_start, np.diff(np.r_[group_start, len(source)]))
+        top = rank < top_k
+        return (source[top], target[top], pair_counts[top], support[top],
+                confidence[top], lift[top], rank[top] + 1)
+
+def _stream_baskets(db, tenant_id: int, chunk_rows: int):
+    """Yield (transaction ids, product ids) arrays; a basket never spans two chunks"""
+    item = models.TransactionItem.__table__
+    result = db.execute(
+        select(item.c.transaction_id, item.c.product_id)
+        # Refund lines (negative quantity) are not baskets
+        .where(item.c.tenant_id == tenant_id, item.c.quantity > 0)
+        .order_by(item.c.transaction_id),
+        execution_options={"stream_results": True, "yield_per": chunk_rows},
+    )
+    carry = np.empty((0, 2), dtype=np.int64)
+    for partition in result.partitions(chunk_rows):
+        rows = np.concatenate([carry, np.array(partition, dtype=np.int64).reshape(-1, 2)])
+        # Hold back the last basket; it may continue in the next chunk
+        last = np.searchsorted(rows[:, 0], rows[-1, 0])
+        carry = rows[last:]
+        if last:
+            yield rows[:last, 0], rows[:last, 1]
+    if len(carry):
+        yield carry[:, 0], carry[:, 1]
+
+def mine_tenant(db, tenant_id: int, log=print):
+    """Recompute and store the tenant's product associations"""
+    started = time.perf_counter()
+    product_ids = np.array(db.scalars(
+        select(models.Product.id)
+        .where(models.Product.tenant_id == tenant_id, models.Product.is_active == True)
+        .order_by(models.Product.id)
+    ).all(), dtype=np.int64)
+    if len(product_ids) == 0:
+        return 0
+    counter = PairCounter(len(product_ids), settings.BASKET_MAX_PAIRS)
+    lines = 0
+    for transaction_ids, products in _stream_baskets(db, tenant_id, settings.BASKET_CHUNK_ROWS):
+        lines += len(products)
+        index = np.searchsorted(product_ids, products)
+        # Lines of deleted (inactive) products are skipped
+        known = (index < len(product_ids)) & (product_ids[np.minimum(index, len(product_ids) - 1)] == products)
+        counter.add_chunk(transaction_ids[known], index[known])
+
+    source, target, pair_counts, support, confidence, lift, rank = counter.associations(
+        settings.BASKET_MIN_PAIR_COUNT, settings.BASKET_TOP_K
+    )
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "tenant_id": tenant_id,
+            "product_id": int(product_ids[s]),
+            "associated_product_id": int(product_ids[t]),
+            "rank": int(r),
+            "pair_count": int(n),
+            "support": round(float(sup), 6),
+            "confidence": round(float(conf), 6),
+            "lift": round(float(l), 4),
+            "computed_at": now,
+        }
+        for s, t, n, sup, conf, l, r in zip(source, target, pair_counts, support, confidence, lift, rank)
+    ]
+    table = models.ProductAssociation.__table__
+    db.execute(delete(table).where(table.c.tenant_id == tenant_id))
+    if rows:
+        db.execute(table.insert(), rows)
+    db.commit()
+    log(f"✓ Tenant {tenant_id}: {lines} lines, {counter.baskets} baskets, {len(counter.keys)} pairs -> "
+        f"{len(rows)} associations in {time.perf_counter() - started:.1f}s")
+    return len(rows)
+
+@jobs.handler("basket_mine", lease_seconds=settings.BASKET_MINE_LEASE_SECONDS)
+def _mine_job(db, payload):
+    mine_tenant(db, payload["tenant_id"], log=lambda message: None)
+
+def enqueue_mining(db, tenant_ids) -> int:
+    """Queue a basket_mine job per tenant unless one is already waiting or running"""
+    job = models.Job
+    busy = set(db.scalars(
+        select(job.tenant_id).where(job.kind == "basket_mine", job.status.in_(("pending", "running")))
+    ))
+    queued = 0
+    for tenant_id in tenant_ids:
+        if tenant_id not in busy:
+            jobs.enqueue(db, "basket_mine", {"tenant_id": tenant_id}, tenant_id=tenant_id)
+            queued += 1
+    db.commit()
+    return queued
+
+def suggestions(db, tenant_id: int, product_id: int, limit: int):
+    """Top cross-sell partners for a product, with current name, price and stock"""
+    association, product = models.ProductAssociation, models.Product
+    return db.query(
+        product.id.label("product_id"),
+        product.name,
+        product.barcode,
+        product.selling_price,
+        product.stock_quantity,
+        association.lift,
+        association.confidence,
+        association.support,
+    ).join(product, product.id == association.associated_product_id).filter(
+        association.tenant_id == tenant_id,
+        association.product_id == product_id,
+        product.is_active == True,
+        product.stock_quantity > 0,
+    ).order_by(association.rank).limit(limit).all()
+
+if __name__ == "__main__":
+    import database
+
+    parser = argparse.ArgumentParser(description="Mine frequently-bought-together associations")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--tenant", type=int)
+    target.add_argument("--all", action="store_true")
+    parser.add_argument("--enqueue", action="store_true", help="queue jobs for the job runners instead")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        tenant_ids = [args.tenant] if args.tenant else db.scalars(select(models.Tenant.id)).all()
+        if args.enqueue:
+            print(f"✓ Queued {enqueue_mining(db, tenant_ids)} basket_mine job(s)")
+        else:
+            for tid in tenant_ids:
+                mine_tenant(db, tid)
+    finally:
+        db.close()
@@ -0,0 +1,97 @@
+"""
+Compression cost benchmark per route payload.
+
+Builds representative JSON bodies for the heaviest routes and reports, for
+every available encoding, the CPU time to compress them against the bytes
+saved. Use it to pick COMPRESSION_* levels; live per-route numbers are
+available from /api/v1/debug/compression when DEBUG is on.
+
+Usage: python benchmarks/compression.py [--skus 20000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compression
+import fastjson
+
+def product_payload(skus: int) -> bytes:
+    return fastjson.dumps([
+        {
+            "id": i,
+            "name": f"Product {i} Organic Whole Milk 1L",
+            "barcode": f"{8900000000000 + i}",
+            "category_id": i % 40 + 1,
+            "cost_price": round(1 + (i % 500) / 7, 2),
+            "selling_price": round(1.5 + (i % 500) / 5, 2),
+            "stock_quantity": i % 300,
+            "min_stock_level": 5,
+            "tenant_id": 1,
+            "category_name": f"Category {i % 40 + 1}",
+        }
+        for i in range(1, skus + 1)
+    ])
+
+def transactions_payload(count: int = 100, items: int = 6) -> bytes:
+    now = datetime(2024, 1, 1)
+    return fastjson.dumps([
+        {
+            "id": t, "tenant_id": 1, "user_id": 1, "customer_id": t % 50 or None,
+            "subtotal": 42.5, "discount_amount": 0.0, "discount_type": None, "discount_value": None,
+            "total_amount": 42.5, "payment_method": "cash",
+            "created_at": (now + timedelta(minutes=t)).isoformat(),
+            "items": [
+                {"id": t * 10 + i, "product_id": i + 1, "product_name": f"Product {i + 1}",
+                 "quantity": 1 + i % 3, "unit_price": 2.5, "total_price": 2.5 * (1 + i % 3)}
+                for i in range(items)
+            ],
+            "customer_name": None,
+        }
+        for t in range(count)
+    ])
+
+def categories_payload(count: int = 40) -> bytes:
+    return fastjson.dumps([
+        {"id": i, "name": f"Category {i}", "description": "Fresh produce and groceries",
+         "tenant_id": 1, "created_at": "2024-01-01T00:00:00"}
+        for i in range(count)
+    ])
+
+def measure(encoding: str, body: bytes, repeat: int):
+    best = float("inf")
+    out = b""
+    for _ in range(repeat):
+        start = time.process_time()
+        out = compression.compress(encoding, body)
+        best = min(best, time.process_time() - start)
+    return best, len(out)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skus", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    routes = {
+        f"GET /api/v1/products ({args.skus} SKUs)": product_payload(args.skus),
+        "GET /api/v1/transactions (100)": transactions_payload(),
+        "GET /api/v1/categories (40)": categories_payload(),
+    }
+
+    print(f"{'route':<40} {'enc':<5} {'in KiB':>9} {'out KiB':>9} {'ratio':>6} {'CPU ms':>8} {'ms/MB saved':>12}")
+    for route, body in routes.items():
+        for encoding in compression.available_encodings():
+            cpu, size = measure(encoding, body, args.repeat)
+            saved_mb = (len(body) - size) / 1048576
+            per_mb = cpu * 1000 / saved_mb if saved_mb > 0 else float("nan")
+            print(
+                f"{route:<40} {encoding:<5} {len(body) / 1024:9.0f} {size / 1024:9.0f} "
+                f"{size / len(body):6.3f} {cpu * 1000:8.1f} {per_mb:12.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Deterministic synthetic data generator for large-tenant scale testing.
+
+Bulk-loads production-shaped data into the models in models.py:
+- Zipfian product popularity (a few hundred SKUs make most of the sales)
+- weekly and yearly sales seasonality with lunch/evening peaks within a day
+- loyal customers with individual visit frequencies and favourite products
+  they keep re-buying, plus anonymous walk-in sales
+
+The same --seed and --as-of produce the same rows (with the same ids when
+loaded into an empty database); --as-of defaults to today, so pin it for
+repeatable runs. On Postgres, rows are
+streamed with COPY in chunks (a 20k SKU store with a year of sales, ~1M
+sales and several million transaction_items, loads in minutes); other
+databases fall back to executemany.
+
+Usage:
+    python benchmarks/datagen.py --database-url postgresql://localhost/grocery_scale \\
+        --tenants 1 --products 20000 --customers 8000 --days 365 --sales-per-day 3000 --as-of 2025-01-01
+"""
+import argparse
+import csv
+import io
+import math
+import os
+import random
+import sys
+from bisect import bisect
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_PASSWORD = "Datagen#2024"
+
+# Mon..Sun relative traffic
+WEEKDAY_FACTORS = (0.85, 0.8, 0.85, 0.9, 1.1, 1.35, 1.15)
+
+# Relative traffic per opening hour (07:00-22:00): lunch and evening peaks
+HOUR_WEIGHTS = {7: 2, 8: 4, 9: 5, 10: 5, 11: 7, 12: 10, 13: 9, 14: 6, 15: 5, 16: 6, 17: 9, 18: 11, 19: 10, 20: 7, 21: 4}
+
+WORDS = (
+    "Organic", "Fresh", "Whole", "Low Fat", "Family Pack", "Premium", "Classic", "Spicy",
+    "Crunchy", "Natural", "Value", "Farm", "Golden", "Sweet", "Roasted", "Mini",
+)
+ITEMS = (
+    "Milk", "Bread", "Rice", "Eggs", "Butter", "Cheese", "Yogurt", "Apples", "Bananas", "Tomatoes",
+    "Onions", "Potatoes", "Tea", "Coffee", "Sugar", "Flour", "Lentils", "Soap", "Shampoo", "Biscuits",
+    "Chips", "Juice", "Water", "Noodles", "Oil", "Salt", "Spinach", "Chicken", "Paneer", "Detergent",
+)
+SIZES = ("100g", "250g", "500g", "1kg", "2kg", "1L", "500ml", "6pk", "12pk")
+CATEGORIES = (
+    "Dairy", "Bakery", "Produce", "Staples", "Beverages", "Snacks", "Household", "Personal Care",
+    "Frozen", "Meat", "Spices", "Breakfast", "Baby", "Pet", "Canned", "Condiments",
+)
+SURNAMES = ("Smith", "Patel", "Garcia", "Chen", "Khan", "Okafor", "Silva", "Nguyen", "Müller", "Rossi")
+GIVEN = ("Asha", "Ben", "Carlos", "Dana", "Emeka", "Fatima", "Greg", "Hana", "Ivan", "Jia", "Kofi", "Lena")
+
+TRANSACTION_COLUMNS = (
+    "id", "tenant_id", "user_id", "customer_id", "subtotal", "discount_amount",
+    "discount_type", "discount_value", "total_amount", "payment_method", "created_at",
+)
+ITEM_COLUMNS = (
+    "id", "transaction_id", "product_id", "product_name", "quantity", "unit_price", "total_price",
+    "tenant_id", "created_at",
+)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--tenants", type=int, default=1)
+    parser.add_argument("--products", type=int, default=20000, help="per tenant")
+    parser.add_argument("--customers", type=int, default=5000, help="per tenant")
+    parser.add_argument("--days", type=int, default=365, help="days of sales history before --as-of")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                        help="date the history runs up to, YYYY-MM-DD (default: today)")
+    parser.add_argument("--sales-per-day", type=int, default=2000, help="average per tenant")
+    parser.add_argument("--zipf", type=float, default=1.07, help="product popularity exponent")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--email-prefix", default="datagen")
+    parser.add_argument("--chunk-rows", type=int, default=100000, help="item rows per COPY chunk")
+    return parser.parse_args(argv)
+
+# ==========================================
+# BULK LOADING
+# ==========================================
+
+class BulkLoader:
+    """COPY on Postgres, executemany elsewhere; shares the caller's transaction"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.postgres = conn.dialect.name == "postgresql"
+
+    def next_id(self, table: str) -> int:
+        from sqlalchemy import text
+        return self.conn.execute(text(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")).scalar()
+
+    def load(self, table: str, columns, rows):
+        if not rows:
+            return
+        if self.postgres:
+            self._copy(table, columns, rows)
+        else:
+            from sqlalchemy import text
+            placeholders = ", ".join(f":{c}" for c in columns)
+            self.conn.execute(
+                text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"),
+                [dict(zip(columns, row)) for row in rows]
+            )
+
+    def _copy(self, table: str, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # Timestamps are naive UTC, like the rest of the schema
+            writer.writerow([
+                "" if v is None else v.replace(tzinfo=None).isoformat() if isinstance(v, datetime) else v
+                for v in row
+            ])
+        sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        cursor = self.conn.connection.dbapi_connection.cursor()
+        try:
+            if hasattr(cursor, "copy_expert"):  # psycopg2
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+            else:  # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        finally:
+            cursor.close()
+
+    def reset_sequence(self, table: str):
+        if self.postgres:
+            from sqlalchemy import text
+            self.conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            ))
+
+# ==========================================
+# DISTRIBUTIONS
+# ==========================================
+
+def zipf_cum_weights(count: int, exponent: float):
+    return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+def weighted_index(rng: random.Random, cum_weights) -> int:
+    return bisect(cum_weights, rng.random() * cum_weights[-1])
+
+def season_factor(day: datetime) -> float:
+    """Yearly swing: busier around the December holidays, quieter in late summer"""
+    return 1.0 + 0.15 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 355) / 365)
+
+# ==========================================
+# GENERATION
+# ==========================================
+
+def generate_tenant(conn, index: int, args, password_hash: str, log=print):
+    from sqlalchemy import insert
+    import models
+
+    rng = random.Random(args.seed * 7919 + index)
+    loader = BulkLoader(conn)
+    # Naive UTC, like the rest of the schema; history ends at --as-of
+    if args.as_of is not None:
+        now = datetime.combine(args.as_of, datetime.min.time())
+    else:
+        now = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+
+    tenant_id = conn.execute(insert(models.Tenant).values(
+        business_name=f"Scale Grocer {index}", contact_phone="000-000-0000", address=f"{index} Market Street",
+        city="Springfield", state="SP", store_code=f"{args.email_prefix[:4].upper()}{args.seed}-{index}"
+    ).returning(models.Tenant.id)).scalar_one()
+    cashier_ids = [
+        conn.execute(insert(models.User).values(
+            first_name=rng.choice(GIVEN), last_name=rng.choice(SURNAMES),
+            email=f"{args.email_prefix}-{index}@example.com" if c == 0 else f"{args.email_prefix}-{index}-cashier{c}@example.com",
+            hashed_password=password_hash, role="owner" if c == 0 else "cashier",
+            terms_accepted=True, tenant_id=tenant_id, failed_login_attempts=0, is_locked=False
+        ).returning(models.User.id)).scalar_one()
+        for c in range(4)
+    ]
+
+    category_ids = conn.execute(
+        insert(models.Category).returning(models.Category.id, sort_by_parameter_order=True),
+        [{"name": name, "tenant_id": tenant_id} for name in CATEGORIES]
+    ).scalars().all()
+
+    # Products: popularity rank is independent of id, like a real catalog
+    first_product = loader.next_id("products")
+    products = []
+    for p in range(args.products):
+        price = round(min(rng.lognormvariate(1.3, 0.75), 250.0) + 0.19, 2)
+        products.append((
+            first_product + p,
+            f"{rng.choice(WORDS)} {rng.choice(ITEMS)} {rng.choice(SIZES)} #{p}",
+            f"{(890000000000 + tenant_id * 10000000 + p):013d}",
+            rng.choice(category_ids),
+            round(price * rng.uniform(0.55, 0.85), 2),
+            price,
+            rng.randint(0, 400),
+            rng.choice((5, 10, 20)),
+            tenant_id,
+            True,
+        ))
+    loader.load("products", (
+        "id", "name", "barcode", "category_id", "cost_price", "selling_price",
+        "stock_quantity", "min_stock_level", "tenant_id", "is_active",
+    ), products)
+    loader.reset_sequence("products")
+    popularity = list(range(len(products)))
+    rng.shuffle(popularity)
+    product_cum = zipf_cum_weights(len(products), args.zipf)
+
+    # Customers: visit frequency is heavy-tailed; each has favourites they re-buy
+    first_customer = loader.next_id("customers")
+    customers = []
+    for c in range(args.customers):
+        customers.append((
+            first_customer + c,
+            f"{rng.choice(GIVEN)} {rng.choice(SURNAMES)}",
+            f"customer{c}.t{tenant_id}@example.com",
+            f"+1555{tenant_id % 100:02d}{c:06d}",
+            tenant_id, 0, 0.0,
+            now - timedelta(days=args.days + rng.randrange(365)),
+        ))
+    loader.load("customers", (
+        "id", "name", "email", "phone", "tenant_id", "loyalty_points", "total_purchases", "created_at",
+    ), customers)
+    loader.reset_sequence("customers")
+    customer_cum = list(accumulate(rng.lognormvariate(0, 1.2) for _ in customers))
+    favourites = [
+        [popularity[weighted_index(rng, product_cum)] for _ in range(rng.randint(3, 12))]
+        for _ in customers
+    ]
+    customer_stats = {}
+
+    hours = list(HOUR_WEIGHTS)
+    hour_cum = list(accumulate(HOUR_WEIGHTS.values()))
+    next_txn = loader.next_id("transactions")
+    next_item = loader.next_id("transaction_items")
+    txn_rows, item_rows = [], []
+    total_sales = total_items = 0
+
+    def flush():
+        nonlocal txn_rows, item_rows
+        loader.load("transactions", TRANSACTION_COLUMNS, txn_rows)
+        loader.load("transaction_items", ITEM_COLUMNS, item_rows)
+        txn_rows, item_rows = [], []
+
+    start_day = (now - timedelta(days=args.days)).replace(hour=0)
+    if conn.dialect.name == "postgresql":
+        import partitions
+        # Without monthly partitions the history would all land in DEFAULT
+        if partitions.is_partitioned(conn, "transactions"):
+            partitions.ensure_partitions(conn, since=start_day.date())
+    for d in range(args.days):
+        day = start_day + timedelta(days=d)
+        expected = args.sales_per_day * WEEKDAY_FACTORS[day.weekday()] * season_factor(day)
+        for _ in range(max(0, int(rng.gauss(expected, expected * 0.08)))):
+            created_at = day + timedelta(
+                hours=hours[weighted_index(rng, hour_cum)], seconds=rng.randrange(3600)
+            )
+            customer = weighted_index(rng, customer_cum) if rng.random() < 0.35 else None
+
+            # Basket: mostly small, long tail of weekly shops
+            lines = {}
+            for _ in range(min(60, 1 + int(rng.expovariate(1 / 5)))):
+                if customer is not None and rng.random() < 0.45:
+                    product = rng.choice(favourites[customer])
+                else:
+                    product = popularity[weighted_index(rng, product_cum)]
+                lines[product] = lines.get(product, 0) + (1 if rng.random() < 0.75 else rng.randint(2, 4))
+
+            subtotal = 0.0
+            for product, quantity in lines.items():
+                row = products[product]
+                line_total = round(row[5] * quantity, 2)
+                subtotal += line_total
+                item_rows.append((
+                    next_item, next_txn, row[0], row[1], quantity, row[5], line_total, tenant_id, created_at,
+                ))
+                next_item += 1
+            subtotal = round(subtotal, 2)
+
+            discount_type = discount_value = None
+            discount_amount = 0.0
+            if rng.random() < 0.04:
+                discount_type, discount_value = "percentage", float(rng.choice((5, 10, 15)))
+                discount_amount = round(subtotal * discount_value / 100, 2)
+            total = round(subtotal - discount_amount, 2)
+
+            txn_rows.append((
+                next_txn, tenant_id, rng.choice(cashier_ids),
+                customers[customer][0] if customer is not None else None,
+                subtotal, discount_amount, discount_type, discount_value, total,
+                rng.choices(("cash", "card", "upi"), (45, 35, 20))[0], created_at,
+            ))
+            next_txn += 1
+            total_sales += 1
+            total_items += len(lines)
+
+            if customer is not None:
+                stats = customer_stats.setdefault(customer, [0.0, 0, None])
+                stats[0] += total
+                stats[1] += int(total)
+                stats[2] = created_at
+
+            if len(item_rows) >= args.chunk_rows:
+                flush()
+    flush()
+    loader.reset_sequence("transactions")
+    loader.reset_sequence("transaction_items")
+
+    # Keep customer aggregates consistent with the generated history
+    if customer_stats:
+        from sqlalchemy import text
+        conn.execute(text("""
+            UPDATE customers SET total_purchases = :total, loyalty_points = :points, last_purchase_date = :last
+            WHERE id = :id
+        """), [
+            {"id": customers[c][0], "total": round(s[0], 2), "points": s[1], "last": s[2]}
+            for c, s in customer_stats.items()
+        ])
+
+    log(f"Tenant {index} (id {tenant_id}): {len(products)} products, {len(customers)} customers, "
+        f"{total_sales} sales, {total_items} line items")
+    return tenant_id
+
+def generate(database_url: str = None, argv=None, log=print, **overrides):
+    """
+    Generate tenants into the database. Callable from other tools:
+        generate(tenants=2, products=2000, days=90, sales_per_day=150, email_prefix="loadtest")
+    """
+    args = parse_args(argv if argv is not None else ["--database-url", database_url or os.environ["DATABASE_URL"]])
+    for key, value in overrides.items():
+        setattr(args, key, value)
+    os.environ["DATABASE_URL"] = args.database_url
+
+    import database
+    import utils
+    from migrate_database import migrate_database
+
+    migrate_database()
+    password_hash = utils.get_password_hash(DEFAULT_PASSWORD)
+    tenant_ids = []
+    for index in range(args.tenants):
+        # One transaction per tenant keeps COPY chunks and FK checks together
+        with database.engine.begin() as conn:
+            tenant_ids.append(generate_tenant(conn, index, args, password_hash, log=log))
+    return tenant_ids
+
+if __name__ == "__main__":
+    import time
+
+    started = time.perf_counter()
+    cli_args = parse_args()
+    generate(argv=sys.argv[1:])
+    print(f"Done in {time.perf_counter() - started:.1f}s (seed {cli_args.seed})")
@@ -0,0 +1,286 @@
+"""
+Load test and benchmark suite for the POS API.
+
+Seeds realistic tenants (categories, products, customers and months of
+sales, generated by datagen.py) into a local SQLite or Postgres database,
+then drives the real FastAPI app - in-process through ASGI, or a running
+server with --url - at a configurable concurrency. Reports throughput and latency percentiles per
+scenario and can diff them against a stored baseline. Latencies only count
+successful calls; if any call fails the run exits 1 without saving or
+comparing, since the numbers would not measure the real work.
+
+Scenarios:
+    scan       GET  /api/v1/products/by-barcode/{barcode}
+    checkout   POST /api/v1/transactions/create (basket of 1-40 lines)
+    products   GET  /api/v1/products
+    customers  GET  /api/v1/customers?search=...
+    dashboard  GET  /api/v1/analytics/dashboard + /api/v1/analytics/sales
+
+Usage:
+    python benchmarks/loadtest.py --database-url sqlite:///loadtest.db \\
+        --concurrency 16 --duration 20 --save baseline.json
+    python benchmarks/loadtest.py --compare baseline.json --fail-on-regression 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SCENARIOS = ("scan", "checkout", "products", "customers", "dashboard")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///loadtest.db")
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--tenants", type=int, default=2)
+    parser.add_argument("--products", type=int, default=2000, help="per tenant")
+    parser.add_argument("--customers", type=int, default=500, help="per tenant")
+    parser.add_argument("--days", type=int, default=90, help="days of sales history")
+    parser.add_argument("--sales-per-day", type=int, default=150, help="per tenant")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reseed", action="store_true", help="seed even if loadtest tenants exist")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to diff against")
+    parser.add_argument("--fail-on-regression", type=float, metavar="PCT",
+                        help="exit 1 if p90 latency or throughput regress by more than PCT%%")
+    return parser.parse_args()
+
+# ==========================================
+# SEEDING
+# ==========================================
+
+def tenant_email(index: int) -> str:
+    return f"loadtest-{index}@example.com"
+
+def seed(args):
+    """Bulk-load tenants with catalog, customers and sales history (see datagen.py)"""
+    import datagen
+
+    datagen.generate(
+        args.database_url,
+        tenants=args.tenants,
+        products=args.products,
+        customers=args.customers,
+        days=args.days,
+        sales_per_day=args.sales_per_day,
+        seed=args.seed,
+        email_prefix="loadtest",
+    )
+
+def load_contexts(args):
+    """Per-tenant data the scenarios pick from"""
+    import database
+    import models
+
+    db = database.SessionLocal()
+    try:
+        contexts = []
+        for t in range(args.tenants):
+            user = db.query(models.User).filter(models.User.email == tenant_email(t)).first()
+            if user is None:
+                break
+            products = db.query(models.Product.id, models.Product.name, models.Product.barcode).filter(
+                models.Product.tenant_id == user.tenant_id
+            ).all()
+            # Scans and checkouts must not run out of stock mid-benchmark
+            db.query(models.Product).filter(models.Product.tenant_id == user.tenant_id).update(
+                {models.Product.stock_quantity: 1000000}, synchronize_session=False
+            )
+            db.commit()
+            customers = db.query(models.Customer.id, models.Customer.name).filter(
+                models.Customer.tenant_id == user.tenant_id
+            ).all()
+            contexts.append({
+                "email": user.email,
+                "products": [tuple(p) for p in products],
+                "customers": [tuple(c) for c in customers],
+            })
+        return contexts
+    finally:
+        db.close()
+
+# ==========================================
+# SCENARIOS
+# ==========================================
+
+async def scan(client, ctx, rng):
+    _, _, barcode = rng.choice(ctx["products"])
+    return [await client.get(f"/api/v1/products/by-barcode/{barcode}", headers=ctx["headers"])]
+
+async def checkout(client, ctx, rng):
+    # Mostly small baskets with a long tail of big weekly shops
+    size = min(40, max(1, int(rng.expovariate(1 / 6))))
+    lines = rng.sample(ctx["products"], size)
+    payload = {
+        "items": [
+            {"product_id": pid, "product_name": name, "quantity": rng.randint(1, 3), "unit_price": 0}
+            for pid, name, _ in lines
+        ],
+        "payment_method": rng.choice(["cash", "card", "upi"]),
+        "customer_id": rng.choice(ctx["customers"])[0] if rng.random() < 0.3 else None,
+    }
+    return [await client.post("/api/v1/transactions/create", json=payload, headers=ctx["headers"])]
+
+async def products(client, ctx, rng):
+    return [await client.get("/api/v1/products", headers=ctx["headers"])]
+
+async def customers(client, ctx, rng):
+    _, name = rng.choice(ctx["customers"])
+    term = name.split()[rng.randrange(2)][:4]
+    return [await client.get("/api/v1/customers", params={"search": term}, headers=ctx["headers"])]
+
+async def dashboard(client, ctx, rng):
+    return [
+        await client.get("/api/v1/analytics/dashboard", headers=ctx["headers"]),
+        await client.get("/api/v1/analytics/sales", params={"days": 30}, headers=ctx["headers"]),
+    ]
+
+# ==========================================
+# DRIVER
+# ==========================================
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def run_scenario(client, contexts, name, args):
+    scenario = globals()[name]
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(worker_id):
+        nonlocal errors
+        rng = random.Random(args.seed * 1000 + worker_id)
+        ctx = contexts[worker_id % len(contexts)]
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            responses = await scenario(client, ctx, rng)
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for r in responses if r.status_code >= 400)
+            # A fast 4xx/5xx would flatter the percentiles
+            if failed:
+                errors += failed
+            else:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+async def drive(args, contexts):
+    import httpx
+    import datagen
+
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        import main
+        transport = httpx.ASGITransport(app=main.app)
+        base_url = "http://loadtest"
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+        for ctx in contexts:
+            response = await client.post("/api/v1/auth/login", json={"email": ctx["email"], "password": datagen.DEFAULT_PASSWORD})
+            response.raise_for_status()
+            ctx["headers"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        results = {}
+        for name in args.scenarios.split(","):
+            name = name.strip()
+            if name not in SCENARIOS:
+                raise SystemExit(f"Unknown scenario: {name}")
+            print(f"Running {name} for {args.duration:.0f}s at concurrency {args.concurrency}...")
+            results[name] = await run_scenario(client, contexts, name, args)
+        return results
+
+def report(results, baseline=None):
+    print(f"\n{'scenario':<10} {'reqs':>7} {'err':>5} {'rps':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    regressions = {}
+    for name, r in results.items():
+        print(f"{name:<10} {r['requests']:>7} {r['errors']:>5} {r['throughput_rps']:>9.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p90_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+        base = (baseline or {}).get(name)
+        if base:
+            rps_change = (r["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] * 100
+            p90_change = (r["p90_ms"] - base["p90_ms"]) / base["p90_ms"] * 100 if base["p90_ms"] else 0.0
+            p99_change = (r["p99_ms"] - base["p99_ms"]) / base["p99_ms"] * 100 if base["p99_ms"] else 0.0
+            print(f"{'':<10} vs baseline: rps {rps_change:+.1f}%  p90 {p90_change:+.1f}%  p99 {p99_change:+.1f}%")
+            regressions[name] = max(-rps_change, p90_change)
+    return regressions
+
+def main():
+    args = parse_args()
+    # Must be set before any app module creates the engine
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("QUERY_BUDGET_MODE", "off")
+    # One tenant per context drives far more traffic than the per-tenant limits allow
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.chdir(BACKEND_DIR)
+
+    if not args.url:
+        from migrate_database import migrate_database
+        migrate_database()
+
+    contexts = [] if args.reseed else load_contexts(args)
+    if not contexts:
+        seed(args)
+        contexts = load_contexts(args)
+
+    results = asyncio.run(drive(args, contexts))
+
+    failed = {name: r["errors"] for name, r in results.items() if r["errors"]}
+    if failed:
+        report(results)
+        print(f"\nRequests failed: {failed} - not saving or comparing results")
+        sys.exit(1)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    regressions = report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "config": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+                "results": results,
+            }, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.fail_on_regression is not None:
+        worst = {name: pct for name, pct in regressions.items() if pct > args.fail_on_regression}
+        if worst:
+            print(f"\nRegressions above {args.fail_on_regression}%: {worst}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
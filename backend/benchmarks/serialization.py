@@ -0,0 +1,96 @@
+"""
+Serialization benchmark for the product list endpoints.
+
+Compares the CPU spent turning 10k product rows into a JSON body:
+  pydantic  - dict per row, validated against List[ProductResponse],
+              jsonable_encoder + stdlib json (the previous response path)
+  orjson    - Row tuples encoded straight to bytes (fastjson.rows_to_json)
+
+Usage: python benchmarks/serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, text
+
+import fastjson
+import schemas
+
+def build_rows(count: int):
+    """Real SQLAlchemy Row objects from an in-memory SQLite table"""
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE products (
+                id INTEGER PRIMARY KEY, name VARCHAR, barcode VARCHAR, category_id INTEGER,
+                cost_price FLOAT, selling_price FLOAT, stock_quantity INTEGER,
+                min_stock_level INTEGER, tenant_id INTEGER, category_name VARCHAR
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO products VALUES (:id, :name, :barcode, :category_id, :cost_price,
+                :selling_price, :stock_quantity, :min_stock_level, :tenant_id, :category_name)
+        """), [
+            {
+                "id": i,
+                "name": f"Product {i} Organic Whole Milk 1L",
+                "barcode": f"{8900000000000 + i}",
+                "category_id": i % 40 + 1,
+                "cost_price": round(1 + (i % 500) / 7, 2),
+                "selling_price": round(1.5 + (i % 500) / 5, 2),
+                "stock_quantity": i % 300,
+                "min_stock_level": 5,
+                "tenant_id": 1,
+                "category_name": f"Category {i % 40 + 1}",
+            }
+            for i in range(1, count + 1)
+        ])
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT * FROM products ORDER BY id")).all()
+
+def pydantic_path(rows, adapter):
+    dicts = [dict(row._mapping) for row in rows]
+    validated = adapter.validate_python(dicts)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+def orjson_path(rows, adapter=None):
+    return fastjson.rows_to_json(rows)
+
+def measure(func, rows, adapter, repeat: int):
+    best_cpu = float("inf")
+    body = b""
+    for _ in range(repeat):
+        start = time.process_time()
+        body = func(rows, adapter)
+        best_cpu = min(best_cpu, time.process_time() - start)
+    return best_cpu, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = build_rows(args.rows)
+    adapter = TypeAdapter(List[schemas.ProductResponse])
+    per_10k = 10000 / args.rows
+
+    print(f"Serializing {args.rows} product rows (best of {args.repeat}, CPU time)\n")
+    results = {}
+    for name, func in (("pydantic", pydantic_path), ("orjson", orjson_path)):
+        cpu, size = measure(func, rows, adapter, args.repeat)
+        results[name] = cpu
+        print(f"{name:<10} {cpu * 1000 * per_10k:8.1f} ms CPU per 10k products   {size / 1024:8.0f} KiB")
+
+    print(f"\nSpeedup: {results['pydantic'] / results['orjson']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Startup benchmark: import-to-ready time of the API.
+
+Each run starts a fresh interpreter, imports main and drives the lifespan
+startup (schema version check) through TestClient, then reports the import
+and startup phases separately. Results can be saved and compared so that
+regressions in cold-start time show up in review.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--save baseline.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    client.get("/")
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "total": t2 - t0}))
+"""
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save", help="write the medians to this JSON file")
+    parser.add_argument("--compare", help="compare against medians stored in this JSON file")
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    medians = {phase: statistics.median(s[phase] for s in samples) for phase in ("import", "startup", "total")}
+
+    print(f"Import-to-ready over {args.runs} cold starts (median):")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    for phase, value in medians.items():
+        line = f"  {phase:<8} {value * 1000:8.1f} ms"
+        if baseline and phase in baseline:
+            change = (value - baseline[phase]) / baseline[phase] * 100
+            line += f"   ({change:+.1f}% vs baseline)"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(medians, f, indent=2)
+        print(f"\nSaved to {args.save}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+HTTP conditional GET support (ETag / If-None-Match).
+
+Catalog and category responses are tagged with a per-tenant data version
+stored on the tenant row. The version is bumped in the same DB transaction
+as any write that changes those responses, so a matching If-None-Match can
+be answered with a bodyless 304 before the list query or serialization runs.
+Receipts are tagged after their (tenant-scoped) lookup, with a digest of the
+profile fields they render.
+"""
+import hashlib
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+import models
+
+# Clients must revalidate every time, but may keep the body around
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    """Build a strong ETag from identifying parts"""
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+def params_digest(*values) -> str:
+    """Short stable digest of query parameters that shape a response"""
+    raw = "|".join("" if v is None else str(v) for v in values)
+    return hashlib.blake2s(raw.encode(), digest_size=6).hexdigest()
+
+def product_etag(tenant: models.Tenant, *params) -> str:
+    return make_etag("p", tenant.id, tenant.product_version, params_digest(*params))
+
+def category_etag(tenant: models.Tenant) -> str:
+    return make_etag("c", tenant.id, tenant.category_version)
+
+def receipt_etag(transaction: models.Transaction, tenant: models.Tenant, user: models.User) -> str:
+    # Transactions are immutable, but the store profile, the customer's name
+    # and the viewer's name (the cashier line) are rendered as they are now
+    customer = transaction.customer
+    return make_etag("r", tenant.id, transaction.id, user.id, params_digest(
+        tenant.business_name, tenant.address, tenant.city, tenant.state, tenant.contact_phone,
+        customer.name if customer else None, user.first_name, user.last_name,
+    ))
+
+def _request_etags(request: Request):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return []
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        # If-None-Match uses weak comparison
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tags.append(tag)
+    return tags
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    tags = _request_etags(request)
+    return "*" in tags or etag in tags
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Authorization"}
+
+def not_modified(etag: str) -> Response:
+    """Bodyless 304 - returning a Response skips response_model validation"""
+    return Response(status_code=304, headers=etag_headers(etag))
+
+def set_etag(response: Response, etag: str):
+    response.headers.update(etag_headers(etag))
+
+def bump_versions(db: Session, tenant_id: int, products: bool = False, categories: bool = False,
+                  pricing: bool = False):
+    """
+    Invalidate cached catalog responses (and, with pricing=True, the compiled
+    pricing rules of promotions.py) for a tenant.
+    Must be called before the commit of the write it describes.
+    """
+    values = {}
+    if products:
+        values[models.Tenant.product_version] = models.Tenant.product_version + 1
+    if categories:
+        values[models.Tenant.category_version] = models.Tenant.category_version + 1
+    if pricing:
+        values[models.Tenant.pricing_version] = models.Tenant.pricing_version + 1
+    if values:
+        db.query(models.Tenant).filter(models.Tenant.id == tenant_id).update(
+            values, synchronize_session=False
+        )
@@ -0,0 +1,348 @@
+"""
+Negotiated response compression (brotli, zstd, gzip).
+
+- Bodies smaller than COMPRESSION_MIN_SIZE are sent as-is.
+- Responses carrying an ETag (catalog, categories, receipts) are cached
+  compressed, keyed by ETag and encoding, so an unchanged catalog is only
+  compressed once per version.
+- Streaming responses (exports) are compressed chunk by chunk with a sync
+  flush, so clients receive data as it is produced.
+- Per-route CPU time and bytes saved are accumulated for tuning and exposed
+  through stats().
+
+The ETag of a compressed representation gets an encoding suffix
+("...-br"), which is stripped again from If-None-Match before the request
+reaches the routes, so the conditional GET logic in caching.py is unaware of
+compression.
+"""
+import gzip
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+
+from settings import settings
+
+try:
+    import brotli
+except ImportError:  # optional - falls back to gzip
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+# Bodies above this size are compressed off the event loop
+THREADPOOL_THRESHOLD = 256 * 1024
+
+ETAG_SUFFIXES = {"br": "-br", "zstd": "-zstd", "gzip": "-gzip"}
+
+def available_encodings():
+    """Supported encodings in server preference order"""
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    encodings.append("gzip")
+    return encodings
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick the best encoding the client accepts (honours q=0)"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(encoding: str, data: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compress(data)
+    # mtime=0 keeps output deterministic for identical bodies
+    return gzip.compress(data, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+class _StreamCompressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(
+                level=settings.COMPRESSION_ZSTD_LEVEL
+            ).compressobj()
+        else:
+            self._compressor = zlib.compressobj(
+                settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        if self.encoding == "zstd":
+            return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+# ==========================================
+# COMPRESSED BODY CACHE & STATS
+# ==========================================
+
+class _BodyCache:
+    """Byte-bounded LRU of compressed bodies keyed by (path, etag, encoding)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+            return body
+
+    def put(self, key, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._items[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+_cache = _BodyCache(settings.COMPRESSION_CACHE_MB * 1024 * 1024)
+_stats = {}
+_stats_lock = threading.Lock()
+
+def _record(route: str, encoding: str, bytes_in: int, bytes_out: int, cpu: float, cache_hit: bool = False):
+    with _stats_lock:
+        entry = _stats.setdefault((route, encoding), {
+            "responses": 0, "cache_hits": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0
+        })
+        entry["responses"] += 1
+        entry["cache_hits"] += int(cache_hit)
+        entry["bytes_in"] += bytes_in
+        entry["bytes_out"] += bytes_out
+        entry["cpu_seconds"] += cpu
+
+def stats():
+    """Per route/encoding totals: CPU spent vs. bytes saved"""
+    with _stats_lock:
+        result = []
+        for (route, encoding), entry in sorted(_stats.items()):
+            saved = entry["bytes_in"] - entry["bytes_out"]
+            result.append({
+                "route": route,
+                "encoding": encoding,
+                **entry,
+                "bytes_saved": saved,
+                "ratio": round(entry["bytes_out"] / entry["bytes_in"], 3) if entry["bytes_in"] else None,
+                "cpu_ms_per_mb_saved": round(entry["cpu_seconds"] * 1000 / (saved / 1048576), 2) if saved > 0 else None,
+            })
+        return result
+
+def _timed_compress(encoding: str, body: bytes):
+    start = time.thread_time()
+    compressed = compress(encoding, body)
+    return compressed, time.thread_time() - start
+
+# ==========================================
+# MIDDLEWARE
+# ==========================================
+
+def _strip_etag_suffix(tag: str):
+    for encoding, suffix in ETAG_SUFFIXES.items():
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"', encoding
+    return tag, None
+
+def _suffix_etag(etag: str, encoding: str) -> str:
+    if etag.endswith('"'):
+        return etag[:-1] + ETAG_SUFFIXES[encoding] + '"'
+    return etag
+
+class CompressionMiddleware:
+    """Pure ASGI middleware; see module docstring for behaviour"""
+
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        conditional = False
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = []
+            for tag in if_none_match.split(","):
+                stripped, suffix_encoding = _strip_etag_suffix(tag.strip())
+                conditional = conditional or suffix_encoding is not None
+                tags.append(stripped)
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, v) for k, v in scope["headers"] if k != b"if-none-match"
+            ] + [(b"if-none-match", ", ".join(tags).encode("latin-1"))]
+
+        responder = _Responder(self, scope, encoding, conditional, send)
+        await self.app(scope, receive, responder.send)
+
+class _Responder:
+    def __init__(self, middleware: CompressionMiddleware, scope, encoding: str, conditional: bool, send):
+        self.middleware = middleware
+        self.scope = scope
+        self.encoding = encoding
+        self.conditional = conditional
+        self._send = send
+        self.start_message = None
+        self.stream: Optional[_StreamCompressor] = None
+        self.passthrough = False
+        self.buffer = []
+        self.buffered = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope["path"]
+
+    def _compressible(self, headers: Headers) -> bool:
+        if self.start_message["status"] < 200 or self.start_message["status"] >= 300:
+            return False
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            message["headers"] = list(message.get("headers", []))
+            self.start_message = message
+            if message["status"] == 304 and self.conditional:
+                headers = MutableHeaders(raw=message["headers"])
+                if "etag" in headers:
+                    headers["etag"] = _suffix_etag(headers["etag"], self.encoding)
+                headers.add_vary_header("Accept-Encoding")
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        if self.passthrough:
+            await self._send(message)
+            return
+
+        if self.stream is not None:
+            await self._send_stream_chunk(message)
+            return
+
+        # Buffer until the body is complete or it is clearly a stream. Bodies
+        # re-chunked by BaseHTTPMiddleware arrive as one chunk plus an empty
+        # final message, so they still take the whole-body (cacheable) path.
+        self.buffer.append(message.get("body", b""))
+        self.buffered += len(self.buffer[-1])
+        more_body = message.get("more_body", False)
+        if more_body and (len(self.buffer) < 2 or self.buffered < self.middleware.minimum_size):
+            return
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        body = b"".join(self.buffer)
+        self.buffer = []
+
+        if not self._compressible(headers) or (not more_body and len(body) < self.middleware.minimum_size):
+            self.passthrough = True
+            await self._send(self.start_message)
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+
+        if more_body:
+            # Streaming response (exports): compress incrementally
+            del headers["content-length"]
+            self.stream = _StreamCompressor(self.encoding)
+            await self._send(self.start_message)
+            await self._send_stream_chunk({"body": body, "more_body": True})
+            return
+
+        etag = headers.get("etag")
+        cache_key = (self.scope["path"], etag, self.encoding) if etag else None
+        compressed = _cache.get(cache_key) if cache_key else None
+        if compressed is not None:
+            _record(self.route, self.encoding, len(body), len(compressed), 0.0, cache_hit=True)
+        else:
+            if len(body) >= THREADPOOL_THRESHOLD:
+                compressed, cpu = await anyio.to_thread.run_sync(_timed_compress, self.encoding, body)
+            else:
+                compressed, cpu = _timed_compress(self.encoding, body)
+            if cache_key:
+                _cache.put(cache_key, compressed)
+            _record(self.route, self.encoding, len(body), len(compressed), cpu)
+
+        if etag:
+            headers["etag"] = _suffix_etag(etag, self.encoding)
+        headers["content-length"] = str(len(compressed))
+        await self._send(self.start_message)
+        await self._send({"type": "http.response.body", "body": compressed})
+
+    async def _send_stream_chunk(self, message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        start = time.thread_time()
+        data = self.stream.chunk(body) if body else b""
+        if not more_body:
+            data += self.stream.finish()
+        self.cpu += time.thread_time() - start
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        if not more_body:
+            _record(self.route, self.encoding, self.bytes_in, self.bytes_out, self.cpu)
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -0,0 +1,268 @@
+"""
+Customer purchase stats (total_purchases, loyalty_points, last_purchase_date)
+maintained through an outbox instead of inline writes.
+
+Checkout only inserts a customer_stat_deltas row in the sale's own
+transaction, so frequent shoppers' customers rows stop being a write hot
+spot shared by every lane. A background Flusher (one per API worker, started
+from the app lifespan) claims pending deltas with SKIP LOCKED, sums them per
+customer and applies them in one batched UPDATE, in customer id order so
+concurrent flushers never deadlock.
+
+Reads that return customers go through merge_pending(), so stats include
+sales that have not been flushed yet.
+
+Usage:
+    python customer_stats.py flush                 # apply all pending deltas now
+    python customer_stats.py recompute [--tenant N]  # rebuild stats from sales history
+"""
+import argparse
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Integer, bindparam, case, cast, delete, func, select, update
+
+import archive
+import models
+import money
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+def loyalty_points_for(total_cents: int) -> int:
+    # 1 point per whole currency unit spent
+    return money.whole_units(total_cents)
+
+def refund_points(sale_cents: int, refunded_before: int, refund_cents: int) -> int:
+    """
+    Points a refund takes back (negative). Points are truncated on what is
+    left of the sale, not per refund, so refunding 10.00 as 5.50 + 4.50
+    takes back all 10 points.
+    """
+    return (loyalty_points_for(sale_cents - refunded_before - refund_cents)
+            - loyalty_points_for(sale_cents - refunded_before))
+
+def record_sale(db, customer_id: int, total_cents: int, purchased_at: datetime, points: Optional[int] = None):
+    """
+    Queue the stat change for a sale; commits with the caller's transaction.
+    Refunds (negative totals) pass their points from refund_points().
+    """
+    db.add(models.CustomerStatDelta(
+        customer_id=customer_id,
+        amount=money.from_cents(total_cents),
+        loyalty_points=loyalty_points_for(total_cents) if points is None else points,
+        purchased_at=purchased_at,
+    ))
+
+# ==========================================
+# BATCHED FLUSH
+# ==========================================
+
+_customers = models.Customer.__table__
+_deltas = models.CustomerStatDelta.__table__
+
+_apply_stmt = (
+    update(_customers)
+    .where(_customers.c.id == bindparam("customer_id"))
+    .values(
+        total_purchases=func.coalesce(_customers.c.total_purchases, 0) + bindparam("amount"),
+        loyalty_points=func.coalesce(_customers.c.loyalty_points, 0) + bindparam("points"),
+        last_purchase_date=case(
+            (_customers.c.last_purchase_date.is_(None), bindparam("last")),
+            (_customers.c.last_purchase_date < bindparam("last"), bindparam("last")),
+            else_=_customers.c.last_purchase_date,
+        ),
+    )
+)
+
+def _sum_deltas(rows):
+    """{customer_id: [cents, points, last_purchase]} from delta rows"""
+    totals = {}
+    for customer_id, amount, points, purchased_at in rows:
+        entry = totals.setdefault(customer_id, [0, 0, purchased_at])
+        entry[0] += money.to_cents(amount)
+        entry[1] += points
+        entry[2] = max(entry[2], purchased_at)
+    return totals
+
+def flush_batch(engine, batch_size: int = None) -> int:
+    """Apply up to batch_size pending deltas; returns how many were applied"""
+    batch_size = batch_size or settings.CUSTOMER_STATS_BATCH_SIZE
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(_deltas.c.id, _deltas.c.customer_id, _deltas.c.amount,
+                   _deltas.c.loyalty_points, _deltas.c.purchased_at)
+            .order_by(_deltas.c.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return 0
+        totals = _sum_deltas(row[1:] for row in rows)
+        conn.execute(_apply_stmt, [
+            {"customer_id": customer_id, "amount": money.from_cents(cents), "points": points, "last": last}
+            for customer_id, (cents, points, last) in sorted(totals.items())
+        ])
+        conn.execute(delete(_deltas).where(_deltas.c.id.in_([row[0] for row in rows])))
+    return len(rows)
+
+def flush_pending(engine) -> int:
+    """Drain the outbox"""
+    applied = 0
+    while True:
+        count = flush_batch(engine)
+        applied += count
+        if count < settings.CUSTOMER_STATS_BATCH_SIZE:
+            return applied
+
+class Flusher:
+    """Background thread that flushes pending deltas every interval"""
+
+    def __init__(self, engine, interval: float = None):
+        self.engine = engine
+        self.interval = settings.CUSTOMER_STATS_FLUSH_SECONDS if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="customer-stats-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and flush what is left"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._flush()
+
+    def _flush(self):
+        try:
+            flush_pending(self.engine)
+        except Exception:
+            # Deltas stay queued and are retried on the next tick
+            logger.exception("Customer stats flush failed")
+
+# ==========================================
+# READ PATH
+# ==========================================
+
+def pending_totals(db, customer_ids):
+    """{customer_id: [cents, points, last_purchase]} of unflushed deltas"""
+    rows = db.execute(
+        select(_deltas.c.customer_id, _deltas.c.amount, _deltas.c.loyalty_points, _deltas.c.purchased_at)
+        .where(_deltas.c.customer_id.in_(customer_ids))
+    ).all()
+    return _sum_deltas(rows)
+
+def merge_pending(db, customers):
+    """
+    Add unflushed deltas to customers about to be returned. Affected objects
+    are detached from the session first, so the merged values are never
+    written back.
+    """
+    by_id = {customer.id: customer for customer in customers}
+    if not by_id:
+        return customers
+    for customer_id, (cents, points, last) in pending_totals(db, list(by_id)).items():
+        customer = by_id[customer_id]
+        db.expunge(customer)
+        customer.total_purchases = money.from_cents(money.to_cents(customer.total_purchases) + cents)
+        customer.loyalty_points = (customer.loyalty_points or 0) + points
+        if customer.last_purchase_date is None or customer.last_purchase_date < last:
+            customer.last_purchase_date = last
+    return customers
+
+# ==========================================
+# RECOMPUTE FROM HISTORY
+# ==========================================
+
+def recompute(engine, tenant_id: int = None, log=print):
+    """
+    Rebuild every customer's stats from sales history (live tables plus the
+    Parquet archive) and drop their pending deltas, one tenant per
+    transaction. On PostgreSQL the transaction is REPEATABLE READ, so sales
+    committed meanwhile keep their deltas.
+    """
+    txn = models.Transaction.__table__
+    with engine.connect() as conn:
+        query = select(models.Tenant.__table__.c.id)
+        if tenant_id is not None:
+            query = query.where(models.Tenant.__table__.c.id == tenant_id)
+        tenant_ids = conn.scalars(query).all()
+
+    isolation = "REPEATABLE READ" if engine.dialect.name == "postgresql" else None
+    for tid in tenant_ids:
+        with engine.connect() as conn:
+            if isolation:
+                conn = conn.execution_options(isolation_level=isolation)
+            with conn.begin():
+                # Net cents per sale (its refunds included), live and archived:
+                # points are earned on what is left of each sale
+                sales = archive.customer_sales(conn, tid)
+                sale_id = func.coalesce(txn.c.refund_of, txn.c.id)
+                for customer_id, sid, cents, last in conn.execute(
+                    select(
+                        txn.c.customer_id,
+                        sale_id,
+                        func.sum(cast(func.round(txn.c.total_amount * 100), Integer)),
+                        func.max(txn.c.created_at),
+                    )
+                    .where(txn.c.tenant_id == tid, txn.c.customer_id.is_not(None))
+                    .group_by(txn.c.customer_id, sale_id)
+                ):
+                    entry = sales.setdefault((customer_id, sid), [0, archive.naive_utc(last)])
+                    entry[0] += int(cents)
+                    entry[1] = max(entry[1], archive.naive_utc(last))
+                history = {}
+                for (customer_id, _), (cents, last) in sales.items():
+                    entry = history.setdefault(customer_id, [0, 0, last])
+                    entry[0] += cents
+                    entry[1] += loyalty_points_for(cents)
+                    entry[2] = max(entry[2], last)
+
+                customer_ids = conn.scalars(
+                    select(_customers.c.id).where(_customers.c.tenant_id == tid).order_by(_customers.c.id)
+                ).all()
+                if not customer_ids:
+                    continue
+                conn.execute(delete(_deltas).where(_deltas.c.customer_id.in_(customer_ids)))
+                conn.execute(
+                    update(_customers).where(_customers.c.id == bindparam("customer_id")).values(
+                        total_purchases=bindparam("amount"),
+                        loyalty_points=bindparam("points"),
+                        last_purchase_date=bindparam("last"),
+                    ),
+                    [
+                        {
+                            "customer_id": customer_id,
+                            "amount": money.from_cents(history.get(customer_id, (0,))[0]),
+                            "points": history.get(customer_id, (0, 0))[1],
+                            "last": history.get(customer_id, (0, 0, None))[2],
+                        }
+                        for customer_id in customer_ids
+                    ],
+                )
+        log(f"✓ Tenant {tid}: recomputed stats for {len(customer_ids)} customers")
+
+if __name__ == "__main__":
+    import database
+
+    parser = argparse.ArgumentParser(description="Customer stats maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("flush", help="apply all pending stat deltas")
+    recompute_cmd = sub.add_parser("recompute", help="rebuild stats from sales history")
+    recompute_cmd.add_argument("--tenant", type=int, help="only this tenant (default: all)")
+    args = parser.parse_args()
+
+    if args.command == "flush":
+        print(f"✓ Applied {flush_pending(database.engine)} pending deltas")
+    else:
+        recompute(database.engine, args.tenant)
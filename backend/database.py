@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from settings import settings
@@ -10,10 +10,28 @@ SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     pool_pre_ping=True,  # Verify connections before using
-    pool_size=10,  # Number of connections to maintain
-    max_overflow=20  # Maximum number of connections beyond pool_size
+    pool_size=settings.DB_POOL_SIZE,  # Number of connections to maintain (per worker)
+    max_overflow=settings.DB_MAX_OVERFLOW  # Maximum number of connections beyond pool_size
 )
 
+def configure_sqlite(engine):
+    """
+    WAL journal for SQLite (the store-local edge database, see sync.py):
+    readers never block the writer, and commits append to the log instead
+    of rewriting pages with a full fsync each time.
+    """
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        # Wait for the write lock instead of failing with "database is locked"
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+if engine.dialect.name == "sqlite":
+    configure_sqlite(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
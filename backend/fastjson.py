@@ -0,0 +1,45 @@
+"""
+Fast JSON responses for hot list endpoints.
+
+The regular path builds a dict per row, validates each one against the
+response_model and encodes with the stdlib json module. For catalog-sized
+lists that dominates CPU, so these helpers map SQLAlchemy Row tuples
+straight to JSON bytes with orjson. Routes keep their response_model, which
+still drives the OpenAPI schema; returning a Response instance makes
+FastAPI skip re-validation.
+"""
+from decimal import Decimal
+from typing import Any, Iterable, Optional
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+def _default(value: Any):
+    """Fallback for types orjson does not encode natively"""
+    if isinstance(value, Decimal):
+        # Money columns (NUMERIC(12, 2)) are exact in floats' shortest repr
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+def rows_to_json(rows: Iterable) -> bytes:
+    """Encode a list of Row objects as a JSON array of objects keyed by column label"""
+    return dumps([row._asdict() for row in rows])
+
+def row_to_json(row) -> bytes:
+    return dumps(row._asdict())
+
+class ORJSONResponse(JSONResponse):
+    """Drop-in JSONResponse using orjson; also usable as a route's response_class"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class RawJSONResponse(Response):
+    """Response for a body that is already encoded JSON bytes"""
+    media_type = "application/json"
+
+    def __init__(self, content: bytes, status_code: int = 200, headers: Optional[dict] = None):
+        super().__init__(content=content, status_code=status_code, headers=headers)
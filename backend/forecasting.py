@@ -0,0 +1,168 @@
+"""
+Vectorized demand forecasting and stock velocity.
+
+One grouped query pulls (product, day, units) for a tenant's recent history,
+using the tenant_id/created_at columns denormalized onto transaction_items,
+so it needs no join. The rows are scattered into a products x days NumPy
+matrix, and every SKU is computed at once:
+
+- moving averages over the last 7 and 28 days, and their ratio as a trend
+- weekday seasonality: each weekday's mean units over the overall mean
+- velocity: units per day over the last 28 days
+- forecast: velocity times the seasonality factor of each upcoming weekday
+- days of stock remaining at the current velocity
+
+Results are cached per tenant for FORECAST_CACHE_SECONDS as encoded JSON.
+"""
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import Date, Integer, cast, func, select, type_coerce
+
+import fastjson
+import models
+from settings import settings
+
+def _day_index(dialect_name: str, start: date):
+    """SQL expression: whole days from start to the item's created_at date"""
+    created_at = models.TransactionItem.__table__.c.created_at
+    if dialect_name == "postgresql":
+        # date - date is an integer number of days
+        return type_coerce(cast(created_at, Date) - start, Integer)
+    return cast(func.julianday(func.date(created_at)) - func.julianday(start.isoformat()), Integer)
+
+def load_series(db, tenant_id: int, history_days: int, today: date = None):
+    """
+    (product ids, names, stock, units, start) where units is an int matrix
+    of shape (products, history_days) whose first column is `start` and
+    last column is today
+    """
+    today = today or datetime.now(timezone.utc).date()
+    start = today - timedelta(days=history_days - 1)
+    product = models.Product.__table__
+    item = models.TransactionItem.__table__
+
+    products = db.execute(
+        select(product.c.id, product.c.name, product.c.stock_quantity)
+        .where(product.c.tenant_id == tenant_id, product.c.is_active == True)
+        .order_by(product.c.id)
+    ).all()
+    ids = np.fromiter((p[0] for p in products), dtype=np.int64, count=len(products))
+    units = np.zeros((len(products), history_days), dtype=np.int64)
+
+    day = _day_index(db.get_bind().dialect.name, start).label("day")
+    rows = db.execute(
+        select(item.c.product_id, day, func.sum(item.c.quantity))
+        .where(
+            item.c.tenant_id == tenant_id,
+            item.c.created_at >= datetime.combine(start, datetime.min.time()),
+        )
+        .group_by(item.c.product_id, day)
+    ).all()
+    if rows and len(ids):
+        triples = np.array(rows, dtype=np.int64)
+        rows_idx = np.searchsorted(ids, triples[:, 0])
+        # Sales of deleted (inactive) products have no row to land in
+        known = (rows_idx < len(ids)) & (ids[np.minimum(rows_idx, len(ids) - 1)] == triples[:, 0])
+        in_range = (triples[:, 1] >= 0) & (triples[:, 1] < history_days)
+        keep = known & in_range
+        np.add.at(units, (rows_idx[keep], triples[keep, 1]), triples[keep, 2])
+
+    names = [p[1] for p in products]
+    stock = np.fromiter((p[2] or 0 for p in products), dtype=np.int64, count=len(products))
+    return ids, names, stock, units, start
+
+def forecast(units: np.ndarray, stock: np.ndarray, start: date, horizon_days: int):
+    """Per-product metrics for a (products, days) units matrix; returns a dict of arrays"""
+    n_days = units.shape[1]
+    series = units.astype(np.float64)
+
+    ma_7 = series[:, -7:].mean(axis=1)
+    ma_28 = series[:, -28:].mean(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trend = np.where(ma_28 > 0, ma_7 / ma_28, np.nan)
+
+    # Weekday of every history column, then mean units per product per weekday
+    weekdays = (np.arange(n_days) + start.weekday()) % 7
+    onehot = np.zeros((n_days, 7))
+    onehot[np.arange(n_days), weekdays] = 1.0
+    weekday_mean = (series @ onehot) / np.maximum(onehot.sum(axis=0), 1)
+    overall_mean = series.mean(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        seasonality = np.where(overall_mean > 0, weekday_mean / overall_mean, 1.0)
+
+    velocity = ma_28
+    future_weekdays = (np.arange(1, horizon_days + 1) + start.weekday() + n_days - 1) % 7
+    daily_forecast = velocity[:, None] * seasonality[:, future_weekdays]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_stock = np.where(velocity > 0, np.maximum(stock, 0) / velocity, np.inf)
+
+    return {
+        "ma_7": ma_7,
+        "ma_28": ma_28,
+        "trend": trend,
+        "velocity": velocity,
+        "seasonality": seasonality,
+        "forecast_units": daily_forecast.sum(axis=1),
+        "days_of_stock": days_of_stock,
+    }
+
+def _round(values: np.ndarray, digits: int = 2):
+    """Array to a JSON-friendly list: rounded floats, NaN/inf as None"""
+    finite = np.isfinite(values)
+    rounded = np.round(np.where(finite, values, 0), digits).tolist()
+    return [v if ok else None for v, ok in zip(rounded, finite.tolist())]
+
+def build_report(db, tenant_id: int, history_days: int, horizon_days: int) -> bytes:
+    ids, names, stock, units, start = load_series(db, tenant_id, history_days)
+    metrics = forecast(units, stock, start, horizon_days)
+    columns = {name: _round(values) for name, values in metrics.items() if name != "seasonality"}
+    seasonality = np.round(metrics["seasonality"], 3).tolist()
+    return fastjson.dumps([
+        {
+            "product_id": product_id,
+            "name": name,
+            "stock_quantity": quantity,
+            "units_sold": units_sold,
+            "ma_7": columns["ma_7"][i],
+            "ma_28": columns["ma_28"][i],
+            "trend": columns["trend"][i],
+            "velocity": columns["velocity"][i],
+            "weekday_factors": seasonality[i],
+            "forecast_units": columns["forecast_units"][i],
+            "days_of_stock": columns["days_of_stock"][i],
+        }
+        for i, (product_id, name, quantity, units_sold) in enumerate(
+            zip(ids.tolist(), names, stock.tolist(), units.sum(axis=1).tolist())
+        )
+    ])
+
+# ==========================================
+# PER-TENANT CACHE
+# ==========================================
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def cached_report(db, tenant_id: int, history_days: int, horizon_days: int) -> bytes:
+    """Encoded report, rebuilt at most every FORECAST_CACHE_SECONDS per tenant and parameters"""
+    key = (tenant_id, history_days, horizon_days)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and now - entry[0] < settings.FORECAST_CACHE_SECONDS:
+            return entry[1]
+    body = build_report(db, tenant_id, history_days, horizon_days)
+    with _cache_lock:
+        # Drop expired reports so the cache only holds live tenants
+        for stale in [k for k, (built, _) in _cache.items() if now - built >= settings.FORECAST_CACHE_SECONDS]:
+            del _cache[stale]
+        _cache[key] = (now, body)
+    return body
+
+def invalidate(tenant_id: int = None):
+    with _cache_lock:
+        for key in [k for k in _cache if tenant_id is None or k[0] == tenant_id]:
+            del _cache[key]
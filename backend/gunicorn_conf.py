@@ -0,0 +1,54 @@
+"""
+Gunicorn configuration for production.
+Usage: gunicorn -c gunicorn_conf.py main:app
+
+Runs N uvicorn workers (see serverconf.py for sizing) with the app preloaded
+in the master, so workers fork with the code already imported.
+
+Graceful reloads:
+- PRELOAD_APP=true (default): the master holds the code, so deploy new code
+  with a zero-downtime binary upgrade:
+      kill -USR2 <master pid>      # new master + workers start on the new code
+      kill -WINCH <old master pid> # old workers finish in-flight requests
+      kill -QUIT <old master pid>
+- PRELOAD_APP=false: kill -HUP <master pid> re-imports the app in fresh
+  workers and retires the old ones gracefully.
+"""
+import os
+
+import serverconf
+from settings import settings
+
+workers = serverconf.worker_count()
+pool_size, max_overflow = serverconf.apply_pool_limits(workers)
+
+# A PaaS router hands the port over in $PORT and connects from outside the
+# dyno, so listen on every interface there; HOST applies otherwise
+host = "0.0.0.0" if os.environ.get("PORT") else settings.HOST
+bind = f"{host}:{settings.PORT}"
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = settings.PRELOAD_APP
+
+# Requests get this long to finish on reload/shutdown before workers are killed
+graceful_timeout = settings.GRACEFUL_TIMEOUT
+timeout = 60
+keepalive = 5
+
+# Recycle workers periodically (jittered so they don't restart together)
+max_requests = 10000
+max_requests_jitter = 1000
+
+accesslog = "-"
+loglevel = "info" if settings.ENVIRONMENT == "production" else "debug"
+
+def on_starting(server):
+    server.log.info(
+        f"Starting {workers} worker(s); DB pool per worker: "
+        f"{pool_size} + {max_overflow} overflow "
+        f"(max {workers * (pool_size + max_overflow)} of {settings.DB_MAX_CONNECTIONS} connections)"
+    )
+
+def post_fork(server, worker):
+    # Never share pooled connections inherited from the preloaded master
+    import database
+    database.engine.dispose(close=False)
@@ -0,0 +1,69 @@
+"""
+Stock writes for checkouts, refunds and pushed store sales.
+
+Stock only ever moves by deltas (stock_quantity = stock_quantity - :sold),
+never by writing back a value read earlier in the request, so concurrent
+checkouts, returns and edge pushes of one product all add up.
+
+Every stock write bumps tenants.product_version (cached listings are stale)
+and stamps the products with it, so store servers pull the new stock (see
+sync.py). The bump locks the tenant row and the updates lock the product
+rows until commit, so callers write stock as the last statements before
+their commit: all other work of the transaction runs without those locks.
+Locks are taken in the order catalog writes take them - tenant first, then
+products in id order - so none of these writes deadlock each other.
+"""
+from typing import Dict
+
+from sqlalchemy import bindparam, func, select, update
+
+import caching
+import models
+
+_products = models.Product.__table__
+_tenants = models.Tenant.__table__
+
+class OutOfStock(ValueError):
+    """A checkout asked for more than is on the shelf"""
+
+    def __init__(self, product_id: int):
+        super().__init__(f"Not enough stock for product {product_id}")
+        self.product_id = product_id
+
+def _stamp(tenant_id: int):
+    return select(_tenants.c.product_version).where(_tenants.c.id == tenant_id).scalar_subquery()
+
+def take_stock(db, tenant_id: int, quantities: Dict[int, int]) -> Dict[int, int]:
+    """
+    Take sold {product_id: quantity} off the shelf; returns the new stock
+    levels. Raises OutOfStock, leaving the transaction to be rolled back,
+    if a product has less left than asked for.
+    """
+    caching.bump_versions(db, tenant_id, products=True)
+    stamp = _stamp(tenant_id)
+    stock = {}
+    for product_id, quantity in sorted(quantities.items()):
+        left = db.execute(
+            update(_products)
+            .where(_products.c.id == product_id, _products.c.tenant_id == tenant_id,
+                   func.coalesce(_products.c.stock_quantity, 0) >= quantity)
+            .values(stock_quantity=func.coalesce(_products.c.stock_quantity, 0) - quantity, sync_version=stamp)
+            .returning(_products.c.stock_quantity)
+        ).scalar()
+        if left is None:
+            raise OutOfStock(product_id)
+        stock[product_id] = left
+    return stock
+
+def apply_deltas(db, tenant_id: int, deltas: Dict[int, int]):
+    """Add {product_id: change} to stock as is - it may go negative"""
+    caching.bump_versions(db, tenant_id, products=True)
+    db.execute(
+        update(_products)
+        .where(_products.c.id == bindparam("product_id"), _products.c.tenant_id == tenant_id)
+        .values(
+            stock_quantity=func.coalesce(_products.c.stock_quantity, 0) + bindparam("change"),
+            sync_version=_stamp(tenant_id),
+        ),
+        [{"product_id": product_id, "change": change} for product_id, change in sorted(deltas.items())]
+    )
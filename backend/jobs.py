@@ -0,0 +1,252 @@
+"""
+Transactional outbox and background job runner.
+
+Post-sale work is queued with enqueue() on the request's session, so the job
+row commits or rolls back together with the sale. Runner threads claim due
+jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of API workers
+and standalone runners can share the queue. No broker is needed, only the
+existing database.
+
+- Handlers are registered with @handler("kind") and called as fn(db, payload)
+  in their own session. The job row is deleted in that same transaction, so
+  database-only handlers take effect exactly once.
+- A failed job is retried with exponential backoff. After JOB_MAX_ATTEMPTS
+  it stays in the table with status 'failed' and its last error.
+- A claim is a lease: jobs left 'running' by a crashed worker become due
+  again after JOB_LEASE_SECONDS. Kinds that run longer register their own
+  lease (@handler("kind", lease_seconds=...)), so they are not claimed a
+  second time while still running.
+
+Usage:
+    python jobs.py worker --concurrency 4   # standalone runner (Procfile: worker)
+    python jobs.py status                   # queue depth per kind and status
+    python jobs.py retry-failed             # requeue failed jobs
+"""
+import argparse
+import importlib
+import logging
+import threading
+import traceback
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import and_, delete, func, select, update
+
+import models
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+HANDLERS: Dict[str, Callable] = {}
+# Kinds with a lease other than JOB_LEASE_SECONDS
+LEASES: Dict[str, int] = {}
+
+# Modules that register handlers; imported by runners so a standalone worker
+# knows every job kind
+HANDLER_MODULES = ("basket",)
+
+# Retry delays: 2, 4, 8, ... seconds, capped
+MAX_BACKOFF_SECONDS = 600
+
+def handler(kind: str, lease_seconds: Optional[int] = None):
+    """Register fn(db, payload) as the handler for jobs of this kind"""
+    def register(fn):
+        HANDLERS[kind] = fn
+        if lease_seconds is not None:
+            LEASES[kind] = lease_seconds
+        return fn
+    return register
+
+def load_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+def _now() -> datetime:
+    # Job timestamps are naive UTC, like the rest of the schema
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def enqueue(db, kind: str, payload: dict, tenant_id: Optional[int] = None, delay: float = 0):
+    """Queue a job on the caller's session; it becomes visible when the caller commits"""
+    if kind not in HANDLERS:
+        raise ValueError(f"No job handler registered for {kind!r}")
+    job = models.Job(
+        kind=kind,
+        payload=payload,
+        tenant_id=tenant_id,
+        status="pending",
+        attempts=0,
+        run_after=_now() + timedelta(seconds=delay),
+    )
+    db.add(job)
+    return job
+
+# ==========================================
+# RUNNER
+# ==========================================
+
+_jobs = models.Job.__table__
+
+def claim(engine, limit: int = 1):
+    """Lease up to `limit` due jobs to this worker; returns [(id, kind, payload, attempts)]"""
+    now = _now()
+    # 'running' rows are due again once their lease (run_after) has expired
+    due = and_(_jobs.c.status.in_(("pending", "running")), _jobs.c.run_after <= now)
+    with engine.begin() as conn:
+        rows = conn.execute(
+            select(_jobs.c.id, _jobs.c.kind).where(due).order_by(_jobs.c.run_after, _jobs.c.id)
+            .limit(limit).with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return []
+        by_lease = defaultdict(list)
+        for job_id, kind in rows:
+            by_lease[LEASES.get(kind, settings.JOB_LEASE_SECONDS)].append(job_id)
+        claimed = []
+        for lease, ids in by_lease.items():
+            # Re-checking `due` keeps claims exclusive where SKIP LOCKED is unavailable (SQLite)
+            claimed += conn.execute(
+                update(_jobs).where(_jobs.c.id.in_(ids), due).values(
+                    status="running",
+                    attempts=_jobs.c.attempts + 1,
+                    run_after=now + timedelta(seconds=lease),
+                    updated_at=now,
+                ).returning(_jobs.c.id, _jobs.c.kind, _jobs.c.payload, _jobs.c.attempts)
+            ).all()
+        return claimed
+
+def run_job(session_factory, job_id: int, kind: str, payload: dict, attempts: int) -> bool:
+    """Run one claimed job; returns True on success"""
+    db = session_factory()
+    try:
+        fn = HANDLERS.get(kind)
+        if fn is None:
+            raise LookupError(f"No job handler registered for {kind!r}")
+        fn(db, payload)
+        db.execute(delete(_jobs).where(_jobs.c.id == job_id))
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        error = traceback.format_exc(limit=5)
+        final = attempts >= settings.JOB_MAX_ATTEMPTS
+        db.execute(update(_jobs).where(_jobs.c.id == job_id).values(
+            status="failed" if final else "pending",
+            run_after=_now() + timedelta(seconds=min(2 ** attempts, MAX_BACKOFF_SECONDS)),
+            last_error=error[-4000:],
+            updated_at=_now(),
+        ))
+        db.commit()
+        log = logger.error if final else logger.warning
+        log(f"Job {job_id} ({kind}) failed on attempt {attempts}{' - giving up' if final else ''}")
+        return False
+    finally:
+        db.close()
+
+class Runner:
+    """Pool of threads that claim and run jobs until stopped"""
+
+    def __init__(self, engine, session_factory, concurrency: int = None, poll_interval: float = None):
+        self.engine = engine
+        self.session_factory = session_factory
+        self.concurrency = settings.JOB_WORKERS if concurrency is None else concurrency
+        self.poll_interval = settings.JOB_POLL_SECONDS if poll_interval is None else poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        load_handlers()
+        self._stop.clear()
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"job-runner-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self) -> int:
+        """Claim and run one job; returns the number of jobs run (0 when idle)"""
+        claimed = claim(self.engine)
+        for job_id, kind, payload, attempts in claimed:
+            run_job(self.session_factory, job_id, kind, payload, attempts)
+        return len(claimed)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                logger.exception("Job runner error")
+            self._stop.wait(self.poll_interval)
+
+# ==========================================
+# HANDLERS
+# ==========================================
+
+@handler("low_stock_alert")
+def low_stock_alert(db, payload):
+    """Record products that a sale pushed to or below their minimum stock level"""
+    for product in payload["products"]:
+        db.add(models.StockAlert(
+            tenant_id=payload["tenant_id"],
+            product_id=product["id"],
+            stock_quantity=product["stock_quantity"],
+            min_stock_level=product["min_stock_level"],
+            transaction_id=payload.get("transaction_id"),
+        ))
+        logger.warning(
+            f"Low stock: product {product['id']} (tenant {payload['tenant_id']}) "
+            f"at {product['stock_quantity']}, minimum {product['min_stock_level']}"
+        )
+
+def main():
+    import signal
+    import database
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Background job runner")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker_cmd = sub.add_parser("worker", help="run jobs until interrupted")
+    worker_cmd.add_argument("--concurrency", type=int, default=max(1, settings.JOB_WORKERS))
+    sub.add_parser("status", help="queue depth per kind and status")
+    sub.add_parser("retry-failed", help="requeue failed jobs")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        runner = Runner(database.engine, database.SessionLocal, concurrency=args.concurrency)
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+        runner.start()
+        print(f"✓ Job runner started with {args.concurrency} thread(s)")
+        try:
+            stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        runner.stop()
+    elif args.command == "status":
+        with database.engine.connect() as conn:
+            rows = conn.execute(
+                select(_jobs.c.kind, _jobs.c.status, func.count())
+                .group_by(_jobs.c.kind, _jobs.c.status).order_by(_jobs.c.kind, _jobs.c.status)
+            ).all()
+        for kind, status, count in rows:
+            print(f"{kind:<30} {status:<10} {count}")
+        if not rows:
+            print("Queue is empty")
+    else:
+        with database.engine.begin() as conn:
+            result = conn.execute(update(_jobs).where(_jobs.c.status == "failed").values(
+                status="pending", attempts=0, run_after=_now(), updated_at=_now()
+            ))
+        print(f"✓ Requeued {result.rowcount} failed job(s)")
+
+if __name__ == "__main__":
+    # Run through the importable module so handlers registered by
+    # HANDLER_MODULES land in the same registry as the runner's
+    import jobs
+    jobs.main()
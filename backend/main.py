@@ -1,11 +1,13 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request, Response
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, text
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, and_, text, cast, Float
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import timedelta, datetime, timezone, date
 from typing import List, Optional
+from collections import defaultdict
+from contextlib import asynccontextmanager
 import logging
 
 # Configure logging
@@ -21,35 +23,101 @@ import schemas
 import utils
 import database
 import auth
+import archive
+import barcodes
+import basket
+import caching
+import customer_stats
+import jobs
+import money
+import profiling
+import promotions
+import querylog
+import returns
+import fastjson
+import forecasting
+import inventory
+import search
+import shifts
+import singleflight
+import sync
 from settings import settings
+from query_budget import QueryBudgetMiddleware, query_budget, install as install_query_counter
 
-# 1. Initialize Database Tables
-# This creates the tables in PostgreSQL if they don't exist
-models.Base.metadata.create_all(bind=database.engine)
-
-# 2. Run database migration if needed (only once, safe to run multiple times)
-try:
-    from migrate_database import migrate_database
-    print("Running database migration...")
-    migrate_database()
-except ImportError:
-    print("Migration script not found, skipping...")
-except Exception as e:
-    print(f"Migration completed or already done: {str(e)[:100]}")
-    # Continue - migration might already be done
+from migrate_database import check_schema_version
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes are applied out of band (python migrate_database.py);
+    # workers only verify the recorded version on boot
+    check_schema_version()
+    stats_flusher = customer_stats.Flusher(database.engine)
+    stats_flusher.start()
+    # Post-sale jobs; JOB_WORKERS=0 leaves them to a standalone `python jobs.py worker`
+    job_runner = jobs.Runner(database.engine, database.SessionLocal)
+    job_runner.start()
+    # Store server: sales up and catalog down in the background (see sync.py)
+    replicator = None
+    if settings.EDGE_MODE and settings.SYNC_UPSTREAM_URL:
+        replicator = sync.Replicator(database.engine)
+        replicator.start()
+    # Opt-in stack sampling and slow-request capture (see profiling.py)
+    profiler = None
+    if settings.PROFILING_ENABLED:
+        profiler = profiling.Sampler()
+        profiler.start()
+    # Slow query log: aggregates and EXPLAIN plans written per worker (see querylog.py)
+    query_log = None
+    if settings.QUERY_LOG_ENABLED:
+        query_log = querylog.Writer(database.engine)
+        query_log.start()
+    yield
+    if query_log is not None:
+        query_log.stop()
+    if profiler is not None:
+        profiler.stop()
+    if replicator is not None:
+        replicator.stop(timeout=settings.GRACEFUL_TIMEOUT)
+    job_runner.stop(timeout=settings.GRACEFUL_TIMEOUT)
+    stats_flusher.stop()
 
 app = FastAPI(
     title="GroceryPOS Pro API",
     version="1.0.0",
     description="Complete POS system for grocery stores",
     docs_url="/docs" if settings.DEBUG else None,  # Disable docs in production
-    redoc_url="/redoc" if settings.DEBUG else None
+    redoc_url="/redoc" if settings.DEBUG else None,
+    lifespan=lifespan
 )
+# Lets the profiler find the thread running each sync endpoint; set before any route is declared
+app.router.route_class = profiling.ProfiledRoute
+
+# Request profiling, innermost: it must run in the task that runs the routes
+profiling.install(database.engine)
+app.add_middleware(profiling.ProfilingMiddleware)
 
 # Add logging middleware
 from middleware import LoggingMiddleware
 app.add_middleware(LoggingMiddleware)
 
+# Per-request statement counting (enabled via QUERY_BUDGET_MODE)
+install_query_counter(database.engine)
+app.add_middleware(QueryBudgetMiddleware)
+
+# Statement timings per fingerprint and route (enabled via QUERY_LOG_ENABLED)
+if settings.QUERY_LOG_ENABLED:
+    querylog.install(database.engine)
+app.add_middleware(querylog.QueryLogMiddleware)
+
+# Negotiated br/zstd/gzip compression with a compressed-body cache for ETag'd responses
+import compression
+app.add_middleware(compression.CompressionMiddleware)
+
+# Per-tenant rate limits and priority-based load shedding (outside everything
+# but CORS, so refused requests cost no work and still carry CORS headers)
+import ratelimit
+app.add_middleware(ratelimit.RateLimitMiddleware)
+
 # Custom exception handler for validation errors
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -123,11 +191,75 @@ def get_api_info():
         "docs": "/docs" if settings.DEBUG else "disabled"
     }
 
+@app.get("/api/v1/debug/compression", include_in_schema=False)
+def get_compression_stats():
+    """Per-route compression CPU cost vs. bytes saved (debug only)"""
+    if not settings.DEBUG:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {
+        "encodings": compression.available_encodings(),
+        "routes": compression.stats()
+    }
+
+# ==========================================
+# ADMIN ENDPOINTS (X-Admin-Token)
+# ==========================================
+
+@app.get("/api/v1/admin/profiles", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+def get_profiles():
+    """Kept request profiles, newest first (see profiling.py)"""
+    return {"enabled": settings.PROFILING_ENABLED, "profiles": profiling.list_profiles()}
+
+@app.get("/api/v1/admin/profiles/{profile_id}", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+def get_profile(profile_id: str):
+    """Timings and SQL statement log of a profile"""
+    body = profiling.read_profile(profile_id, "json")
+    if body is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=body, media_type="application/json")
+
+@app.get(
+    "/api/v1/admin/profiles/{profile_id}/flamegraph",
+    include_in_schema=False,
+    dependencies=[Depends(auth.require_admin)]
+)
+def get_profile_flamegraph(profile_id: str):
+    """Collapsed stacks of a profile, for flamegraph.pl, inferno or speedscope"""
+    body = profiling.read_profile(profile_id, "folded")
+    if body is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=body,
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'}
+    )
+
+@app.get("/api/v1/admin/queries", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+def get_query_stats(
+    by: str = Query("total", pattern="^(total|max|count|mean)$"),
+    route: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Statement fingerprints and routes by SQL time, merged over all workers (see querylog.py)"""
+    if settings.QUERY_LOG_ENABLED:
+        # This worker's latest figures, without waiting for its writer
+        querylog.write_stats()
+    return {"enabled": settings.QUERY_LOG_ENABLED, **querylog.report(by, route, limit)}
+
+@app.get("/api/v1/admin/queries/plans", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+def get_query_plans(limit: int = Query(20, ge=1, le=200)):
+    """Captured EXPLAIN (ANALYZE, BUFFERS) plans of slow statements, newest first"""
+    return querylog.plans(limit)
+
 # ==========================================
 # AUTHENTICATION ENDPOINTS
 # ==========================================
 
-@app.post("/api/v1/auth/signup", response_model=schemas.AuthResponse)
+@app.post(
+    "/api/v1/auth/signup",
+    response_model=schemas.AuthResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
 def signup(payload: schemas.SignupRequest, db: Session = Depends(database.get_db)):
     """
     Registers a new Tenant (Store) and a new User (Owner).
@@ -152,7 +284,8 @@ def signup(payload: schemas.SignupRequest, db: Session = Depends(database.get_db
         "city": payload.city,
         "state": payload.state,
         "registration_number": payload.registration_number,
-        "plan_id": payload.plan_id
+        "plan_id": payload.plan_id,
+        "time_zone": payload.time_zone
     }
     if payload.store_code:
         tenant_data["store_code"] = payload.store_code
@@ -197,14 +330,17 @@ def signup(payload: schemas.SignupRequest, db: Session = Depends(database.get_db
     }
 
 @app.post("/api/v1/auth/login", response_model=schemas.LoginResponse)
+@query_budget(2)
 def login(payload: schemas.LoginRequest, db: Session = Depends(database.get_db)):
     """
     Advanced Login: Checks user existence, account lock status, 
     password validity, and subscription status.
     """
     
-    # 1. Fetch User
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
+    # 1. Fetch User (with tenant, needed for the subscription check)
+    user = db.query(models.User).options(
+        joinedload(models.User.tenant)
+    ).filter(models.User.email == payload.email).first()
     
     # 2. Check if User Exists (Generic error for security)
     if not user:
@@ -232,12 +368,6 @@ def login(payload: schemas.LoginRequest, db: Session = Depends(database.get_db))
 
     # --- SUCCESSFUL LOGIN ---
     
-    # Reset security counters & Update login time
-    user.failed_login_attempts = 0
-    user.is_locked = False
-    user.last_login = datetime.now(timezone.utc)
-    db.commit()
-    
     # Generate Token
     expire_minutes = auth.ACCESS_TOKEN_EXPIRE_MINUTES * (10 if payload.remember_me else 1)
     access_token_expires = timedelta(minutes=expire_minutes)
@@ -247,7 +377,9 @@ def login(payload: schemas.LoginRequest, db: Session = Depends(database.get_db))
         expires_delta=access_token_expires
     )
 
-    return {
+    # Build the response before committing: commit expires the loaded
+    # user/tenant and reading them afterwards would reload both rows
+    response = {
         "access_token": access_token,
         "token_type": "bearer",
         "expires_in": expire_minutes * 60,
@@ -267,12 +399,52 @@ def login(payload: schemas.LoginRequest, db: Session = Depends(database.get_db))
         "message": "Login successful"
     }
 
+    # Reset security counters & Update login time
+    user.failed_login_attempts = 0
+    user.is_locked = False
+    user.last_login = datetime.now(timezone.utc)
+    db.commit()
+
+    return response
+
 # ==========================================
 # INVENTORY ENDPOINTS
 # ==========================================
 
-@app.get("/api/v1/products", response_model=List[schemas.ProductResponse])
+def _product_rows(db: Session, tenant_id: int):
+    """
+    Column-level product query for the read endpoints. Selecting plain
+    columns (category name via outer join) avoids ORM identity-map overhead,
+    and the coalesces give rows that already match ProductResponse.
+    """
+    return db.query(
+        models.Product.id,
+        models.Product.name,
+        models.Product.barcode,
+        models.Product.category_id,
+        # Money is NUMERIC; cast in SQL so rows encode without a Decimal hook
+        cast(func.coalesce(models.Product.cost_price, 0), Float).label("cost_price"),
+        cast(models.Product.selling_price, Float).label("selling_price"),
+        func.coalesce(models.Product.stock_quantity, 0).label("stock_quantity"),
+        func.coalesce(models.Product.min_stock_level, 5).label("min_stock_level"),
+        models.Product.tenant_id,
+        models.Product.plu,
+        models.Category.name.label("category_name")
+    ).outerjoin(
+        models.Category, models.Product.category_id == models.Category.id
+    ).filter(
+        models.Product.tenant_id == tenant_id,
+        models.Product.is_active == True
+    )
+
+@app.get(
+    "/api/v1/products",
+    response_model=List[schemas.ProductResponse],
+    response_class=fastjson.ORJSONResponse
+)
+@query_budget(2)
 def get_products(
+    request: Request,
     barcode: Optional[str] = None,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
@@ -281,36 +453,27 @@ def get_products(
     Get all products belonging to the logged-in user's store (Tenant).
     Optionally filter by barcode.
     """
-    query = db.query(models.Product).filter(
-        models.Product.tenant_id == current_user.tenant_id,
-        models.Product.is_active == True
-    )
+    etag = caching.product_etag(current_user.tenant, barcode)
+    if caching.is_not_modified(request, etag):
+        return caching.not_modified(etag)
+
+    query = _product_rows(db, current_user.tenant_id)
     
     # Filter by barcode if provided
     if barcode:
         query = query.filter(models.Product.barcode == barcode)
     
-    products = query.all()
-    
-    # Add category_name to each product
-    result = []
-    for product in products:
-        product_dict = {
-            "id": product.id,
-            "name": product.name,
-            "barcode": product.barcode,
-            "category_id": product.category_id,
-            "cost_price": product.cost_price,
-            "selling_price": product.selling_price,
-            "stock_quantity": product.stock_quantity,
-            "min_stock_level": product.min_stock_level,
-            "tenant_id": product.tenant_id,
-            "category_name": product.category.name if product.category else None
-        }
-        result.append(product_dict)
-    return result
+    # Rows are encoded straight to JSON; response_model only documents the shape
+    return fastjson.RawJSONResponse(
+        fastjson.rows_to_json(query.all()),
+        headers=caching.etag_headers(etag)
+    )
 
-@app.post("/api/v1/products", response_model=schemas.ProductResponse)
+@app.post(
+    "/api/v1/products",
+    response_model=schemas.ProductResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
 def create_product(
     product: schemas.ProductCreate,
     db: Session = Depends(database.get_db),
@@ -337,12 +500,15 @@ def create_product(
         selling_price=product.selling_price,
         stock_quantity=product.stock_quantity,
         min_stock_level=product.min_stock_level,
+        plu=product.plu,
         tenant_id=current_user.tenant_id
     )
     
     db.add(new_product)
+    caching.bump_versions(db, current_user.tenant_id, products=True, pricing=True)
     db.commit()
     db.refresh(new_product)
+    search.product_saved(new_product)
     
     # Add category name to response
     response_data = {
@@ -351,7 +517,11 @@ def create_product(
     }
     return response_data
 
-@app.put("/api/v1/products/{product_id}", response_model=schemas.ProductResponse)
+@app.put(
+    "/api/v1/products/{product_id}",
+    response_model=schemas.ProductResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
 def update_product(
     product_id: int,
     product_update: schemas.ProductUpdate,
@@ -385,8 +555,14 @@ def update_product(
     for field, value in update_data.items():
         setattr(product, field, value)
     
+    # Restocking leaves the compiled pricing snapshot valid
+    caching.bump_versions(
+        db, current_user.tenant_id, products=True,
+        pricing=bool(promotions.PRICED_FIELDS.intersection(update_data))
+    )
     db.commit()
     db.refresh(product)
+    search.product_saved(product)
     
     # Add category name to response
     response_data = {
@@ -395,7 +571,10 @@ def update_product(
     }
     return response_data
 
-@app.delete("/api/v1/products/{product_id}")
+@app.delete(
+    "/api/v1/products/{product_id}",
+    dependencies=[Depends(sync.cloud_only)]
+)
 def delete_product(
     product_id: int,
     db: Session = Depends(database.get_db),
@@ -415,54 +594,116 @@ def delete_product(
     
     # Soft delete: Set is_active to False instead of deleting from DB
     product.is_active = False
+    caching.bump_versions(db, current_user.tenant_id, products=True, pricing=True)
     db.commit()
+    search.product_removed(current_user.tenant_id, product_id)
     return {"message": "Product deleted successfully (soft delete)"}
 
-@app.get("/api/v1/products/by-barcode/{barcode}", response_model=schemas.ProductResponse)
+@app.get(
+    "/api/v1/products/by-barcode/{barcode}",
+    response_model=schemas.ProductResponse,
+    response_class=fastjson.ORJSONResponse
+)
+@query_budget(2)
 def get_product_by_barcode(
     barcode: str,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Get a product by barcode - useful for barcode scanner."""
-    product = db.query(models.Product).filter(
-        models.Product.barcode == barcode,
-        models.Product.tenant_id == current_user.tenant_id,
-        models.Product.is_active == True
+    product = _product_rows(db, current_user.tenant_id).filter(
+        models.Product.barcode == barcode
     ).first()
     
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    product_dict = {
-        "id": product.id,
-        "name": product.name,
-        "barcode": product.barcode,
-        "category_id": product.category_id,
-        "cost_price": product.cost_price,
-        "selling_price": product.selling_price,
-        "stock_quantity": product.stock_quantity,
-        "min_stock_level": product.min_stock_level,
-        "tenant_id": product.tenant_id,
-        "category_name": product.category.name if product.category else None
+    return fastjson.RawJSONResponse(fastjson.row_to_json(product))
+
+@app.get("/api/v1/products/scan/{code}", response_model=schemas.ScannedItem)
+@query_budget(4)
+def scan_product(
+    code: str,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Scanner entry point: a ready-to-add cart line for a product barcode or a
+    weight/price-embedded scale label (see barcodes.py).
+    """
+    line = barcodes.scan(db, current_user.tenant_id, code)
+    if line is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return line
+
+@app.get(
+    "/api/v1/products/search",
+    response_model=List[schemas.ProductResponse],
+    response_class=fastjson.ORJSONResponse
+)
+@query_budget(3)
+def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Autocomplete by name prefix or barcode digits, best matches first (see search.py)."""
+    ids = search.get_index(db, current_user.tenant_id).search(q, limit)
+    if not ids:
+        return fastjson.RawJSONResponse(b"[]")
+    rows = {
+        row.id: row
+        for row in _product_rows(db, current_user.tenant_id).filter(models.Product.id.in_(ids))
     }
-    return product_dict
+    # Keep the index's ranking; skip ids deleted since the index was built
+    return fastjson.RawJSONResponse(
+        fastjson.rows_to_json([rows[product_id] for product_id in ids if product_id in rows])
+    )
+
+@app.get(
+    "/api/v1/products/{product_id}/suggestions",
+    response_model=List[schemas.ProductSuggestion],
+    response_class=fastjson.ORJSONResponse
+)
+@query_budget(2)
+def get_product_suggestions(
+    product_id: int,
+    limit: int = Query(5, ge=1, le=20),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Frequently bought together with this product, for cross-sell at the till (see basket.py)."""
+    rows = basket.suggestions(db, current_user.tenant_id, product_id, limit)
+    return fastjson.RawJSONResponse(fastjson.rows_to_json(rows))
 
 # ==========================================
 # CATEGORY ENDPOINTS
 # ==========================================
 
 @app.get("/api/v1/categories", response_model=List[schemas.CategoryResponse])
+@query_budget(2)
 def get_categories(
+    request: Request,
+    response: Response,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Get all categories for the current tenant."""
+    etag = caching.category_etag(current_user.tenant)
+    if caching.is_not_modified(request, etag):
+        return caching.not_modified(etag)
+    caching.set_etag(response, etag)
+
     return db.query(models.Category).filter(
         models.Category.tenant_id == current_user.tenant_id
     ).all()
 
-@app.post("/api/v1/categories", response_model=schemas.CategoryResponse)
+@app.post(
+    "/api/v1/categories",
+    response_model=schemas.CategoryResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
 def create_category(
     category: schemas.CategoryCreate,
     db: Session = Depends(database.get_db),
@@ -475,11 +716,16 @@ def create_category(
         tenant_id=current_user.tenant_id
     )
     db.add(new_category)
+    caching.bump_versions(db, current_user.tenant_id, categories=True)
     db.commit()
     db.refresh(new_category)
     return new_category
 
-@app.put("/api/v1/categories/{category_id}", response_model=schemas.CategoryResponse)
+@app.put(
+    "/api/v1/categories/{category_id}",
+    response_model=schemas.CategoryResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
 def update_category(
     category_id: int,
     category_update: schemas.CategoryCreate,
@@ -497,11 +743,16 @@ def update_category(
     
     category.name = category_update.name
     category.description = category_update.description
+    # Products embed category_name, so both caches go stale
+    caching.bump_versions(db, current_user.tenant_id, products=True, categories=True)
     db.commit()
     db.refresh(category)
     return category
 
-@app.delete("/api/v1/categories/{category_id}")
+@app.delete(
+    "/api/v1/categories/{category_id}",
+    dependencies=[Depends(sync.cloud_only)]
+)
 def delete_category(
     category_id: int,
     db: Session = Depends(database.get_db),
@@ -526,16 +777,84 @@ def delete_category(
             status_code=400, 
             detail=f"Cannot delete category. {products_count} product(s) are using it."
         )
+
+    # Promotions reference it by foreign key, active or not
+    promotions_count = db.query(models.Promotion).filter(
+        models.Promotion.category_id == category_id
+    ).count()
+
+    if promotions_count > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot delete category. {promotions_count} promotion(s) target it."
+        )
     
     db.delete(category)
+    caching.bump_versions(db, current_user.tenant_id, categories=True)
     db.commit()
     return {"message": "Category deleted successfully"}
 
+# ==========================================
+# BARCODE SCHEME ENDPOINTS
+# ==========================================
+
+@app.get("/api/v1/barcode-schemes", response_model=List[schemas.BarcodeSchemeResponse])
+def get_barcode_schemes(
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Variable-measure (scale label) barcode layouts for the current tenant."""
+    return db.query(models.BarcodeScheme).filter(
+        models.BarcodeScheme.tenant_id == current_user.tenant_id
+    ).order_by(models.BarcodeScheme.id).all()
+
+@app.post(
+    "/api/v1/barcode-schemes",
+    response_model=schemas.BarcodeSchemeResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
+def create_barcode_scheme(
+    scheme: schemas.BarcodeSchemeCreate,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Add a scale label layout, e.g. prefix 21 with PLU and weight in grams."""
+    new_scheme = models.BarcodeScheme(**scheme.model_dump(), tenant_id=current_user.tenant_id)
+    db.add(new_scheme)
+    db.commit()
+    db.refresh(new_scheme)
+    barcodes.invalidate(current_user.tenant_id)
+    return new_scheme
+
+@app.delete(
+    "/api/v1/barcode-schemes/{scheme_id}",
+    dependencies=[Depends(sync.cloud_only)]
+)
+def delete_barcode_scheme(
+    scheme_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Delete a scale label layout."""
+    scheme = db.query(models.BarcodeScheme).filter(
+        models.BarcodeScheme.id == scheme_id,
+        models.BarcodeScheme.tenant_id == current_user.tenant_id
+    ).first()
+
+    if not scheme:
+        raise HTTPException(status_code=404, detail="Barcode scheme not found")
+
+    db.delete(scheme)
+    db.commit()
+    barcodes.invalidate(current_user.tenant_id)
+    return {"message": "Barcode scheme deleted successfully"}
+
 # ==========================================
 # CUSTOMER ENDPOINTS
 # ==========================================
 
 @app.get("/api/v1/customers", response_model=List[schemas.CustomerResponse])
+@query_budget(3)
 def get_customers(
     skip: int = 0,
     limit: int = 100,
@@ -555,9 +874,14 @@ def get_customers(
             (models.Customer.email.ilike(f"%{search}%"))
         )
     
-    return query.order_by(models.Customer.name).offset(skip).limit(limit).all()
+    customers = query.order_by(models.Customer.name).offset(skip).limit(limit).all()
+    return customer_stats.merge_pending(db, customers)
 
-@app.post("/api/v1/customers", response_model=schemas.CustomerResponse)
+@app.post(
+    "/api/v1/customers",
+    response_model=schemas.CustomerResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
 def create_customer(
     customer: schemas.CustomerCreate,
     db: Session = Depends(database.get_db),
@@ -578,7 +902,11 @@ def create_customer(
     db.refresh(new_customer)
     return new_customer
 
-@app.put("/api/v1/customers/{customer_id}", response_model=schemas.CustomerResponse)
+@app.put(
+    "/api/v1/customers/{customer_id}",
+    response_model=schemas.CustomerResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
 def update_customer(
     customer_id: int,
     customer_update: schemas.CustomerUpdate,
@@ -600,9 +928,12 @@ def update_customer(
     
     db.commit()
     db.refresh(customer)
-    return customer
+    return customer_stats.merge_pending(db, [customer])[0]
 
-@app.delete("/api/v1/customers/{customer_id}")
+@app.delete(
+    "/api/v1/customers/{customer_id}",
+    dependencies=[Depends(sync.cloud_only)]
+)
 def delete_customer(
     customer_id: int,
     db: Session = Depends(database.get_db),
@@ -617,6 +948,10 @@ def delete_customer(
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
+    # Unflushed stat changes die with the customer
+    db.query(models.CustomerStatDelta).filter(
+        models.CustomerStatDelta.customer_id == customer.id
+    ).delete(synchronize_session=False)
     db.delete(customer)
     db.commit()
     return {"message": "Customer deleted successfully"}
@@ -636,7 +971,226 @@ def get_customer(
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    return customer
+    return customer_stats.merge_pending(db, [customer])[0]
+
+# ==========================================
+# PROMOTION ENDPOINTS
+# ==========================================
+
+def _check_promotion_target(db: Session, tenant_id: int, promotion: schemas.PromotionCreate):
+    """Targets must belong to the tenant"""
+    if promotion.product_id is not None and not db.query(models.Product.id).filter(
+        models.Product.id == promotion.product_id,
+        models.Product.tenant_id == tenant_id
+    ).first():
+        raise HTTPException(status_code=404, detail="Product not found")
+    if promotion.category_id is not None and not db.query(models.Category.id).filter(
+        models.Category.id == promotion.category_id,
+        models.Category.tenant_id == tenant_id
+    ).first():
+        raise HTTPException(status_code=404, detail="Category not found")
+
+@app.get("/api/v1/promotions", response_model=List[schemas.PromotionResponse])
+def get_promotions(
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """All promotions of the current tenant, active or not."""
+    return db.query(models.Promotion).filter(
+        models.Promotion.tenant_id == current_user.tenant_id
+    ).order_by(models.Promotion.id).all()
+
+@app.post(
+    "/api/v1/promotions",
+    response_model=schemas.PromotionResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
+def create_promotion(
+    promotion: schemas.PromotionCreate,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Create a promotion (percentage, BOGO or multi-buy; see promotions.py)."""
+    _check_promotion_target(db, current_user.tenant_id, promotion)
+    new_promotion = models.Promotion(**promotion.model_dump(), tenant_id=current_user.tenant_id)
+    db.add(new_promotion)
+    caching.bump_versions(db, current_user.tenant_id, pricing=True)
+    db.commit()
+    db.refresh(new_promotion)
+    return new_promotion
+
+@app.put(
+    "/api/v1/promotions/{promotion_id}",
+    response_model=schemas.PromotionResponse,
+    dependencies=[Depends(sync.cloud_only)]
+)
+def update_promotion(
+    promotion_id: int,
+    promotion_update: schemas.PromotionCreate,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Replace a promotion's rule and conditions."""
+    promotion = db.query(models.Promotion).filter(
+        models.Promotion.id == promotion_id,
+        models.Promotion.tenant_id == current_user.tenant_id
+    ).first()
+
+    if not promotion:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+
+    _check_promotion_target(db, current_user.tenant_id, promotion_update)
+    for field, value in promotion_update.model_dump().items():
+        setattr(promotion, field, value)
+    caching.bump_versions(db, current_user.tenant_id, pricing=True)
+    db.commit()
+    db.refresh(promotion)
+    return promotion
+
+@app.delete(
+    "/api/v1/promotions/{promotion_id}",
+    dependencies=[Depends(sync.cloud_only)]
+)
+def delete_promotion(
+    promotion_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Delete a promotion. Past sales keep their recorded savings."""
+    promotion = db.query(models.Promotion).filter(
+        models.Promotion.id == promotion_id,
+        models.Promotion.tenant_id == current_user.tenant_id
+    ).first()
+
+    if not promotion:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+
+    db.delete(promotion)
+    caching.bump_versions(db, current_user.tenant_id, pricing=True)
+    db.commit()
+    return {"message": "Promotion deleted successfully"}
+
+@app.post("/api/v1/cart/price", response_model=schemas.CartPriceResponse)
+# User and customer; compiling a stale pricing snapshot (and scale label schemes) adds 3
+@query_budget(5)
+def price_cart(
+    payload: schemas.CartPriceRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Preview a cart's prices with promotions, as checkout would charge them.
+    Prices come from the tenant's cached pricing snapshot; stock is not checked.
+    """
+    loyalty_points = None
+    if payload.customer_id:
+        customer = db.query(models.Customer.loyalty_points).filter(
+            models.Customer.id == payload.customer_id,
+            models.Customer.tenant_id == current_user.tenant_id
+        ).first()
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        loyalty_points = customer.loyalty_points
+
+    try:
+        return promotions.price_cart(
+            db, current_user.tenant, payload.items, datetime.now(timezone.utc).replace(tzinfo=None),
+            loyalty_points, payload.discount_type, payload.discount_value
+        )
+    except LookupError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+# ==========================================
+# SHIFT ENDPOINTS
+# ==========================================
+
+def _get_shift(db: Session, tenant_id: int, shift_id: int) -> models.Shift:
+    shift = db.query(models.Shift).filter(
+        models.Shift.id == shift_id,
+        models.Shift.tenant_id == tenant_id
+    ).first()
+    if not shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+    return shift
+
+@app.post("/api/v1/shifts/open", response_model=schemas.ShiftResponse)
+def open_shift(
+    payload: schemas.ShiftOpen,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Open a till shift; the cashier's sales count towards it until it is closed."""
+    try:
+        shift = shifts.open_shift(db, current_user, payload.till, payload.opening_float)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    db.commit()
+    db.refresh(shift)
+    return shift
+
+@app.get("/api/v1/shifts", response_model=List[schemas.ShiftResponse])
+@query_budget(2)
+def get_shifts(
+    shift_status: Optional[str] = Query(None, alias="status", pattern="^(open|closed)$"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Recent shifts, newest first."""
+    query = db.query(models.Shift).filter(models.Shift.tenant_id == current_user.tenant_id)
+    if shift_status:
+        query = query.filter(models.Shift.status == shift_status)
+    return query.order_by(models.Shift.opened_at.desc()).limit(limit).all()
+
+@app.get("/api/v1/shifts/{shift_id}/report", response_model=schemas.ShiftReport)
+@query_budget(4)
+def get_shift_report(
+    shift_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Live totals of a shift (X-report); the Z-report snapshot once it is closed."""
+    shift = _get_shift(db, current_user.tenant_id, shift_id)
+    if shift.status == "closed":
+        z_report = db.query(models.ZReport).filter(models.ZReport.shift_id == shift.id).first()
+        if z_report:
+            return z_report.report
+    return shifts.build_report(db, shift)
+
+@app.post("/api/v1/shifts/{shift_id}/close", response_model=schemas.ZReportResponse)
+def close_shift(
+    shift_id: int,
+    payload: schemas.ShiftClose,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Close a shift and write its immutable Z-report."""
+    shift = _get_shift(db, current_user.tenant_id, shift_id)
+    try:
+        z_report = shifts.close_shift(db, shift, current_user, payload.counted_cash)
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    db.commit()
+    db.refresh(z_report)
+    return z_report
+
+@app.get("/api/v1/shifts/{shift_id}/z-report", response_model=schemas.ZReportResponse)
+@query_budget(3)
+def get_z_report(
+    shift_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """The Z-report written when the shift was closed."""
+    z_report = db.query(models.ZReport).filter(
+        models.ZReport.shift_id == shift_id,
+        models.ZReport.tenant_id == current_user.tenant_id
+    ).first()
+    if not z_report:
+        raise HTTPException(status_code=404, detail="Z-report not found (shift still open?)")
+    return z_report
 
 # ==========================================
 # TRANSACTION ENDPOINTS (POS) - NEW SECTION
@@ -651,14 +1205,20 @@ def create_transaction(
     """
     Process a Sale:
     1. Validate Customer (if provided)
-    2. Calculate Subtotal
+    2. Check Stock & Calculate Subtotal (promotions applied in one pass)
     3. Apply Discount (if provided)
-    4. Deduct Stock
-    5. Save Transaction
-    6. Update Customer Stats
+    4. Save Transaction
+    5. Save Items
+    6. Queue Customer Stats
+    7. Add to the Shift's Running Totals
+    8. Deduct Stock (last, see inventory.py)
+    9. Queue Post-Sale Jobs (low stock alerts)
     """
-    subtotal = 0.0
-    transaction_items = []
+    # Money math runs in integer cents (see money.py)
+    lines, categories = [], []
+    products, sold = {}, defaultdict(int)
+    # Naive UTC; promotions turn it into store time for their daily windows
+    sold_at = datetime.now(timezone.utc).replace(tzinfo=None)
 
     # 1. Validate Customer if provided
     customer = None
@@ -670,7 +1230,13 @@ def create_transaction(
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
 
-    # 2. Validate Items & Calculate Subtotal
+    # Till shift the sale counts towards (see shifts.py)
+    try:
+        shift_id = shifts.sale_shift(db, current_user.tenant_id, current_user.id, payload.shift_id)
+    except LookupError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+    # 2. Validate Items, Check Stock & Calculate Subtotal
     for item in payload.items:
         # Fetch fresh product data to ensure price/stock is correct
         # Also verify product belongs to the current user's tenant
@@ -682,46 +1248,58 @@ def create_transaction(
         if not product_db:
             raise HTTPException(status_code=404, detail=f"Product {item.product_name} not found")
         
-        # Check if enough stock exists
-        if product_db.stock_quantity < item.quantity:
+        # Check if enough stock exists (step 8 re-checks it as it deducts)
+        if product_db.stock_quantity < sold[product_db.id] + item.quantity:
             raise HTTPException(
                 status_code=400, 
                 detail=f"Not enough stock for {product_db.name}. Available: {product_db.stock_quantity}"
             )
-
-        # Deduct Stock
-        product_db.stock_quantity -= item.quantity
+        products[product_db.id] = product_db
+        sold[product_db.id] += item.quantity
         
-        # Calculate Line Total
-        line_total = product_db.selling_price * item.quantity
-        subtotal += line_total
-        
-        # Prepare Item Record for Database
-        transaction_items.append(models.TransactionItem(
-            product_id=product_db.id,
-            product_name=product_db.name,
-            quantity=item.quantity,
-            unit_price=product_db.selling_price,
-            total_price=line_total
-        ))
-
-    # 3. Calculate Discount
-    discount_amount = 0.0
-    if payload.discount_type and payload.discount_value:
-        if payload.discount_type == 'percentage':
-            if payload.discount_value < 0 or payload.discount_value > 100:
-                raise HTTPException(status_code=400, detail="Discount percentage must be between 0 and 100")
-            discount_amount = subtotal * (payload.discount_value / 100)
-        elif payload.discount_type == 'fixed':
-            if payload.discount_value < 0:
-                raise HTTPException(status_code=400, detail="Discount amount cannot be negative")
-            discount_amount = min(payload.discount_value, subtotal)  # Can't discount more than subtotal
-        else:
-            raise HTTPException(status_code=400, detail="Invalid discount type. Use 'percentage' or 'fixed'")
-
-    total_amount = subtotal - discount_amount
-
-    # 4. Create Transaction Record
+        # Calculate Line Total (scale labels are priced from the label, per label)
+        unit_cents = money.to_cents(product_db.selling_price)
+        line_name = product_db.name
+        if item.barcode:
+            label = barcodes.checkout_price(db, current_user.tenant_id, product_db, item.barcode)
+            if label is not None:
+                unit_cents, line_name = label
+        lines.append(promotions.PricedLine(product_db.id, line_name, item.quantity, unit_cents))
+        categories.append(product_db.category_id)
+
+    # Promotions: each line gets its best rule from the tenant's compiled snapshot
+    promotions.apply_rules(
+        promotions.snapshot_for(db, current_user.tenant), lines, categories, sold_at,
+        customer.loyalty_points if customer else None
+    )
+    subtotal_cents = sum(line.line_cents for line in lines)
+    transaction_items = [
+        models.TransactionItem(
+            product_id=line.product_id,
+            product_name=line.product_name,
+            quantity=line.quantity,
+            unit_price=money.from_cents(line.unit_cents),
+            discount_amount=money.from_cents(line.discount_cents),
+            promotion_id=line.promotion.id if line.promotion else None,
+            total_price=money.from_cents(line.line_cents)
+        )
+        for line in lines
+    ]
+
+    # 3. Calculate Discount (on the promotion-discounted subtotal)
+    try:
+        discount_cents = promotions.basket_discount_cents(
+            subtotal_cents, payload.discount_type, payload.discount_value
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    total_cents = subtotal_cents - discount_cents
+    subtotal = money.from_cents(subtotal_cents)
+    discount_amount = money.from_cents(discount_cents)
+    total_amount = money.from_cents(total_cents)
+
+    # 4. Create Transaction Record (sold_at is shared with its items as the partition key)
     new_txn = models.Transaction(
         tenant_id=current_user.tenant_id,
         user_id=current_user.id,
@@ -731,35 +1309,78 @@ def create_transaction(
         discount_type=payload.discount_type,
         discount_value=payload.discount_value,
         total_amount=total_amount,
-        payment_method=payload.payment_method
+        payment_method=payload.payment_method,
+        shift_id=shift_id,
+        created_at=sold_at
     )
     db.add(new_txn)
-    db.commit()
-    db.refresh(new_txn)
+    # Assigns the id; everything below commits once, together with the sale
+    db.flush()
 
     # 5. Save Items Linked to Transaction
     for txn_item in transaction_items:
         txn_item.transaction_id = new_txn.id
+        # Partition key: items live in the same month partition as their sale
+        txn_item.tenant_id = new_txn.tenant_id
+        txn_item.created_at = sold_at
         db.add(txn_item)
     
-    # 6. Update Customer Stats if customer exists
+    # 6. Queue Customer Stats (applied in batches by customer_stats.Flusher)
     if customer:
-        customer.total_purchases += total_amount
-        customer.last_purchase_date = datetime.now(timezone.utc)
-        # Award loyalty points (1 point per dollar spent)
-        customer.loyalty_points += int(total_amount)
-        db.commit()
+        customer_stats.record_sale(db, customer.id, total_cents, sold_at)
+
+    # 7. Add to the Shift's Running Totals (read back by its Z-report)
+    if shift_id is not None:
+        try:
+            shifts.record_sale(
+                db, shift_id, current_user.id, payload.payment_method, payload.discount_type,
+                items_sold=sum(line.quantity for line in lines),
+                subtotal_cents=subtotal_cents,
+                promotion_cents=sum(line.discount_cents for line in lines),
+                discount_cents=discount_cents,
+                total_cents=total_cents
+            )
+        except ValueError as exc:
+            db.rollback()
+            raise HTTPException(status_code=409, detail=str(exc))
 
+    # 8. Deduct Stock as deltas, so concurrent sales, returns and store
+    # pushes of a product all count; last, as it locks the tenant and
+    # product rows until the commit below
+    db.flush()
+    try:
+        stock = inventory.take_stock(db, current_user.tenant_id, sold)
+    except inventory.OutOfStock as exc:
+        name = products[exc.product_id].name
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Not enough stock for {name}")
+
+    # 9. Queue Post-Sale Jobs (run by jobs.Runner after the response)
+    low_stock = []
+    for product_id, left in stock.items():
+        product_db = products[product_id]
+        min_stock_level = product_db.min_stock_level if product_db.min_stock_level is not None else 5
+        if left + sold[product_id] > min_stock_level >= left:
+            low_stock.append({"id": product_id, "stock_quantity": left, "min_stock_level": min_stock_level})
+    if low_stock:
+        jobs.enqueue(db, "low_stock_alert", {
+            "tenant_id": current_user.tenant_id,
+            "transaction_id": new_txn.id,
+            "products": low_stock,
+        }, tenant_id=current_user.tenant_id)
+
+    transaction_id = new_txn.id
     db.commit()
 
     return {
-        "id": new_txn.id, 
+        "id": transaction_id, 
         "total_amount": total_amount, 
-        "created_at": new_txn.created_at,
+        "created_at": sold_at,
         "message": "Sale successful"
     }
 
 @app.get("/api/v1/transactions", response_model=List[schemas.TransactionDetailResponse])
+@query_budget(3)
 def get_transactions(
     skip: int = 0,
     limit: int = 100,
@@ -769,13 +1390,16 @@ def get_transactions(
     """
     Get transaction history for the current tenant.
     """
-    transactions = db.query(models.Transaction).filter(
+    transactions = db.query(models.Transaction).options(
+        selectinload(models.Transaction.items)
+    ).filter(
         models.Transaction.tenant_id == current_user.tenant_id
     ).order_by(models.Transaction.created_at.desc()).offset(skip).limit(limit).all()
     
     return transactions
 
 @app.get("/api/v1/transactions/{transaction_id}", response_model=schemas.TransactionDetailResponse)
+@query_budget(3)
 def get_transaction(
     transaction_id: int,
     db: Session = Depends(database.get_db),
@@ -784,7 +1408,10 @@ def get_transaction(
     """
     Get detailed information about a specific transaction.
     """
-    transaction = db.query(models.Transaction).filter(
+    transaction = db.query(models.Transaction).options(
+        selectinload(models.Transaction.items),
+        joinedload(models.Transaction.customer)
+    ).filter(
         models.Transaction.id == transaction_id,
         models.Transaction.tenant_id == current_user.tenant_id
     ).first()
@@ -799,18 +1426,104 @@ def get_transaction(
     }
     return response_data
 
-# ==========================================
-# ANALYTICS ENDPOINTS
-# ==========================================
+@app.post("/api/v1/transactions/{transaction_id}/returns", response_model=schemas.ReturnResponse)
+def create_return(
+    transaction_id: int,
+    payload: schemas.ReturnRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Return items of a sale (see returns.py):
+    1. Lock the Sale & Check Quantities Against What Is Left to Return
+    2. Save the Refund (reversal entry with negative amounts)
+    3. Queue Customer Stats
+    4. Add to the Shift's Running Totals
+    5. Restock Returned Items (last, see inventory.py)
+    Responds with every line of the sale, so the counter can carry on with
+    the remaining lines without another request.
+    """
+    # 1. Lock the Sale (concurrent returns of it queue here)
+    sale = returns.get_sale(db, current_user.tenant_id, transaction_id, lock=True)
+    if not sale:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    if sale.refund_of is not None:
+        raise HTTPException(status_code=400, detail=f"Transaction {sale.id} is itself a refund")
+    if sale.origin:
+        raise HTTPException(status_code=409, detail="This sale was rung up on a store server: return it there")
 
-@app.get("/api/v1/analytics/dashboard", response_model=schemas.DashboardStats)
-def get_dashboard_stats(
+    try:
+        shift_id = shifts.sale_shift(db, current_user.tenant_id, current_user.id, payload.shift_id)
+    except LookupError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+    # 2-3. Refund and customer stats
+    refund_method = payload.refund_method or sale.payment_method
+    try:
+        refund = returns.process_return(db, current_user, sale, payload.items, refund_method, shift_id)
+    except ValueError as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    # 4. Add to the Shift's Running Totals (negative amounts)
+    if shift_id is not None:
+        try:
+            shifts.record_sale(
+                db, shift_id, current_user.id, refund_method, sale.discount_type,
+                items_sold=refund.items_sold,
+                subtotal_cents=refund.subtotal_cents,
+                promotion_cents=refund.promotion_cents,
+                discount_cents=refund.discount_cents,
+                total_cents=refund.total_cents,
+                refund=True
+            )
+        except ValueError as exc:
+            db.rollback()
+            raise HTTPException(status_code=409, detail=str(exc))
+
+    response = {
+        "refund_id": refund.transaction.id,
+        "transaction_id": sale.id,
+        "refund_amount": money.from_cents(-refund.total_cents),
+        "total_refunded": money.from_cents(refund.total_refunded_cents),
+        "lines": refund.lines,
+    }
+    # 5. Restock as deltas; last, as it locks the tenant and product rows
+    if refund.restock:
+        inventory.apply_deltas(db, current_user.tenant_id, refund.restock)
+    db.commit()
+    return response
+
+@app.get("/api/v1/transactions/{transaction_id}/returns", response_model=schemas.ReturnResponse)
+@query_budget(5)
+def get_returns(
+    transaction_id: int,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """
-    Get dashboard statistics: today's sales, transactions, low stock items, etc.
+    Lines of a sale with the quantities returned and still returnable.
     """
+    sale = returns.get_sale(db, current_user.tenant_id, transaction_id)
+    if not sale or sale.refund_of is not None:
+        raise HTTPException(status_code=404, detail="Sale not found")
+    return {
+        "transaction_id": sale.id,
+        "total_refunded": money.from_cents(returns.refunded_cents(db, sale)[1]),
+        "lines": returns.return_lines(db, sale),
+    }
+
+# ==========================================
+# ANALYTICS ENDPOINTS
+# ==========================================
+
+# Dashboard and sales aggregates: concurrent identical requests share one
+# computation, and results are reused for a few seconds (see singleflight.py)
+analytics_cache = singleflight.Cache(
+    settings.ANALYTICS_CACHE_SECONDS, settings.ANALYTICS_STALE_SECONDS, database.SessionLocal
+)
+
+def _dashboard_stats(db: Session, tenant_id: int) -> dict:
     today = date.today()
     today_start = datetime.combine(today, datetime.min.time()).replace(tzinfo=timezone.utc)
     today_end = datetime.combine(today, datetime.max.time()).replace(tzinfo=timezone.utc)
@@ -821,7 +1534,7 @@ def get_dashboard_stats(
         func.count(models.Transaction.id).label('transaction_count')
     ).filter(
         and_(
-            models.Transaction.tenant_id == current_user.tenant_id,
+            models.Transaction.tenant_id == tenant_id,
             models.Transaction.created_at >= today_start,
             models.Transaction.created_at <= today_end
         )
@@ -837,7 +1550,7 @@ def get_dashboard_stats(
         func.count(models.Transaction.id).label('transaction_count')
     ).filter(
         and_(
-            models.Transaction.tenant_id == current_user.tenant_id,
+            models.Transaction.tenant_id == tenant_id,
             models.Transaction.created_at >= month_start
         )
     ).first()
@@ -848,14 +1561,14 @@ def get_dashboard_stats(
     # Low stock items
     low_stock_count = db.query(models.Product).filter(
         and_(
-            models.Product.tenant_id == current_user.tenant_id,
+            models.Product.tenant_id == tenant_id,
             models.Product.stock_quantity <= models.Product.min_stock_level
         )
     ).count()
     
     # Total products
     total_products = db.query(models.Product).filter(
-        models.Product.tenant_id == current_user.tenant_id
+        models.Product.tenant_id == tenant_id
     ).count()
     
     return {
@@ -867,15 +1580,20 @@ def get_dashboard_stats(
         "monthly_transactions": monthly_transactions
     }
 
-@app.get("/api/v1/analytics/sales", response_model=List[schemas.SalesAnalytics])
-def get_sales_analytics(
-    days: int = 30,
+@app.get("/api/v1/analytics/dashboard", response_model=schemas.DashboardStats)
+@query_budget(5)
+def get_dashboard_stats(
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """
-    Get daily sales analytics for the last N days.
+    Get dashboard statistics: today's sales, transactions, low stock items, etc.
+    Cached for ANALYTICS_CACHE_SECONDS, so figures may lag the latest sales by that much.
     """
+    tenant_id = current_user.tenant_id
+    return analytics_cache.get(("dashboard", tenant_id), lambda session: _dashboard_stats(session, tenant_id), db)
+
+def _sales_analytics(db: Session, tenant_id: int, days: int) -> list:
     start_date = datetime.now(timezone.utc) - timedelta(days=days)
     
     # Group transactions by date
@@ -885,35 +1603,85 @@ def get_sales_analytics(
         func.count(models.Transaction.id).label('transaction_count')
     ).filter(
         and_(
-            models.Transaction.tenant_id == current_user.tenant_id,
+            models.Transaction.tenant_id == tenant_id,
             models.Transaction.created_at >= start_date
         )
     ).group_by(func.date(models.Transaction.created_at)).order_by('date').all()
     
-    result = []
+    totals = {}
     for row in daily_sales:
-        result.append({
-            "date": row.date.isoformat() if isinstance(row.date, date) else str(row.date),
-            "total_sales": float(row.total_sales or 0),
-            "transaction_count": int(row.transaction_count or 0)
-        })
-    
-    return result
+        day = row.date.isoformat() if isinstance(row.date, date) else str(row.date)
+        totals[day] = [money.to_cents(row.total_sales), int(row.transaction_count or 0)]
+
+    # Ranges reaching past the archive horizon also scan cold storage
+    if start_date < archive.horizon():
+        for day, (total_sales, transaction_count) in archive.daily_sales(db, tenant_id, start_date).items():
+            entry = totals.setdefault(day.isoformat(), [0, 0])
+            entry[0] += money.to_cents(total_sales)
+            entry[1] += transaction_count
+
+    return [
+        {
+            "date": day,
+            "total_sales": float(money.from_cents(total_cents)),
+            "transaction_count": transaction_count
+        }
+        for day, (total_cents, transaction_count) in sorted(totals.items())
+    ]
+
+@app.get("/api/v1/analytics/sales", response_model=List[schemas.SalesAnalytics])
+@query_budget(3)
+def get_sales_analytics(
+    days: int = 30,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Get daily sales analytics for the last N days (cached like the dashboard).
+    """
+    tenant_id = current_user.tenant_id
+    return analytics_cache.get(
+        ("sales", tenant_id, days), lambda session: _sales_analytics(session, tenant_id, days), db
+    )
+
+@app.get(
+    "/api/v1/analytics/forecast",
+    response_model=List[schemas.ProductForecast],
+    response_class=fastjson.ORJSONResponse
+)
+@query_budget(3)
+def get_demand_forecast(
+    history_days: int = Query(84, ge=28, le=365),
+    horizon_days: int = Query(14, ge=1, le=90),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Per-product velocity, weekday seasonality, demand forecast and days of
+    stock left, computed for the whole catalog at once (see forecasting.py).
+    """
+    body = forecasting.cached_report(db, current_user.tenant_id, history_days, horizon_days)
+    return fastjson.RawJSONResponse(body)
 
 # ==========================================
 # RECEIPT ENDPOINTS
 # ==========================================
 
 @app.get("/api/v1/transactions/{transaction_id}/receipt", response_model=schemas.ReceiptData)
+@query_budget(3)
 def get_receipt(
     transaction_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """
     Get receipt data for printing.
     """
-    transaction = db.query(models.Transaction).filter(
+    transaction = db.query(models.Transaction).options(
+        joinedload(models.Transaction.customer)
+    ).filter(
         models.Transaction.id == transaction_id,
         models.Transaction.tenant_id == current_user.tenant_id
     ).first()
@@ -922,6 +1690,10 @@ def get_receipt(
         raise HTTPException(status_code=404, detail="Transaction not found")
     
     tenant = current_user.tenant
+    etag = caching.receipt_etag(transaction, tenant, current_user)
+    if caching.is_not_modified(request, etag):
+        return caching.not_modified(etag)
+    caching.set_etag(response, etag)
     
     return {
         "transaction_id": transaction.id,
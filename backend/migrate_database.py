@@ -1,219 +1,471 @@
 """
 Database Migration Script
-This script migrates the database schema to support:
-1. category_id in products (instead of category string)
-2. customer_id and discount fields in transactions
-3. New customers and categories tables
+Versioned schema migrations, recorded in the schema_version table.
+
+Run once per deploy, out of band (never from app import):
+    python migrate_database.py            # apply pending migrations
+    python migrate_database.py --status   # show applied / latest version
+
+App startup only compares the recorded version with LATEST_VERSION
+(check_schema_version), which is a single cheap query.
+
+Every migration must be idempotent: the baseline builds tables from the
+current models, so on a fresh database later migrations find their
+changes already applied.
 """
-from sqlalchemy import create_engine, text, inspect
-from sqlalchemy.orm import sessionmaker
+import argparse
+import logging
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+
 import database
 import models
+import partitions
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock so concurrent deploys don't race
+MIGRATION_LOCK_KEY = 724011
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# ==========================================
+# HELPERS
+# ==========================================
 
-def migrate_database():
-    """Run database migrations"""
-    # 0. Ensure all base tables exist first
-    print("Initializing base tables...")
-    models.Base.metadata.create_all(bind=database.engine)
+def _columns(conn, table_name):
+    return {col['name'] for col in inspect(conn).get_columns(table_name)}
+
+def _add_column(conn, table_name, column_name, ddl):
+    """ALTER TABLE ... ADD COLUMN unless it already exists"""
+    if column_name not in _columns(conn, table_name):
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}"))
+        print(f"✓ Added {table_name}.{column_name}")
+
+def _is_postgres(conn):
+    return conn.dialect.name == "postgresql"
+
+# ==========================================
+# MIGRATIONS
+# ==========================================
+
+def _migration_001_baseline(conn):
+    """
+    Base tables plus the legacy upgrades for databases created before
+    categories/customers/discounts existed:
+    1. category_id in products (instead of category string)
+    2. customer_id and discount fields in transactions
+    3. New customers and categories tables
+    """
+    inspector = inspect(conn)
+    existing_tables = inspector.get_table_names()
+    models.Base.metadata.create_all(bind=conn)
+    if 'products' not in existing_tables:
+        # Fresh database: create_all built the current schema
+        return
+    inspector = inspect(conn)
+
+    # 1. Create categories table if it doesn't exist
+    if 'categories' not in inspector.get_table_names():
+        print("Creating categories table...")
+        conn.execute(text("""
+            CREATE TABLE categories (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR NOT NULL,
+                description VARCHAR,
+                tenant_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (tenant_id) REFERENCES tenants(id)
+            );
+            CREATE INDEX idx_categories_tenant ON categories(tenant_id);
+            CREATE INDEX idx_categories_name ON categories(name);
+        """))
+        print("✓ Categories table created")
+    else:
+        print("✓ Categories table already exists")
     
-    engine = database.engine
-    inspector = inspect(engine)
+    # 2. Create customers table if it doesn't exist
+    if 'customers' not in inspector.get_table_names():
+        print("Creating customers table...")
+        conn.execute(text("""
+            CREATE TABLE customers (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR NOT NULL,
+                email VARCHAR,
+                phone VARCHAR,
+                address VARCHAR,
+                city VARCHAR,
+                state VARCHAR,
+                loyalty_points INTEGER DEFAULT 0,
+                total_purchases FLOAT DEFAULT 0.0,
+                last_purchase_date TIMESTAMP,
+                tenant_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (tenant_id) REFERENCES tenants(id)
+            );
+            CREATE INDEX idx_customers_tenant ON customers(tenant_id);
+            CREATE INDEX idx_customers_name ON customers(name);
+            CREATE INDEX idx_customers_email ON customers(email);
+            CREATE INDEX idx_customers_phone ON customers(phone);
+        """))
+        print("✓ Customers table created")
+    else:
+        print("✓ Customers table already exists")
     
-    with engine.connect() as conn:
-        # Start transaction
-        trans = conn.begin()
+    # 3. Check if products table has category_id column
+    products_columns = [col['name'] for col in inspector.get_columns('products')]
+    
+    if 'category_id' not in products_columns:
+        print("Migrating products table...")
         
-        try:
-            # 1. Create categories table if it doesn't exist
-            if 'categories' not in inspector.get_table_names():
-                print("Creating categories table...")
-                conn.execute(text("""
-                    CREATE TABLE categories (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR NOT NULL,
-                        description VARCHAR,
-                        tenant_id INTEGER NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (tenant_id) REFERENCES tenants(id)
-                    );
-                    CREATE INDEX idx_categories_tenant ON categories(tenant_id);
-                    CREATE INDEX idx_categories_name ON categories(name);
-                """))
-                print("✓ Categories table created")
-            else:
-                print("✓ Categories table already exists")
+        # Add category_id column
+        conn.execute(text("""
+            ALTER TABLE products 
+            ADD COLUMN category_id INTEGER;
+        """))
+        print("✓ Added category_id column to products")
+        
+        # Migrate existing category strings to categories table
+        # Get unique categories from products
+        result = conn.execute(text("""
+            SELECT DISTINCT category, tenant_id 
+            FROM products 
+            WHERE category IS NOT NULL AND category != ''
+        """))
+        
+        category_mapping = {}  # {tenant_id: {category_name: category_id}}
+        
+        for row in result:
+            category_name = row[0]
+            tenant_id = row[1]
             
-            # 2. Create customers table if it doesn't exist
-            if 'customers' not in inspector.get_table_names():
-                print("Creating customers table...")
-                conn.execute(text("""
-                    CREATE TABLE customers (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR NOT NULL,
-                        email VARCHAR,
-                        phone VARCHAR,
-                        address VARCHAR,
-                        city VARCHAR,
-                        state VARCHAR,
-                        loyalty_points INTEGER DEFAULT 0,
-                        total_purchases FLOAT DEFAULT 0.0,
-                        last_purchase_date TIMESTAMP,
-                        tenant_id INTEGER NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (tenant_id) REFERENCES tenants(id)
-                    );
-                    CREATE INDEX idx_customers_tenant ON customers(tenant_id);
-                    CREATE INDEX idx_customers_name ON customers(name);
-                    CREATE INDEX idx_customers_email ON customers(email);
-                    CREATE INDEX idx_customers_phone ON customers(phone);
-                """))
-                print("✓ Customers table created")
-            else:
-                print("✓ Customers table already exists")
+            if tenant_id not in category_mapping:
+                category_mapping[tenant_id] = {}
             
-            # 3. Check if products table has category_id column
-            products_columns = [col['name'] for col in inspector.get_columns('products')]
+            # Check if category already exists
+            check = conn.execute(text("""
+                SELECT id FROM categories 
+                WHERE name = :name AND tenant_id = :tenant_id
+            """), {"name": category_name, "tenant_id": tenant_id})
             
-            if 'category_id' not in products_columns:
-                print("Migrating products table...")
-                
-                # Add category_id column
-                conn.execute(text("""
-                    ALTER TABLE products 
-                    ADD COLUMN category_id INTEGER;
-                """))
-                print("✓ Added category_id column to products")
-                
-                # Migrate existing category strings to categories table
-                # Get unique categories from products
-                result = conn.execute(text("""
-                    SELECT DISTINCT category, tenant_id 
-                    FROM products 
-                    WHERE category IS NOT NULL AND category != ''
-                """))
-                
-                category_mapping = {}  # {tenant_id: {category_name: category_id}}
-                
-                for row in result:
-                    category_name = row[0]
-                    tenant_id = row[1]
-                    
-                    if tenant_id not in category_mapping:
-                        category_mapping[tenant_id] = {}
-                    
-                    # Check if category already exists
-                    check = conn.execute(text("""
-                        SELECT id FROM categories 
-                        WHERE name = :name AND tenant_id = :tenant_id
-                    """), {"name": category_name, "tenant_id": tenant_id})
-                    
-                    existing = check.fetchone()
-                    
-                    if existing:
-                        category_id = existing[0]
-                    else:
-                        # Create new category
-                        insert = conn.execute(text("""
-                            INSERT INTO categories (name, tenant_id) 
-                            VALUES (:name, :tenant_id) 
-                            RETURNING id
-                        """), {"name": category_name, "tenant_id": tenant_id})
-                        category_id = insert.fetchone()[0]
-                    
-                    category_mapping[tenant_id][category_name] = category_id
-                
-                # Update products with category_id
-                for tenant_id, categories in category_mapping.items():
-                    for category_name, category_id in categories.items():
-                        conn.execute(text("""
-                            UPDATE products 
-                            SET category_id = :category_id 
-                            WHERE category = :category_name AND tenant_id = :tenant_id
-                        """), {
-                            "category_id": category_id,
-                            "category_name": category_name,
-                            "tenant_id": tenant_id
-                        })
-                
-                print(f"✓ Migrated {sum(len(cats) for cats in category_mapping.values())} categories")
-                
-                # Add foreign key constraint
-                conn.execute(text("""
-                    ALTER TABLE products 
-                    ADD CONSTRAINT fk_products_category 
-                    FOREIGN KEY (category_id) REFERENCES categories(id);
-                """))
-                print("✓ Added foreign key constraint")
-                
-                # Optionally, keep old category column for backward compatibility
-                # Or remove it: ALTER TABLE products DROP COLUMN category;
-                print("✓ Products table migration complete")
+            existing = check.fetchone()
+            
+            if existing:
+                category_id = existing[0]
             else:
-                print("✓ Products table already has category_id column")
+                # Create new category
+                insert = conn.execute(text("""
+                    INSERT INTO categories (name, tenant_id) 
+                    VALUES (:name, :tenant_id) 
+                    RETURNING id
+                """), {"name": category_name, "tenant_id": tenant_id})
+                category_id = insert.fetchone()[0]
             
-            # Check for is_active column in products
-            if 'is_active' not in products_columns:
-                print("Adding is_active column to products...")
+            category_mapping[tenant_id][category_name] = category_id
+        
+        # Update products with category_id
+        for tenant_id, categories in category_mapping.items():
+            for category_name, category_id in categories.items():
                 conn.execute(text("""
-                    ALTER TABLE products 
-                    ADD COLUMN is_active BOOLEAN DEFAULT TRUE;
-                """))
-                print("✓ Added is_active column to products")
-            
-            # 4. Check and update transactions table
-            if 'transactions' in inspector.get_table_names():
-                trans_columns = [col['name'] for col in inspector.get_columns('transactions')]
-                
-                # Add customer_id if missing
-                if 'customer_id' not in trans_columns:
-                    print("Adding customer_id to transactions...")
-                    conn.execute(text("""
-                        ALTER TABLE transactions 
-                        ADD COLUMN customer_id INTEGER;
-                        ALTER TABLE transactions 
-                        ADD CONSTRAINT fk_transactions_customer 
-                        FOREIGN KEY (customer_id) REFERENCES customers(id);
-                    """))
-                    print("✓ Added customer_id to transactions")
-                
-                # Add discount fields if missing
-                if 'subtotal' not in trans_columns:
-                    print("Adding discount fields to transactions...")
-                    conn.execute(text("""
-                        ALTER TABLE transactions 
-                        ADD COLUMN subtotal FLOAT NOT NULL DEFAULT 0;
-                        ALTER TABLE transactions 
-                        ADD COLUMN discount_amount FLOAT DEFAULT 0;
-                        ALTER TABLE transactions 
-                        ADD COLUMN discount_type VARCHAR;
-                        ALTER TABLE transactions 
-                        ADD COLUMN discount_value FLOAT;
-                    """))
-                    
-                    # Update existing transactions: set subtotal = total_amount
-                    conn.execute(text("""
-                        UPDATE transactions 
-                        SET subtotal = total_amount 
-                        WHERE subtotal = 0;
-                    """))
-                    print("✓ Added discount fields to transactions")
+                    UPDATE products 
+                    SET category_id = :category_id 
+                    WHERE category = :category_name AND tenant_id = :tenant_id
+                """), {
+                    "category_id": category_id,
+                    "category_name": category_name,
+                    "tenant_id": tenant_id
+                })
+        
+        print(f"✓ Migrated {sum(len(cats) for cats in category_mapping.values())} categories")
+        
+        # Add foreign key constraint
+        conn.execute(text("""
+            ALTER TABLE products 
+            ADD CONSTRAINT fk_products_category 
+            FOREIGN KEY (category_id) REFERENCES categories(id);
+        """))
+        print("✓ Added foreign key constraint")
+        
+        # Optionally, keep old category column for backward compatibility
+        # Or remove it: ALTER TABLE products DROP COLUMN category;
+        print("✓ Products table migration complete")
+    else:
+        print("✓ Products table already has category_id column")
+    
+    # Check for is_active column in products
+    if 'is_active' not in products_columns:
+        print("Adding is_active column to products...")
+        conn.execute(text("""
+            ALTER TABLE products 
+            ADD COLUMN is_active BOOLEAN DEFAULT TRUE;
+        """))
+        print("✓ Added is_active column to products")
+    
+    # 4. Check and update transactions table
+    if 'transactions' in inspector.get_table_names():
+        trans_columns = [col['name'] for col in inspector.get_columns('transactions')]
+        
+        # Add customer_id if missing
+        if 'customer_id' not in trans_columns:
+            print("Adding customer_id to transactions...")
+            conn.execute(text("""
+                ALTER TABLE transactions 
+                ADD COLUMN customer_id INTEGER;
+                ALTER TABLE transactions 
+                ADD CONSTRAINT fk_transactions_customer 
+                FOREIGN KEY (customer_id) REFERENCES customers(id);
+            """))
+            print("✓ Added customer_id to transactions")
+        
+        # Add discount fields if missing
+        if 'subtotal' not in trans_columns:
+            print("Adding discount fields to transactions...")
+            conn.execute(text("""
+                ALTER TABLE transactions 
+                ADD COLUMN subtotal FLOAT NOT NULL DEFAULT 0;
+                ALTER TABLE transactions 
+                ADD COLUMN discount_amount FLOAT DEFAULT 0;
+                ALTER TABLE transactions 
+                ADD COLUMN discount_type VARCHAR;
+                ALTER TABLE transactions 
+                ADD COLUMN discount_value FLOAT;
+            """))
             
-            # Commit transaction
-            trans.commit()
-            print("\n✅ Database migration completed successfully!")
+            # Update existing transactions: set subtotal = total_amount
+            conn.execute(text("""
+                UPDATE transactions 
+                SET subtotal = total_amount 
+                WHERE subtotal = 0;
+            """))
+            print("✓ Added discount fields to transactions")
+
+def _migration_002_catalog_versions(conn):
+    """Catalog version counters on tenants (used for ETags)"""
+    _add_column(conn, "tenants", "product_version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(conn, "tenants", "category_version", "INTEGER NOT NULL DEFAULT 1")
+
+# Money columns moved from double precision to NUMERIC(12, 2)
+MONEY_COLUMNS = {
+    "products": ("cost_price", "selling_price"),
+    "customers": ("total_purchases",),
+    "transactions": ("subtotal", "discount_amount", "total_amount"),
+    "transaction_items": ("unit_price", "total_price"),
+}
+
+def _migration_003_money_numeric(conn):
+    """Fixed-point money columns (SQLite stores them by affinity; nothing to do)"""
+    if not _is_postgres(conn):
+        return
+    inspector = inspect(conn)
+    for table_name, money_columns in MONEY_COLUMNS.items():
+        types = {col['name']: col['type'] for col in inspector.get_columns(table_name)}
+        for column_name in money_columns:
+            if getattr(types[column_name], "scale", None) == 2:
+                continue
+            conn.execute(text(
+                f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE NUMERIC(12, 2) "
+                f"USING ROUND({column_name}::numeric, 2)"
+            ))
+            print(f"✓ {table_name}.{column_name} is now NUMERIC(12, 2)")
+
+def _migration_004_partitioned_sales(conn):
+    """Denormalize created_at/tenant_id onto items; monthly partitions on PostgreSQL"""
+    _add_column(conn, "transaction_items", "tenant_id", "INTEGER REFERENCES tenants(id)")
+    _add_column(conn, "transaction_items", "created_at", "TIMESTAMP")
+    conn.execute(text("""
+        UPDATE transaction_items
+        SET tenant_id = (SELECT t.tenant_id FROM transactions t WHERE t.id = transaction_items.transaction_id),
+            created_at = (SELECT t.created_at FROM transactions t WHERE t.id = transaction_items.transaction_id)
+        WHERE created_at IS NULL OR tenant_id IS NULL
+    """))
+
+    if _is_postgres(conn):
+        if not partitions.is_partitioned(conn, "transactions"):
+            partitions.convert_to_partitioned(conn)
+            print("✓ transactions and transaction_items are now partitioned by month")
+        return
+
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_tenant_created ON transactions (tenant_id, created_at)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transaction_items_tenant_created ON transaction_items (tenant_id, created_at)"
+    ))
+
+def _migration_005_daily_sales_summary(conn):
+    """Rollup rows left behind by the sales archiver"""
+    models.DailySalesSummary.__table__.create(conn, checkfirst=True)
+
+def _migration_006_customer_stat_deltas(conn):
+    """Outbox of pending customer stat changes"""
+    models.CustomerStatDelta.__table__.create(conn, checkfirst=True)
+
+def _migration_007_jobs(conn):
+    """Background job outbox and stock alerts"""
+    models.Job.__table__.create(conn, checkfirst=True)
+    models.StockAlert.__table__.create(conn, checkfirst=True)
+
+def _migration_008_product_associations(conn):
+    """Frequently-bought-together results"""
+    models.ProductAssociation.__table__.create(conn, checkfirst=True)
+
+def _migration_009_barcode_schemes(conn):
+    """Product PLU codes and per-tenant variable-measure barcode schemes"""
+    _add_column(conn, "products", "plu", "VARCHAR")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_tenant_plu ON products (tenant_id, plu)"))
+    models.BarcodeScheme.__table__.create(conn, checkfirst=True)
+
+def _migration_010_promotions(conn):
+    """Promotions, per-line promotion savings and the pricing cache version"""
+    _add_column(conn, "tenants", "pricing_version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(conn, "transaction_items", "discount_amount", "NUMERIC(12, 2) NOT NULL DEFAULT 0")
+    _add_column(conn, "transaction_items", "promotion_id", "INTEGER")
+    models.Promotion.__table__.create(conn, checkfirst=True)
+
+def _migration_011_edge_sync(conn):
+    """Change cursors and sale origins for store-local edge servers"""
+    _add_column(conn, "products", "sync_version", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_products_tenant_sync_version ON products (tenant_id, sync_version)"
+    ))
+    _add_column(conn, "transactions", "origin", "VARCHAR")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_origin ON transactions (origin)"))
+    models.SyncState.__table__.create(conn, checkfirst=True)
+
+def _migration_012_shifts(conn):
+    """Till shifts with running totals, Z-reports and transactions.shift_id"""
+    models.Shift.__table__.create(conn, checkfirst=True)
+    models.ShiftTotal.__table__.create(conn, checkfirst=True)
+    models.ZReport.__table__.create(conn, checkfirst=True)
+    _add_column(conn, "transactions", "shift_id", "INTEGER")
+
+def _migration_013_refunds(conn):
+    """Refund reversal entries and shift refund totals"""
+    _add_column(conn, "transactions", "refund_of", "INTEGER")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_refund_of ON transactions (refund_of)"))
+    _add_column(conn, "transaction_items", "refund_of", "INTEGER")
+    _add_column(conn, "transaction_items", "restocked", "BOOLEAN")
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transaction_items_refund_of ON transaction_items (refund_of)"
+    ))
+    _add_column(conn, "shifts", "refund_count", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "shifts", "refund_total", "NUMERIC(12, 2) NOT NULL DEFAULT 0")
+
+def _migration_014_tenant_time_zone(conn):
+    """Store time zone for local promotion windows"""
+    _add_column(conn, "tenants", "time_zone", "VARCHAR NOT NULL DEFAULT 'UTC'")
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "baseline schema and legacy category/customer/discount upgrades", _migration_001_baseline),
+    (2, "tenant catalog version counters", _migration_002_catalog_versions),
+    (3, "money columns as NUMERIC(12, 2)", _migration_003_money_numeric),
+    (4, "monthly partitioned transactions and transaction_items", _migration_004_partitioned_sales),
+    (5, "daily_sales_summary for archived sales", _migration_005_daily_sales_summary),
+    (6, "customer_stat_deltas outbox", _migration_006_customer_stat_deltas),
+    (7, "jobs outbox and stock_alerts", _migration_007_jobs),
+    (8, "product_associations", _migration_008_product_associations),
+    (9, "products.plu and barcode_schemes", _migration_009_barcode_schemes),
+    (10, "promotions and transaction_items.discount_amount", _migration_010_promotions),
+    (11, "products.sync_version, transactions.origin and sync_state", _migration_011_edge_sync),
+    (12, "shifts, shift_totals, z_reports and transactions.shift_id", _migration_012_shifts),
+    (13, "refund_of on transactions and items, shift refund totals", _migration_013_refunds),
+    (14, "tenants.time_zone", _migration_014_tenant_time_zone),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# ==========================================
+# RUNNER
+# ==========================================
+
+def current_version(conn) -> int:
+    """Highest applied migration, 0 for an unversioned database"""
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def migrate_database(engine=None, target=None):
+    """Apply pending migrations in order, each in its own transaction"""
+    engine = engine or database.engine
+    target = target or LATEST_VERSION
+
+    with engine.connect() as conn:
+        if _is_postgres(conn):
+            # Serialize concurrent runners (e.g. two deploys racing)
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+        try:
+            with conn.begin():
+                schema_version.create(conn, checkfirst=True)
+            applied = current_version(conn)
+            conn.commit()
+            print(f"Schema version: {applied} (latest {LATEST_VERSION})")
+
+            for version, description, migration in MIGRATIONS:
+                if version <= applied or version > target:
+                    continue
+                print(f"Applying migration {version}: {description}...")
+                with conn.begin():
+                    migration(conn)
+                    conn.execute(schema_version.insert().values(
+                        version=version,
+                        description=description,
+                        applied_at=datetime.now(timezone.utc)
+                    ))
+                print(f"✓ Migration {version} applied")
+
+            print("\n✅ Database is up to date!")
             return True
-            
-        except Exception as e:
-            trans.rollback()
-            # Check if error is because columns already exist
-            error_str = str(e).lower()
-            if 'already exists' in error_str or 'duplicate' in error_str:
-                print(f"\n✓ Migration already completed (columns exist)")
-                return True
-            else:
-                print(f"\n❌ Migration failed: {e}")
-                raise
+        finally:
+            if _is_postgres(conn):
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                conn.commit()
+
+def check_schema_version(engine=None):
+    """
+    Cheap startup check: one query against schema_version.
+    SCHEMA_CHECK=strict refuses to start on a stale schema, warn only logs.
+    """
+    if settings.SCHEMA_CHECK == "off":
+        return
+    engine = engine or database.engine
+    try:
+        with engine.connect() as conn:
+            applied = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except Exception as e:
+        applied = 0
+        logger.debug(f"schema_version not readable: {e}")
+
+    if applied >= LATEST_VERSION:
+        return
+    message = (
+        f"Database schema is at version {applied}, code expects {LATEST_VERSION}. "
+        f"Run: python migrate_database.py"
+    )
+    if settings.SCHEMA_CHECK == "strict":
+        raise RuntimeError(message)
+    logger.warning(message)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply versioned database migrations")
+    parser.add_argument("--status", action="store_true", help="show applied and latest version")
+    parser.add_argument("--target", type=int, help="migrate up to this version only")
+    args = parser.parse_args()
+
+    if args.status:
+        with database.engine.connect() as conn:
+            print(f"Applied: {current_version(conn)}  Latest: {LATEST_VERSION}")
+            sys.exit(0 if current_version(conn) >= LATEST_VERSION else 1)
+
     print("Starting database migration...\n")
-    migrate_database()
+    migrate_database(target=args.target)
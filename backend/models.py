@@ -1,6 +1,10 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Float, event
+from sqlalchemy import (
+    Column, Integer, String, Text, ForeignKey, Date, DateTime, Time, Boolean, Float, Index, JSON,
+    UniqueConstraint, event, select, text
+)
 from sqlalchemy.orm import relationship
 from database import Base
+from money import Money
 from datetime import datetime, timezone
 import uuid
 
@@ -25,6 +29,14 @@ class Tenant(Base):
     plan_id = Column(String, default="basic")
     subscription_status = Column(String, default="active")
     
+    # Bumped on writes; used to build ETags for catalog responses
+    product_version = Column(Integer, default=1, nullable=False, server_default="1")
+    category_version = Column(Integer, default=1, nullable=False, server_default="1")
+    # Bumped on price/promotion changes; keys the compiled pricing cache (see promotions.py)
+    pricing_version = Column(Integer, default=1, nullable=False, server_default="1")
+    # IANA zone of the store; promotion time windows and weekdays are local (see promotions.py)
+    time_zone = Column(String, default="UTC", nullable=False, server_default="UTC")
+    
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
     users = relationship("User", back_populates="tenant")
@@ -75,8 +87,8 @@ class Product(Base):
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     category = relationship("Category", back_populates="products")
     
-    cost_price = Column(Float)  
-    selling_price = Column(Float, nullable=False) 
+    cost_price = Column(Money)  
+    selling_price = Column(Money, nullable=False) 
     stock_quantity = Column(Integer, default=0)
     
     min_stock_level = Column(Integer, default=5) 
@@ -85,6 +97,68 @@ class Product(Base):
     tenant = relationship("Tenant", back_populates="products")
     
     is_active = Column(Boolean, default=True)
+
+    # Price look-up code of weighed/priced-by-label items (see barcodes.py)
+    plu = Column(String, nullable=True)
+
+    # tenants.product_version of the last write; the edge pull cursor (see sync.py)
+    sync_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_products_tenant_plu", "tenant_id", "plu"),
+        Index("ix_products_tenant_sync_version", "tenant_id", "sync_version"),
+    )
+
+class Promotion(Base):
+    """
+    A pricing rule (see promotions.py). Targets one product, one category,
+    or the whole store when both are empty.
+    """
+    __tablename__ = "promotions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
+    name = Column(String, nullable=False)
+    kind = Column(String, nullable=False) # 'percentage', 'bogo' or 'multi_buy'
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+
+    percent = Column(Float, nullable=True) # percentage: % off the line
+    buy_quantity = Column(Integer, nullable=True) # bogo / multi_buy: units per deal
+    get_quantity = Column(Integer, nullable=True) # bogo: free units per deal
+    bundle_price = Column(Money, nullable=True) # multi_buy: price of buy_quantity units
+
+    # Conditions: all optional
+    starts_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+    daily_start = Column(Time, nullable=True) # e.g. happy hour 17:00-19:00
+    daily_end = Column(Time, nullable=True)
+    days_of_week = Column(String, nullable=True) # "0123456", Monday = 0
+    min_loyalty_points = Column(Integer, nullable=True) # customer tier
+
+    is_active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class BarcodeScheme(Base):
+    """
+    A tenant's variable-measure barcode layout (see barcodes.py): codes of
+    `length` digits starting with `prefix` carry a PLU and a weight or price
+    at the given digit offsets.
+    """
+    __tablename__ = "barcode_schemes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
+    name = Column(String, nullable=False)
+    prefix = Column(String, nullable=False) # e.g. "21"
+    length = Column(Integer, nullable=False, default=13)
+    plu_start = Column(Integer, nullable=False)
+    plu_length = Column(Integer, nullable=False)
+    value_start = Column(Integer, nullable=False)
+    value_length = Column(Integer, nullable=False)
+    value_type = Column(String, nullable=False) # 'weight' (per-kg price) or 'price' (line price)
+    value_decimals = Column(Integer, nullable=False) # e.g. 3: grams -> kg, 2: cents
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
    
 # ... existing imports ...
 
@@ -99,7 +173,7 @@ class Customer(Base):
     city = Column(String, nullable=True)
     state = Column(String, nullable=True)
     loyalty_points = Column(Integer, default=0)
-    total_purchases = Column(Float, default=0.0)
+    total_purchases = Column(Money, default=0)
     last_purchase_date = Column(DateTime, nullable=True)
     
     tenant_id = Column(Integer, ForeignKey("tenants.id"))
@@ -108,6 +182,19 @@ class Customer(Base):
     
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
+class CustomerStatDelta(Base):
+    """
+    Pending change to a customer's purchase stats, written with the sale and
+    folded into the customers row in batches (see customer_stats.py)
+    """
+    __tablename__ = "customer_stat_deltas"
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True)
+    amount = Column(Money, nullable=False)
+    loyalty_points = Column(Integer, nullable=False, default=0)
+    purchased_at = Column(DateTime, nullable=False)
+
 class Transaction(Base):
     __tablename__ = "transactions"
 
@@ -116,19 +203,157 @@ class Transaction(Base):
     user_id = Column(Integer, ForeignKey("users.id")) # Cashier
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=True)
     
-    subtotal = Column(Float, nullable=False)
-    discount_amount = Column(Float, default=0.0)
+    subtotal = Column(Money, nullable=False)
+    discount_amount = Column(Money, default=0)
     discount_type = Column(String, nullable=True) # 'percentage' or 'fixed'
     discount_value = Column(Float, nullable=True)
-    total_amount = Column(Float, nullable=False)
+    total_amount = Column(Money, nullable=False)
     payment_method = Column(String, default="cash") # cash, card, upi
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # "<edge node>:<local id>" for sales replicated from a store server (see sync.py)
+    origin = Column(String, nullable=True)
+    # Till shift the sale was rung up in (see shifts.py); no FK, shifts are store-local
+    shift_id = Column(Integer, nullable=True)
+    # Set on refunds: the sale this reversal entry (negative amounts) refunds (see returns.py)
+    refund_of = Column(Integer, nullable=True)
     
     # Relationships
     items = relationship("TransactionItem", back_populates="transaction")
     cashier = relationship("User", back_populates="transactions")
     customer = relationship("Customer", back_populates="transactions")
 
+    # On PostgreSQL the table is range-partitioned by month on created_at
+    # (see partitions.py) and this index is created per partition
+    __table_args__ = (
+        Index("ix_transactions_tenant_created", "tenant_id", "created_at"),
+        Index("ix_transactions_origin", "origin"),
+        Index("ix_transactions_refund_of", "refund_of"),
+    )
+
+class Shift(Base):
+    """
+    A session on one till (see shifts.py). Sales rung up while it
+    is open add to its running totals; closing it writes a ZReport.
+    """
+    __tablename__ = "shifts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    till = Column(String, nullable=False, default="main")
+    status = Column(String, nullable=False, default="open") # 'open' or 'closed'
+    opened_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    closed_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    opened_at = Column(DateTime, nullable=False)
+    closed_at = Column(DateTime, nullable=True)
+    opening_float = Column(Money, nullable=False, default=0) # cash in the drawer at open
+
+    # Running totals, incremented by every sale
+    transaction_count = Column(Integer, nullable=False, default=0)
+    items_sold = Column(Integer, nullable=False, default=0)
+    subtotal = Column(Money, nullable=False, default=0) # after promotions
+    promotion_savings = Column(Money, nullable=False, default=0)
+    discount_total = Column(Money, nullable=False, default=0) # basket-level discounts
+    total_amount = Column(Money, nullable=False, default=0) # net of refunds
+    refund_count = Column(Integer, nullable=False, default=0)
+    refund_total = Column(Money, nullable=False, default=0)
+
+    __table_args__ = (
+        # One open shift per till
+        Index(
+            "ux_shifts_open_till", "tenant_id", "till", unique=True,
+            postgresql_where=text("status = 'open'"), sqlite_where=text("status = 'open'")
+        ),
+        Index("ix_shifts_tenant_opened", "tenant_id", "opened_at"),
+    )
+
+class ShiftTotal(Base):
+    """
+    Running total of a shift per cashier, payment method or discount type.
+    amount is the sales total, or for discount types the discount given.
+    """
+    __tablename__ = "shift_totals"
+
+    shift_id = Column(Integer, ForeignKey("shifts.id"), primary_key=True)
+    dimension = Column(String, primary_key=True) # 'cashier', 'payment_method' or 'discount_type'
+    key = Column(String, primary_key=True)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    amount = Column(Money, nullable=False, default=0)
+
+class ZReport(Base):
+    """End-of-shift report, written once when the shift closes and never changed"""
+    __tablename__ = "z_reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    shift_id = Column(Integer, ForeignKey("shifts.id"), nullable=False, unique=True)
+    till = Column(String, nullable=False)
+    number = Column(Integer, nullable=False) # sequential per till
+    report = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (UniqueConstraint("tenant_id", "till", "number"),)
+
+class DailySalesSummary(Base):
+    """Per-day totals for sales moved to cold storage (see archive.py)"""
+    __tablename__ = "daily_sales_summary"
+
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    total_sales = Column(Money, nullable=False)
+    discount_total = Column(Money, nullable=False, default=0)
+    transaction_count = Column(Integer, nullable=False)
+    items_sold = Column(Integer, nullable=False)
+
+class Job(Base):
+    """Background job outbox row (see jobs.py)"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=True)
+    status = Column(String, nullable=False, default="pending") # pending, running, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False) # due time, or lease expiry while running
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+
+class StockAlert(Base):
+    """A sale took a product to or below its minimum stock level"""
+    __tablename__ = "stock_alerts"
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    transaction_id = Column(Integer, nullable=True)
+    stock_quantity = Column(Integer, nullable=False)
+    min_stock_level = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class ProductAssociation(Base):
+    """Frequently-bought-together partner of a product (see basket.py)"""
+    __tablename__ = "product_associations"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    associated_product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
+    rank = Column(Integer, nullable=False) # 1 = strongest by lift
+    pair_count = Column(Integer, nullable=False) # baskets containing both
+    support = Column(Float, nullable=False)
+    confidence = Column(Float, nullable=False)
+    lift = Column(Float, nullable=False)
+    computed_at = Column(DateTime, nullable=False)
+
+class SyncState(Base):
+    """Replication cursors of a store-local edge database (see sync.py)"""
+    __tablename__ = "sync_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+
 # Event listener to auto-generate store_code if None
 @event.listens_for(Tenant, 'before_insert')
 def receive_before_insert(mapper, connection, target):
@@ -136,6 +361,18 @@ def receive_before_insert(mapper, connection, target):
     if target.store_code is None:
         target.store_code = generate_store_code()
 
+@event.listens_for(Product, 'before_insert')
+@event.listens_for(Product, 'before_update')
+def stamp_sync_version(mapper, connection, target):
+    """
+    Stamp product writes with the tenant's product_version, which every
+    catalog and stock write bumps earlier in the same transaction (see
+    caching.bump_versions). Edge servers pull products past their cursor.
+    """
+    target.sync_version = (
+        select(Tenant.product_version).where(Tenant.id == target.tenant_id).scalar_subquery()
+    )
+
 class TransactionItem(Base):
     __tablename__ = "transaction_items"
 
@@ -145,7 +382,20 @@ class TransactionItem(Base):
     
     product_name = Column(String) # Snapshot of name at time of sale
     quantity = Column(Integer, nullable=False)
-    unit_price = Column(Float, nullable=False) # Snapshot of price at time of sale
-    total_price = Column(Float, nullable=False) # qty * unit_price
+    unit_price = Column(Money, nullable=False) # Snapshot of price at time of sale
+    total_price = Column(Money, nullable=False) # qty * unit_price - discount_amount
+    discount_amount = Column(Money, nullable=False, default=0, server_default="0") # promotion savings
+    # Promotion applied to the line; no FK so promotions can be deleted later
+    promotion_id = Column(Integer, nullable=True)
+    # Refund lines: the sale line returned (quantity and amounts are negative),
+    # and whether the units went back on the shelf
+    refund_of = Column(Integer, nullable=True, index=True)
+    restocked = Column(Boolean, nullable=True)
+
+    # Copied from the parent transaction so items are co-partitioned with it
+    tenant_id = Column(Integer, ForeignKey("tenants.id"))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
-    transaction = relationship("Transaction", back_populates="items")    
\ No newline at end of file
+    transaction = relationship("Transaction", back_populates="items")
+
+    __table_args__ = (Index("ix_transaction_items_tenant_created", "tenant_id", "created_at"),)    
\ No newline at end of file
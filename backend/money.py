@@ -0,0 +1,43 @@
+"""
+Fixed-point money handling.
+
+Money columns are NUMERIC(12, 2) so that SQL aggregates are exact, and
+checkout math runs on integer minor units (cents): no float drift, and
+integer arithmetic in the hot path.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Union
+
+from sqlalchemy import Numeric
+
+# Column type for every monetary amount
+Money = Numeric(12, 2)
+
+MINOR_UNITS = 100
+
+_CENT = Decimal("0.01")
+
+Number = Union[int, float, Decimal, str]
+
+def to_cents(amount: Number) -> int:
+    """Convert an amount (Decimal, float from JSON, str) to integer cents, rounding half up"""
+    if amount is None:
+        return 0
+    if not isinstance(amount, Decimal):
+        # str() first so 0.1 becomes Decimal('0.1'), not its binary expansion
+        amount = Decimal(str(amount))
+    return int(amount.quantize(_CENT, rounding=ROUND_HALF_UP) * MINOR_UNITS)
+
+def from_cents(cents: int) -> Decimal:
+    """Integer cents to a 2-place Decimal, ready for a Money column"""
+    return Decimal(cents).scaleb(-2).quantize(_CENT)
+
+def percentage_of(cents: int, percent: Number) -> int:
+    """`percent`% of an amount in cents, rounded half up to a whole cent"""
+    share = Decimal(cents) * Decimal(str(percent)) / 100
+    return int(share.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def whole_units(cents: int) -> int:
+    """Whole currency units in an amount, truncated toward zero (refunds mirror sales)"""
+    units = abs(cents) // MINOR_UNITS
+    return units if cents >= 0 else -units
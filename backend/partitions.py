@@ -0,0 +1,191 @@
+"""
+Monthly range partitions for transactions and transaction_items (PostgreSQL).
+
+Both tables are partitioned by created_at; transaction_items carries a
+denormalized copy of its sale's created_at and tenant_id so the two tables
+are co-partitioned and date-filtered analytics prune to the months they
+touch. A DEFAULT partition catches rows outside the prepared range.
+
+Maintenance (run daily from cron or the job runner):
+    python partitions.py ensure --months-ahead 3   # create upcoming months
+    python partitions.py detach --older-than 24    # move old months to the archive schema
+    python partitions.py list
+"""
+import argparse
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+PARTITIONED_TABLES = ("transactions", "transaction_items")
+
+# Detached partitions are moved here: out of the hot tables, still queryable
+ARCHIVE_SCHEMA = "archive"
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+def is_partitioned(conn, table: str) -> bool:
+    return conn.execute(text(
+        "SELECT c.relkind = 'p' FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = :table AND n.nspname = current_schema()"
+    ), {"table": table}).scalar() or False
+
+def list_partitions(conn, table: str):
+    """[(partition name, lower bound or None for DEFAULT, upper bound)] ordered by range"""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table
+        ORDER BY c.relname
+    """), {"table": table}).all()
+    partitions = []
+    for name, bound in rows:
+        if bound == "DEFAULT":
+            partitions.append((name, None, None))
+            continue
+        # FOR VALUES FROM ('2024-01-01 00:00:00') TO ('2024-02-01 00:00:00')
+        lower, upper = [part.split("'")[1] for part in bound.split(" TO ")]
+        partitions.append((
+            name,
+            datetime.fromisoformat(lower).date(),
+            datetime.fromisoformat(upper).date(),
+        ))
+    return partitions
+
+def create_month(conn, table: str, month: date) -> bool:
+    """Create the partition for one month if it doesn't exist"""
+    name = partition_name(table, month)
+    exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+    if exists:
+        return False
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+    return True
+
+def ensure_partitions(conn, months_ahead: int = 3, since: Optional[date] = None):
+    """Create monthly partitions from `since` (default: this month) through months_ahead"""
+    first = month_start(since or date.today())
+    last = add_months(month_start(date.today()), months_ahead)
+    created = []
+    month = first
+    while month <= last:
+        for table in PARTITIONED_TABLES:
+            if create_month(conn, table, month):
+                created.append(partition_name(table, month))
+        month = add_months(month, 1)
+    return created
+
+def detach_partitions(conn, older_than_months: int):
+    """
+    Detach months that ended more than `older_than_months` ago and move them
+    to the archive schema. Item partitions go first: their foreign key points
+    at the sales partitions.
+    """
+    cutoff = add_months(month_start(date.today()), -older_than_months)
+    conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+    detached = []
+    for table in reversed(PARTITIONED_TABLES):
+        for name, lower, upper in list_partitions(conn, table):
+            if upper is None or upper > cutoff:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            # The detached copy keeps FK clones to the live tables; drop them
+            for (constraint,) in conn.execute(text(
+                "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:name AS regclass) AND contype = 'f'"
+            ), {"name": name}).all():
+                conn.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+            conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+            detached.append(f"{ARCHIVE_SCHEMA}.{name}")
+    return detached
+
+# ==========================================
+# CONVERSION (used by migrate_database.py)
+# ==========================================
+
+def convert_to_partitioned(conn, months_ahead: int = 3):
+    """
+    Rebuild transactions/transaction_items as partitioned tables, copying all
+    rows, inside the caller's transaction. Primary keys become
+    (id, created_at) as Postgres requires the partition key in unique
+    constraints; ids keep coming from the original sequences.
+    """
+    for table in PARTITIONED_TABLES:
+        conn.execute(text(f"UPDATE {table} SET created_at = now() WHERE created_at IS NULL"))
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+        conn.execute(text(f"ALTER INDEX {table}_pkey RENAME TO {table}_unpartitioned_pkey"))
+        # Keep the id sequence alive when the old table is dropped
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY NONE"))
+        conn.execute(text(
+            f"CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN created_at SET NOT NULL"))
+        conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)"))
+        conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+
+    earliest = conn.execute(text("SELECT MIN(created_at) FROM transactions_unpartitioned")).scalar()
+    ensure_partitions(conn, months_ahead, since=earliest.date() if earliest else None)
+
+    for table in PARTITIONED_TABLES:
+        conn.execute(text(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned"))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY {table}.id"))
+
+    # Old tables go first so the index names below are free again
+    for table in reversed(PARTITIONED_TABLES):
+        conn.execute(text(f"DROP TABLE {table}_unpartitioned"))
+
+    for statement in (
+        "ALTER TABLE transactions ADD FOREIGN KEY (tenant_id) REFERENCES tenants(id)",
+        "ALTER TABLE transactions ADD FOREIGN KEY (user_id) REFERENCES users(id)",
+        "ALTER TABLE transactions ADD FOREIGN KEY (customer_id) REFERENCES customers(id)",
+        "ALTER TABLE transaction_items ADD FOREIGN KEY (transaction_id, created_at) "
+        "REFERENCES transactions(id, created_at)",
+        "ALTER TABLE transaction_items ADD FOREIGN KEY (product_id) REFERENCES products(id)",
+        "ALTER TABLE transaction_items ADD FOREIGN KEY (tenant_id) REFERENCES tenants(id)",
+        "CREATE INDEX ix_transactions_id ON transactions (id)",
+        "CREATE INDEX ix_transactions_tenant_created ON transactions (tenant_id, created_at)",
+        "CREATE INDEX ix_transaction_items_id ON transaction_items (id)",
+        "CREATE INDEX ix_transaction_items_transaction_id ON transaction_items (transaction_id)",
+        "CREATE INDEX ix_transaction_items_tenant_created ON transaction_items (tenant_id, created_at)",
+    ):
+        conn.execute(text(statement))
+
+if __name__ == "__main__":
+    import database
+
+    parser = argparse.ArgumentParser(description="Maintain monthly sales partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ensure_cmd = sub.add_parser("ensure", help="create upcoming monthly partitions")
+    ensure_cmd.add_argument("--months-ahead", type=int, default=3)
+    detach_cmd = sub.add_parser("detach", help=f"detach old months into the {ARCHIVE_SCHEMA} schema")
+    detach_cmd.add_argument("--older-than", type=int, required=True, metavar="MONTHS")
+    sub.add_parser("list", help="show partitions and their ranges")
+    args = parser.parse_args()
+
+    with database.engine.begin() as conn:
+        if conn.dialect.name != "postgresql" or not is_partitioned(conn, "transactions"):
+            raise SystemExit("transactions is not partitioned (PostgreSQL only; run migrate_database.py)")
+        if args.command == "ensure":
+            created = ensure_partitions(conn, args.months_ahead)
+            print(f"✓ Created {len(created)} partition(s): {', '.join(created) or 'none needed'}")
+        elif args.command == "detach":
+            detached = detach_partitions(conn, args.older_than)
+            print(f"✓ Detached {len(detached)} partition(s): {', '.join(detached) or 'none'}")
+        else:
+            for table in PARTITIONED_TABLES:
+                print(f"{table}:")
+                for name, lower, upper in list_partitions(conn, table):
+                    bounds = "DEFAULT" if lower is None else f"{lower} .. {upper}"
+                    print(f"  {name:<40} {bounds}")
@@ -0,0 +1,338 @@
+"""
+Opt-in sampling profiler with slow-request capture.
+
+With PROFILING_ENABLED=true every request is watched: a sampler thread reads
+the Python stacks of the threads working on in-flight requests every
+PROFILING_INTERVAL_MS (sys._current_frames(), so nothing is hooked into
+function calls), and the SQL statements of each request are logged with
+their timings. When a request finishes, its profile is kept if
+- it took PROFILING_SLOW_MS or longer (reason "slow"), or
+- it was picked by PROFILING_SAMPLE_RATE (reason "sampled"),
+and dropped otherwise. Watching a request costs a few dict writes plus its
+statement log; sampling costs the same per tick however many requests run.
+
+Stacks are sampled from:
+- the sync endpoint while it runs in the threadpool (ProfiledRoute marks the
+  thread): ORM lazy loads, password hashing and pool waits show up here
+- the event loop while it runs the request: routing, response validation
+  and JSON rendering
+Dependencies (session, current user) run in separate threadpool calls; their
+time shows as the before_endpoint phase and in the statement log.
+
+Kept profiles are written to PROFILING_DIR (the newest PROFILING_KEEP stay),
+so captures of every worker are listed by any of them:
+    <id>.folded  collapsed stacks, one "frame;frame;frame count" line per
+                 stack - input for flamegraph.pl, inferno or speedscope
+    <id>.json    request, phases, sample count and statement log
+The admin endpoints under /api/v1/admin/profiles serve both.
+"""
+import contextvars
+import glob
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("request_profile", default=None)
+
+# Set while a Sampler runs; requests are only watched then
+_sampling = threading.Event()
+# thread ident -> (profile, frame the stack is cut at) for endpoint threads
+_threads: Dict[int, tuple] = {}
+# id(frame) -> profile for the middleware frame of each request on the loop
+_roots: Dict[int, "Profile"] = {}
+_finished = queue.Queue()
+_loop_thread: Optional[int] = None
+
+PROFILE_ID = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+
+class Profile:
+    """Samples, timings and statements of one request"""
+
+    def __init__(self, method: str, path: str):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.captured_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.endpoint_started = self.endpoint_ended = self.ended = None
+        self.samples = Counter()
+        self.statements = []
+        self.dropped_statements = 0
+
+    def _ms(self, instant: Optional[float]) -> Optional[float]:
+        return None if instant is None else round((instant - self.started) * 1000, 3)
+
+    def metadata(self, reason: str) -> dict:
+        duration = self._ms(self.ended)
+        phases = {}
+        if self.endpoint_started is not None and self.endpoint_ended is not None:
+            phases = {
+                "before_endpoint_ms": self._ms(self.endpoint_started),
+                "endpoint_ms": round((self.endpoint_ended - self.endpoint_started) * 1000, 3),
+                "after_endpoint_ms": round(duration - self._ms(self.endpoint_ended), 3),
+            }
+        return {
+            "id": self.id,
+            "reason": reason,
+            "captured_at": self.captured_at.isoformat(),
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "duration_ms": duration,
+            "phases": phases,
+            "samples": sum(self.samples.values()),
+            "interval_ms": settings.PROFILING_INTERVAL_MS,
+            "sql": {
+                "count": len(self.statements) + self.dropped_statements,
+                "total_ms": round(sum(entry["duration_ms"] for entry in self.statements), 3),
+                "statements": self.statements,
+                "dropped": self.dropped_statements,
+            },
+        }
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+# ==========================================
+# SAMPLING
+# ==========================================
+
+_labels: Dict[object, str] = {}
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        # Last two path parts tell site-packages modules apart ("orm/query.py")
+        path = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+def _sample():
+    frames = sys._current_frames()
+    for ident, (profile, root) in list(_threads.items()):
+        frame, stack = frames.get(ident), []
+        while frame is not None and frame is not root:
+            stack.append(_label(frame.f_code))
+            frame = frame.f_back
+        if stack:
+            profile.samples[("endpoint",) + tuple(reversed(stack))] += 1
+
+    # The loop is working on a request when its middleware frame is on the stack
+    frame, stack = frames.get(_loop_thread), []
+    while frame is not None:
+        profile = _roots.get(id(frame))
+        if profile is not None:
+            if stack:
+                profile.samples[("event loop",) + tuple(reversed(stack))] += 1
+            break
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+
+class Sampler:
+    """Background thread that samples stacks and writes kept profiles"""
+
+    def __init__(self, interval_ms: float = None):
+        self.interval = (settings.PROFILING_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        _sampling.set()
+
+    def stop(self):
+        _sampling.clear()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write_finished()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if _threads or _roots:
+                _sample()
+            if not _finished.empty():
+                self._write_finished()
+
+    def _write_finished(self):
+        wrote = False
+        while True:
+            try:
+                profile, reason = _finished.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                _write(profile, reason)
+                wrote = True
+            except Exception:
+                logger.exception(f"Could not write profile {profile.id}")
+        if wrote:
+            _prune()
+
+# ==========================================
+# REQUEST HOOKS
+# ==========================================
+
+class ProfilingMiddleware:
+    """Pure ASGI; watches each request while a Sampler runs"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _sampling.is_set():
+            await self.app(scope, receive, send)
+            return
+
+        global _loop_thread
+        _loop_thread = threading.get_ident()
+        profile = Profile(scope["method"], scope["path"])
+        frame_id = id(sys._getframe())
+        _roots[frame_id] = profile
+        token = _current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                route = scope.get("route")
+                if route is not None:
+                    profile.route = route.path
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.ended = time.perf_counter()
+            _current.reset(token)
+            del _roots[frame_id]
+            _finish(profile)
+
+def _finish(profile: Profile):
+    if (profile.ended - profile.started) * 1000 >= settings.PROFILING_SLOW_MS:
+        _finished.put((profile, "slow"))
+    elif random.random() < settings.PROFILING_SAMPLE_RATE:
+        _finished.put((profile, "sampled"))
+
+def _watch_thread(endpoint):
+    @wraps(endpoint)
+    def watched(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        ident = threading.get_ident()
+        _threads[ident] = (profile, sys._getframe())
+        profile.endpoint_started = time.perf_counter()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profile.endpoint_ended = time.perf_counter()
+            _threads.pop(ident, None)
+    return watched
+
+class ProfiledRoute(APIRoute):
+    """Route class that lets the sampler find the thread running a sync endpoint"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # Decided once at import, so a disabled profiler adds no call per request
+        if settings.PROFILING_ENABLED and not inspect.iscoroutinefunction(endpoint):
+            endpoint = _watch_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None:
+        return
+    started = conn.info["profiling_started"].pop()
+    if len(profile.statements) >= settings.PROFILING_MAX_STATEMENTS:
+        profile.dropped_statements += 1
+        return
+    # Statements only: parameters may hold customer data
+    profile.statements.append({
+        "at_ms": profile._ms(started),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "statement": statement,
+        "executemany": executemany,
+        "thread": threading.current_thread().name,
+    })
+
+def install(engine):
+    """Attach the statement log to an engine (idempotent)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+# ==========================================
+# STORAGE
+# ==========================================
+
+def _path(profile_id: str, extension: str) -> str:
+    return os.path.join(settings.PROFILING_DIR, f"{profile_id}.{extension}")
+
+def _write(profile: Profile, reason: str):
+    for extension, body in (("folded", profile.folded()), ("json", json.dumps(profile.metadata(reason)))):
+        tmp_path = _path(profile.id, extension) + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(body)
+        os.replace(tmp_path, _path(profile.id, extension))
+
+def _prune():
+    paths = sorted(glob.glob(os.path.join(settings.PROFILING_DIR, "*.json")), reverse=True)
+    for path in paths[settings.PROFILING_KEEP:]:
+        for extension in ("json", "folded"):
+            try:
+                os.remove(path[:-len("json")] + extension)
+            except FileNotFoundError:
+                pass
+
+def list_profiles() -> List[dict]:
+    """Summaries of the kept profiles, newest first"""
+    summaries = []
+    for path in sorted(glob.glob(os.path.join(settings.PROFILING_DIR, "*.json")), reverse=True):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # pruned or being written meanwhile
+        sql = data.pop("sql")
+        summaries.append({**data, "statement_count": sql["count"], "sql_ms": sql["total_ms"]})
+    return summaries
+
+def read_profile(profile_id: str, extension: str) -> Optional[str]:
+    """Contents of a kept profile's file, or None"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id, extension)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,261 @@
+"""
+Promotions and pricing rules, compiled per tenant.
+
+Rule kinds (models.Promotion):
+- percentage: `percent` off the line (a category target gives category-wide sales)
+- bogo:       for every buy_quantity + get_quantity units, get_quantity are free
+- multi_buy:  every buy_quantity units cost bundle_price ("3 for 5.00")
+
+Each rule targets a product, a category or the whole store, and may be
+limited to a date range, a daily time window, weekdays, and customers with
+at least min_loyalty_points (the customer tier).
+
+A tenant's active rules and its product prices are compiled into a
+PricingSnapshot: rules indexed by product_id and category_id, prices in
+integer cents. Snapshots are cached in-process and keyed by
+tenants.pricing_version, which caching.bump_versions(pricing=True) bumps
+with every price or promotion change. The tenant row is already loaded by
+auth, so an unchanged snapshot costs no query.
+
+Pricing is one pass over the cart: each line gets the single applicable
+rule that saves the most, then the basket-level discount applies to the
+discounted subtotal. Date ranges are naive UTC, like the rest of the schema;
+daily windows and weekdays are wall-clock time in the store's zone
+(tenants.time_zone), so a 17:00-19:00 happy hour follows the store's clock
+through daylight saving changes.
+"""
+import threading
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import datetime, time as time_of_day, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import barcodes
+import models
+import money
+
+PERCENTAGE = "percentage"
+BOGO = "bogo"
+MULTI_BUY = "multi_buy"
+KINDS = (PERCENTAGE, BOGO, MULTI_BUY)
+
+@dataclass(frozen=True)
+class Rule:
+    id: int
+    name: str
+    kind: str
+    percent: Optional[float]
+    buy_quantity: Optional[int]
+    get_quantity: Optional[int]
+    bundle_cents: Optional[int]
+    starts_at: Optional[datetime]
+    ends_at: Optional[datetime]
+    daily_start: Optional[time_of_day]
+    daily_end: Optional[time_of_day]
+    days_of_week: Optional[frozenset]
+    min_loyalty_points: Optional[int]
+
+    @classmethod
+    def from_model(cls, promotion: models.Promotion) -> "Rule":
+        return cls(
+            id=promotion.id,
+            name=promotion.name,
+            kind=promotion.kind,
+            percent=promotion.percent,
+            buy_quantity=promotion.buy_quantity,
+            get_quantity=promotion.get_quantity,
+            bundle_cents=None if promotion.bundle_price is None else money.to_cents(promotion.bundle_price),
+            starts_at=promotion.starts_at,
+            ends_at=promotion.ends_at,
+            daily_start=promotion.daily_start,
+            daily_end=promotion.daily_end,
+            days_of_week=frozenset(int(day) for day in promotion.days_of_week) if promotion.days_of_week else None,
+            min_loyalty_points=promotion.min_loyalty_points,
+        )
+
+    def applies(self, at: datetime, local: datetime, loyalty_points: Optional[int]) -> bool:
+        """`at` is naive UTC, `local` the same instant on the store's clock"""
+        if self.starts_at is not None and at < self.starts_at:
+            return False
+        if self.ends_at is not None and at >= self.ends_at:
+            return False
+        if self.days_of_week is not None and local.weekday() not in self.days_of_week:
+            return False
+        if self.daily_start is not None and self.daily_end is not None:
+            now = local.time()
+            if self.daily_start <= self.daily_end:
+                if not self.daily_start <= now < self.daily_end:
+                    return False
+            # Window across midnight, e.g. 22:00-02:00
+            elif self.daily_end <= now < self.daily_start:
+                return False
+        if self.min_loyalty_points is not None and (loyalty_points or 0) < self.min_loyalty_points:
+            return False
+        return True
+
+    def discount_cents(self, unit_cents: int, quantity: int) -> int:
+        """Savings on a line of `quantity` units at `unit_cents` each"""
+        if self.kind == PERCENTAGE:
+            return money.percentage_of(unit_cents * quantity, self.percent)
+        if self.kind == BOGO:
+            deals = quantity // (self.buy_quantity + self.get_quantity)
+            return deals * self.get_quantity * unit_cents
+        if self.kind == MULTI_BUY:
+            deals = quantity // self.buy_quantity
+            return deals * max(self.buy_quantity * unit_cents - self.bundle_cents, 0)
+        return 0
+
+# Product fields captured in snapshots; changing one needs a pricing_version bump
+PRICED_FIELDS = {"name", "selling_price", "category_id", "plu"}
+
+# Catalog entry; attribute names match models.Product where barcodes.py reads them
+ProductPrice = namedtuple("ProductPrice", "id name selling_price category_id plu")
+
+class PricingSnapshot:
+    """A tenant's product prices and active rules, indexed by target"""
+
+    def __init__(self, version: int, time_zone: str, products, promotions):
+        self.version = version
+        self.time_zone = time_zone
+        self.zone = ZoneInfo(time_zone)
+        self.products: Dict[int, ProductPrice] = {product.id: product for product in products}
+        self.by_product: Dict[int, Tuple[Rule, ...]] = {}
+        self.by_category: Dict[int, Tuple[Rule, ...]] = {}
+        storewide = []
+        for promotion in promotions:
+            rule = Rule.from_model(promotion)
+            if promotion.product_id is not None:
+                self.by_product[promotion.product_id] = self.by_product.get(promotion.product_id, ()) + (rule,)
+            elif promotion.category_id is not None:
+                self.by_category[promotion.category_id] = self.by_category.get(promotion.category_id, ()) + (rule,)
+            else:
+                storewide.append(rule)
+        self.storewide = tuple(storewide)
+
+    def rules_for(self, product_id: int, category_id: Optional[int]) -> Tuple[Rule, ...]:
+        return self.by_product.get(product_id, ()) + self.by_category.get(category_id, ()) + self.storewide
+
+@dataclass
+class PricedLine:
+    product_id: int
+    product_name: str
+    quantity: int
+    unit_cents: int
+    discount_cents: int = 0
+    promotion: Optional[Rule] = None
+
+    @property
+    def line_cents(self) -> int:
+        return self.unit_cents * self.quantity - self.discount_cents
+
+def apply_rules(snapshot: PricingSnapshot, lines: List[PricedLine], categories: List[Optional[int]],
+                at: datetime, loyalty_points: Optional[int] = None) -> List[PricedLine]:
+    """Give each line its best applicable rule, in place; categories[i] belongs to lines[i]"""
+    local = at.replace(tzinfo=timezone.utc).astimezone(snapshot.zone).replace(tzinfo=None)
+    live = {}
+    for line, category_id in zip(lines, categories):
+        best = 0
+        for rule in snapshot.rules_for(line.product_id, category_id):
+            if rule.id not in live:
+                live[rule.id] = rule.applies(at, local, loyalty_points)
+            if not live[rule.id]:
+                continue
+            # Never more than the line itself
+            saving = min(rule.discount_cents(line.unit_cents, line.quantity), line.unit_cents * line.quantity)
+            if saving > best:
+                best, line.promotion = saving, rule
+        line.discount_cents = best
+    return lines
+
+def basket_discount_cents(subtotal_cents: int, discount_type: Optional[str], discount_value: Optional[float]) -> int:
+    """Cashier's basket-level discount; raises ValueError for invalid input"""
+    if not discount_type or not discount_value:
+        return 0
+    if discount_type == 'percentage':
+        if discount_value < 0 or discount_value > 100:
+            raise ValueError("Discount percentage must be between 0 and 100")
+        return money.percentage_of(subtotal_cents, discount_value)
+    if discount_type == 'fixed':
+        if discount_value < 0:
+            raise ValueError("Discount amount cannot be negative")
+        return min(money.to_cents(discount_value), subtotal_cents)  # Can't discount more than subtotal
+    raise ValueError("Invalid discount type. Use 'percentage' or 'fixed'")
+
+# ==========================================
+# PER-TENANT SNAPSHOT CACHE
+# ==========================================
+
+_cache: Dict[int, PricingSnapshot] = {}
+_cache_lock = threading.Lock()
+
+def compile_snapshot(db, tenant_id: int, version: int, time_zone: str = "UTC") -> PricingSnapshot:
+    product = models.Product
+    products = [
+        ProductPrice(*row) for row in db.query(
+            product.id, product.name, product.selling_price, product.category_id, product.plu
+        ).filter(product.tenant_id == tenant_id, product.is_active == True)
+    ]
+    promotions = db.query(models.Promotion).filter(
+        models.Promotion.tenant_id == tenant_id,
+        models.Promotion.is_active == True
+    ).all()
+    return PricingSnapshot(version, time_zone, products, promotions)
+
+def snapshot_for(db, tenant: models.Tenant) -> PricingSnapshot:
+    """The tenant's compiled pricing, rebuilt when pricing_version or the time zone has moved"""
+    snapshot = _cache.get(tenant.id)
+    if (snapshot is not None and snapshot.version == tenant.pricing_version
+            and snapshot.time_zone == tenant.time_zone):
+        return snapshot
+    snapshot = compile_snapshot(db, tenant.id, tenant.pricing_version, tenant.time_zone)
+    with _cache_lock:
+        current = _cache.get(tenant.id)
+        # A concurrent request may have compiled a newer version meanwhile
+        if current is None or current.version <= snapshot.version:
+            _cache[tenant.id] = snapshot
+    return snapshot
+
+def price_cart(db, tenant: models.Tenant, items, at: datetime, loyalty_points: Optional[int] = None,
+               discount_type: Optional[str] = None, discount_value: Optional[float] = None) -> dict:
+    """
+    Price a cart from the snapshot alone (the /api/v1/cart/price preview).
+    `items` have product_id, quantity and an optional scale-label barcode.
+    Raises LookupError for unknown products and ValueError for a bad discount.
+    """
+    snapshot = snapshot_for(db, tenant)
+    lines, categories = [], []
+    for item in items:
+        product = snapshot.products.get(item.product_id)
+        if product is None:
+            raise LookupError(f"Product {item.product_id} not found")
+        unit_cents, name = money.to_cents(product.selling_price), product.name
+        if item.barcode:
+            label = barcodes.checkout_price(db, tenant.id, product, item.barcode)
+            if label is not None:
+                unit_cents, name = label
+        lines.append(PricedLine(product.id, name, item.quantity, unit_cents))
+        categories.append(product.category_id)
+    apply_rules(snapshot, lines, categories, at, loyalty_points)
+
+    subtotal_cents = sum(line.line_cents for line in lines)
+    discount_cents = basket_discount_cents(subtotal_cents, discount_type, discount_value)
+    return {
+        "items": [
+            {
+                "product_id": line.product_id,
+                "product_name": line.product_name,
+                "quantity": line.quantity,
+                "unit_price": money.from_cents(line.unit_cents),
+                "discount_amount": money.from_cents(line.discount_cents),
+                "total_price": money.from_cents(line.line_cents),
+                "promotion_id": line.promotion.id if line.promotion else None,
+                "promotion_name": line.promotion.name if line.promotion else None,
+            }
+            for line in lines
+        ],
+        "promotion_savings": money.from_cents(sum(line.discount_cents for line in lines)),
+        "subtotal": money.from_cents(subtotal_cents),
+        "discount_amount": money.from_cents(discount_cents),
+        "total_amount": money.from_cents(subtotal_cents - discount_cents),
+    }
@@ -0,0 +1,226 @@
+"""
+Per-request SQL query budgets and N+1 detection.
+
+Every statement executed on the engine is attributed to the request that
+issued it. Repeated statement shapes (the classic N+1 lazy-load pattern) are
+grouped by fingerprint, and routes can declare how many statements they are
+allowed to issue:
+
+    @app.get("/api/v1/products")
+    @query_budget(3)
+    def get_products(...): ...
+
+QUERY_BUDGET_MODE controls what happens when a route goes over budget or
+repeats the same statement QUERY_REPEAT_THRESHOLD times:
+    off   - nothing is recorded (default, zero overhead in production)
+    warn  - a warning with the grouped statements is logged
+    raise - QueryBudgetExceeded is raised before the response is sent
+
+Tests can load this module as a pytest plugin (pytest_plugins = ["query_budget"])
+to get the `query_counter` and `enforce_query_budgets` fixtures.
+"""
+import contextvars
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import event
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+_current_recorder = contextvars.ContextVar("query_recorder", default=None)
+
+# Mutable so tests can switch modes without re-importing the app
+config = {
+    "mode": settings.QUERY_BUDGET_MODE,
+    "repeat_threshold": settings.QUERY_REPEAT_THRESHOLD,
+}
+
+class QueryBudgetExceeded(Exception):
+    """Raised in 'raise' mode when a request breaks its query budget"""
+    pass
+
+# ==========================================
+# STATEMENT FINGERPRINTING
+# ==========================================
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|%s|\?|:\w+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)|\bIN\s*\(__\[POSTCOMPILE_\w+\]\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(statement: str) -> str:
+    """Normalize a SQL statement so that calls differing only in parameters group together"""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _BIND_PARAM.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+# ==========================================
+# RECORDING
+# ==========================================
+
+class QueryRecorder:
+    """Collects the statements executed while it is active"""
+
+    def __init__(self, label: Optional[str] = None):
+        self.label = label
+        self.statements = []
+
+    def record(self, statement: str):
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def shapes(self) -> Counter:
+        """Statement fingerprints and how often each one ran"""
+        return Counter(fingerprint(s) for s in self.statements)
+
+    def repeated(self, threshold: Optional[int] = None):
+        """Fingerprints that ran at least `threshold` times (likely N+1 loads)"""
+        threshold = threshold or config["repeat_threshold"]
+        return [(shape, n) for shape, n in self.shapes().most_common() if n >= threshold]
+
+    def report(self) -> str:
+        lines = [f"{self.count} statement(s) for {self.label or 'block'}:"]
+        for shape, n in self.shapes().most_common():
+            lines.append(f"  {n:>4} x {shape[:200]}")
+        return "\n".join(lines)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorder = _current_recorder.get()
+    if recorder is not None:
+        recorder.record(statement)
+
+def install(engine):
+    """Attach the statement counter to an engine (idempotent)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+@contextmanager
+def record_queries(label: Optional[str] = None):
+    """Record the statements issued by the current context (request or thread)"""
+    recorder = QueryRecorder(label)
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+def current_recorder() -> Optional[QueryRecorder]:
+    return _current_recorder.get()
+
+# ==========================================
+# BUDGETS
+# ==========================================
+
+def query_budget(max_queries: int):
+    """Declare the maximum number of statements a route may issue"""
+    def decorator(func):
+        func.__query_budget__ = max_queries
+        return func
+    return decorator
+
+def check_budget(recorder: QueryRecorder, budget: Optional[int], mode: Optional[str] = None):
+    """Warn or raise if the recorder broke its budget or shows N+1 patterns"""
+    mode = mode or config["mode"]
+    problems = []
+    if budget is not None and recorder.count > budget:
+        problems.append(f"exceeded query budget ({recorder.count} > {budget})")
+    repeated = recorder.repeated()
+    if repeated:
+        problems.append(f"possible N+1: {len(repeated)} statement shape(s) repeated")
+    if not problems:
+        return
+
+    message = f"{recorder.label}: {'; '.join(problems)}\n{recorder.report()}"
+    if mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+class QueryBudgetMiddleware:
+    """
+    Counts statements per request and enforces declared route budgets.
+    Pure ASGI so that it adds nothing but a dict lookup when disabled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or config["mode"] == "off":
+            await self.app(scope, receive, send)
+            return
+
+        with record_queries(f"{scope['method']} {scope['path']}") as recorder:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    # Sync endpoints have finished by now, so the count is final
+                    route = scope.get("route")
+                    if route is not None:
+                        recorder.label = f"{scope['method']} {route.path}"
+                    endpoint = scope.get("endpoint")
+                    budget = getattr(endpoint, "__query_budget__", None)
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-query-count", str(recorder.count).encode())
+                    ]
+                    if message["status"] < 400:
+                        check_budget(recorder, budget)
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+# ==========================================
+# PYTEST FIXTURES
+# ==========================================
+
+try:
+    import pytest
+except ImportError:  # pytest is a dev-only dependency
+    pytest = None
+
+if pytest is not None:
+
+    @pytest.fixture
+    def query_counter():
+        """
+        Count every statement executed on the app engine inside a block:
+
+            with query_counter() as rec:
+                client.get("/api/v1/products", headers=auth)
+            assert rec.count <= 3, rec.report()
+        """
+        import database
+
+        @contextmanager
+        def _counter(label: str = "test block"):
+            recorder = QueryRecorder(label)
+
+            def _listener(conn, cursor, statement, parameters, context, executemany):
+                recorder.record(statement)
+
+            event.listen(database.engine, "before_cursor_execute", _listener)
+            try:
+                yield recorder
+            finally:
+                event.remove(database.engine, "before_cursor_execute", _listener)
+
+        return _counter
+
+    @pytest.fixture
+    def enforce_query_budgets():
+        """Fail any request that breaks its declared budget or repeats a statement shape"""
+        previous = config["mode"]
+        config["mode"] = "raise"
+        yield
+        config["mode"] = previous
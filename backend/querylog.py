@@ -0,0 +1,372 @@
+"""
+Slow query log: statement fingerprints with per-route timings and sampled
+EXPLAIN plans.
+
+With QUERY_LOG_ENABLED=true, cursor events time every statement run on the
+engine. Statements are normalized into fingerprints (literals and bind
+parameters become ?, IN lists collapse; see query_budget.fingerprint) and
+aggregated as count, total and max time per fingerprint and route. The
+route is the request's route template ("GET /api/v1/products/{product_id}");
+statements run outside requests are filed under their thread's name
+("customer-stats-flusher").
+
+Statements slower than QUERY_LOG_EXPLAIN_MS get their plan captured, for a
+QUERY_LOG_EXPLAIN_RATE sample and at most once per fingerprint every
+QUERY_LOG_EXPLAIN_INTERVAL_SECONDS. A background thread re-runs them as
+EXPLAIN (ANALYZE, BUFFERS) on its own connection in a read-only transaction
+that is rolled back, so requests never wait for it and only plain SELECTs
+are explained. PostgreSQL only.
+
+Each worker writes its aggregates to QUERY_LOG_DIR every
+QUERY_LOG_FLUSH_SECONDS and its plans as they are captured (the newest
+QUERY_LOG_KEEP_PLANS stay). The admin endpoints under /api/v1/admin/queries
+and this CLI merge the files of all workers.
+
+Usage:
+    python querylog.py top [--by total|max|count|mean] [--route R] [--limit N]
+    python querylog.py plans [--limit N]
+    python querylog.py reset               # delete collected stats and plans
+"""
+import argparse
+import contextvars
+import glob
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from query_budget import fingerprint
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("query_log_request", default=None)
+# Set in the writer thread, whose own EXPLAINs are not logged
+_suppressed = contextvars.ContextVar("query_log_suppressed", default=False)
+
+# (fingerprint, route) -> [count, total ms, max ms] since this worker started
+_stats: Dict[tuple, list] = defaultdict(lambda: [0, 0.0, 0.0])
+_lock = threading.Lock()
+_plan_queue = queue.Queue(maxsize=100)
+# fingerprint -> monotonic time its plan was last queued
+_explained: Dict[str, float] = {}
+_started_at = datetime.now(timezone.utc)
+
+# Statement text -> fingerprint; SQLAlchemy's compiled cache keeps texts few
+_fingerprints: Dict[str, str] = {}
+_FINGERPRINT_CACHE = 5000
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_LOCKING = re.compile(r"\bFOR\s+(UPDATE|SHARE|NO KEY UPDATE|KEY SHARE)\b", re.IGNORECASE)
+_WRITING = re.compile(r"\b(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+class _Request:
+    """Statements of one request, filed once its route is known"""
+    __slots__ = ("label", "timings")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.timings = []
+
+def _fingerprint(statement: str) -> str:
+    shape = _fingerprints.get(statement)
+    if shape is None:
+        if len(_fingerprints) >= _FINGERPRINT_CACHE:
+            _fingerprints.clear()
+        shape = _fingerprints[statement] = fingerprint(statement)
+    return shape
+
+def _record(route: str, timings):
+    with _lock:
+        for statement, ms in timings:
+            entry = _stats[(_fingerprint(statement), route)]
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+
+# ==========================================
+# INSTRUMENTATION
+# ==========================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not _suppressed.get():
+        conn.info.setdefault("query_log_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _suppressed.get():
+        return
+    ms = (time.perf_counter() - conn.info["query_log_started"].pop()) * 1000
+    request = _current.get()
+    if request is not None:
+        request.timings.append((statement, ms))
+    else:
+        _record(threading.current_thread().name, [(statement, ms)])
+
+    if (ms >= settings.QUERY_LOG_EXPLAIN_MS and not executemany and conn.dialect.name == "postgresql"
+            and _explainable(statement) and random.random() < settings.QUERY_LOG_EXPLAIN_RATE):
+        _queue_plan(statement, parameters, ms, request.label if request is not None else threading.current_thread().name)
+
+def _explainable(statement: str) -> bool:
+    # EXPLAIN ANALYZE executes the statement: plain reads only
+    return bool(_EXPLAINABLE.match(statement)) and not _LOCKING.search(statement) and not (
+        statement.lstrip()[:4].upper() == "WITH" and _WRITING.search(statement)
+    )
+
+def _queue_plan(statement: str, parameters, ms: float, route: str):
+    shape = _fingerprint(statement)
+    now = time.monotonic()
+    with _lock:
+        last = _explained.get(shape)
+        if last is not None and now - last < settings.QUERY_LOG_EXPLAIN_INTERVAL_SECONDS:
+            return
+        _explained[shape] = now
+    try:
+        _plan_queue.put_nowait((shape, statement, parameters, ms, route))
+    except queue.Full:
+        pass  # the writer is behind; this fingerprint is retried after the interval
+
+def install(engine):
+    """Attach the statement timers to an engine (idempotent)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class QueryLogMiddleware:
+    """Pure ASGI; files each request's statements under its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.QUERY_LOG_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request = _Request(f"{scope['method']} {scope['path']}")
+        token = _current.set(request)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # Unmatched paths (404s, scanners) share one bucket
+            _record(f"{scope['method']} {route.path}" if route is not None else "(unmatched)", request.timings)
+
+# ==========================================
+# WRITER
+# ==========================================
+
+def _stats_path() -> str:
+    return os.path.join(settings.QUERY_LOG_DIR, f"stats-{os.getpid()}-{_started_at:%Y%m%dT%H%M%S}.json")
+
+def write_stats():
+    """Write this worker's aggregates (cumulative since it started)"""
+    with _lock:
+        rows = [
+            {"fingerprint": shape, "route": route, "count": count, "total_ms": round(total, 3), "max_ms": round(peak, 3)}
+            for (shape, route), (count, total, peak) in _stats.items()
+        ]
+    if not rows:
+        return
+    os.makedirs(settings.QUERY_LOG_DIR, exist_ok=True)
+    path = _stats_path()
+    # The writer thread and the admin endpoint may both be writing
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"pid": os.getpid(), "started_at": _started_at.isoformat(),
+                   "updated_at": datetime.now(timezone.utc).isoformat(), "stats": rows}, f)
+    os.replace(tmp_path, path)
+
+def explain(engine, statement: str, parameters) -> str:
+    """EXPLAIN (ANALYZE, BUFFERS) of a read, in a read-only transaction that is rolled back"""
+    with engine.connect() as conn:
+        with conn.begin() as txn:
+            conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+            rows = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters or {}).all()
+            txn.rollback()
+    return "\n".join(row[0] for row in rows)
+
+def _write_plan(engine, shape: str, statement: str, parameters, ms: float, route: str):
+    captured_at = datetime.now(timezone.utc)
+    plan = {
+        "fingerprint": shape,
+        "statement": statement,
+        "route": route,
+        "duration_ms": round(ms, 3),
+        "captured_at": captured_at.isoformat(),
+        "plan": explain(engine, statement, parameters),
+    }
+    directory = os.path.join(settings.QUERY_LOG_DIR, "plans")
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha1(shape.encode()).hexdigest()[:12]
+    path = os.path.join(directory, f"{captured_at:%Y%m%dT%H%M%S}-{digest}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(plan, f)
+    os.replace(path + ".tmp", path)
+
+    for old in sorted(glob.glob(os.path.join(directory, "*.json")), reverse=True)[settings.QUERY_LOG_KEEP_PLANS:]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+
+class Writer:
+    """Background thread that captures queued plans and writes the aggregates"""
+
+    def __init__(self, engine, interval: float = None):
+        self.engine = engine
+        self.interval = settings.QUERY_LOG_FLUSH_SECONDS if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write the aggregates one last time"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._write_stats()
+
+    def _run(self):
+        _suppressed.set(True)
+        next_flush = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            try:
+                item = _plan_queue.get(timeout=max(0.0, min(1.0, next_flush - time.monotonic())))
+            except queue.Empty:
+                item = None
+            if item is not None:
+                try:
+                    _write_plan(self.engine, *item)
+                except Exception:
+                    logger.exception("Could not capture a query plan")
+            if time.monotonic() >= next_flush:
+                self._write_stats()
+                next_flush = time.monotonic() + self.interval
+
+    def _write_stats(self):
+        try:
+            write_stats()
+        except Exception:
+            logger.exception("Could not write query stats")
+
+# ==========================================
+# REPORTS
+# ==========================================
+
+def _merged() -> Dict[tuple, list]:
+    """(fingerprint, route) -> [count, total ms, max ms] over every worker's file"""
+    merged = defaultdict(lambda: [0, 0.0, 0.0])
+    for path in glob.glob(os.path.join(settings.QUERY_LOG_DIR, "stats-*.json")):
+        try:
+            with open(path) as f:
+                rows = json.load(f)["stats"]
+        except (OSError, ValueError):
+            continue  # being replaced meanwhile
+        for row in rows:
+            entry = merged[(row["fingerprint"], row["route"])]
+            entry[0] += row["count"]
+            entry[1] += row["total_ms"]
+            entry[2] = max(entry[2], row["max_ms"])
+    return merged
+
+def _summary(count: int, total: float, peak: float) -> dict:
+    return {"count": count, "total_ms": round(total, 3), "mean_ms": round(total / count, 3) if count else 0.0,
+            "max_ms": round(peak, 3)}
+
+def report(by: str = "total", route: Optional[str] = None, limit: int = 50) -> dict:
+    """Statements by fingerprint (with their heaviest routes) and routes by statement time"""
+    key = {"total": "total_ms", "max": "max_ms", "count": "count", "mean": "mean_ms"}[by]
+    pairs = _merged()
+    if route is not None:
+        pairs = {pair: entry for pair, entry in pairs.items() if pair[1] == route}
+
+    shapes, routes = defaultdict(lambda: [0, 0.0, 0.0]), defaultdict(lambda: [0, 0.0, 0.0, set()])
+    routes_of = defaultdict(list)
+    for (shape, route_name), (count, total, peak) in pairs.items():
+        for entry in (shapes[shape], routes[route_name]):
+            entry[0] += count
+            entry[1] += total
+            entry[2] = max(entry[2], peak)
+        routes[route_name][3].add(shape)
+        routes_of[shape].append({"route": route_name, **_summary(count, total, peak)})
+
+    by_fingerprint = [
+        {"fingerprint": shape, **_summary(*entry),
+         "routes": sorted(routes_of[shape], key=lambda row: row[key], reverse=True)[:5]}
+        for shape, entry in shapes.items()
+    ]
+    by_route = [
+        {"route": route_name, **_summary(*entry[:3]), "fingerprints": len(entry[3])}
+        for route_name, entry in routes.items()
+    ]
+    return {
+        "by_fingerprint": sorted(by_fingerprint, key=lambda row: row[key], reverse=True)[:limit],
+        "by_route": sorted(by_route, key=lambda row: row[key], reverse=True)[:limit],
+    }
+
+def plans(limit: int = 20) -> List[dict]:
+    """Captured plans, newest first"""
+    captured = []
+    for path in sorted(glob.glob(os.path.join(settings.QUERY_LOG_DIR, "plans", "*.json")), reverse=True)[:limit]:
+        try:
+            with open(path) as f:
+                captured.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return captured
+
+def reset():
+    for path in glob.glob(os.path.join(settings.QUERY_LOG_DIR, "stats-*.json")) + \
+            glob.glob(os.path.join(settings.QUERY_LOG_DIR, "plans", "*.json")):
+        os.remove(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slow query log")
+    sub = parser.add_subparsers(dest="command", required=True)
+    top_cmd = sub.add_parser("top", help="statements and routes by time")
+    top_cmd.add_argument("--by", choices=["total", "max", "count", "mean"], default="total")
+    top_cmd.add_argument("--route", help='only this route, e.g. "GET /api/v1/products"')
+    top_cmd.add_argument("--limit", type=int, default=20)
+    plans_cmd = sub.add_parser("plans", help="captured EXPLAIN (ANALYZE, BUFFERS) plans")
+    plans_cmd.add_argument("--limit", type=int, default=5)
+    sub.add_parser("reset", help="delete collected stats and plans")
+    args = parser.parse_args()
+
+    if args.command == "top":
+        result = report(args.by, args.route, args.limit)
+        print(f"{'count':>8} {'total ms':>11} {'mean ms':>9} {'max ms':>9}  statement")
+        for row in result["by_fingerprint"]:
+            print(f"{row['count']:>8} {row['total_ms']:>11.1f} {row['mean_ms']:>9.2f} {row['max_ms']:>9.1f}  "
+                  f"{row['fingerprint'][:160]}")
+            for route_row in row["routes"][:3]:
+                print(f"{'':>41}  ↳ {route_row['route']} ({route_row['count']}x, {route_row['total_ms']:.1f} ms)")
+        print()
+        print(f"{'count':>8} {'total ms':>11} {'mean ms':>9} {'max ms':>9}  route")
+        for row in result["by_route"]:
+            print(f"{row['count']:>8} {row['total_ms']:>11.1f} {row['mean_ms']:>9.2f} {row['max_ms']:>9.1f}  "
+                  f"{row['route']} ({row['fingerprints']} fingerprints)")
+    elif args.command == "plans":
+        for plan in plans(args.limit):
+            print(f"=== {plan['captured_at']} {plan['route']} ({plan['duration_ms']} ms)")
+            print(plan["statement"])
+            print(plan["plan"])
+            print()
+    else:
+        reset()
+        print("✓ Query log reset")
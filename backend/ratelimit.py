@@ -0,0 +1,181 @@
+"""
+Per-tenant rate limits, concurrency caps and load shedding by priority.
+
+Every authenticated request is attributed to the tenant_id claim of its JWT
+(verified, no DB access) and to a priority class from ROUTE_CLASSES:
+
+    critical  checkout, scanning, cart pricing, receipts
+    standard  listings and CRUD (the default)
+    bulk      analytics and reports
+
+Each (tenant, class) pair has a token bucket (RATE_LIMIT_<CLASS>_RPS with
+RATE_LIMIT_<CLASS>_BURST) and a cap on requests in flight
+(RATE_LIMIT_<CLASS>_CONCURRENCY), so one tenant's scripts cannot occupy the
+shared threadpool and DB pool. On top of that, when the worker as a whole
+has many requests in flight (relative to RATE_LIMIT_MAX_INFLIGHT), bulk
+work is refused first, then standard; critical requests are never shed.
+Refused requests get a 429 with Retry-After before any endpoint code runs.
+
+State is per worker process and lives on the event loop thread, so no
+locking is needed. Limits therefore apply per worker.
+"""
+import json
+import math
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from settings import settings
+
+CRITICAL = "critical"
+STANDARD = "standard"
+BULK = "bulk"
+
+# (method, path regex, class); first match wins, default STANDARD
+ROUTE_CLASSES = [
+    ("POST", re.compile(r"^/api/v1/transactions/create$"), CRITICAL),
+    ("POST", re.compile(r"^/api/v1/cart/price$"), CRITICAL),
+    ("GET", re.compile(r"^/api/v1/products/(scan|by-barcode)/"), CRITICAL),
+    ("GET", re.compile(r"^/api/v1/products/search$"), CRITICAL),
+    ("GET", re.compile(r"^/api/v1/transactions/\d+/receipt$"), CRITICAL),
+    ("GET", re.compile(r"^/api/v1/analytics/"), BULK),
+]
+
+# Fraction of RATE_LIMIT_MAX_INFLIGHT at which a class starts being refused
+SHED_AT = {BULK: 0.5, STANDARD: 0.8}
+
+@dataclass(frozen=True)
+class Limits:
+    rate: float        # tokens per second
+    burst: float       # bucket size
+    concurrency: int   # requests in flight per tenant
+
+def class_limits() -> Dict[str, Limits]:
+    return {
+        CRITICAL: Limits(settings.RATE_LIMIT_CRITICAL_RPS, settings.RATE_LIMIT_CRITICAL_BURST,
+                         settings.RATE_LIMIT_CRITICAL_CONCURRENCY),
+        STANDARD: Limits(settings.RATE_LIMIT_STANDARD_RPS, settings.RATE_LIMIT_STANDARD_BURST,
+                         settings.RATE_LIMIT_STANDARD_CONCURRENCY),
+        BULK: Limits(settings.RATE_LIMIT_BULK_RPS, settings.RATE_LIMIT_BULK_BURST,
+                     settings.RATE_LIMIT_BULK_CONCURRENCY),
+    }
+
+def classify(method: str, path: str) -> str:
+    for rule_method, pattern, priority in ROUTE_CLASSES:
+        if method == rule_method and pattern.match(path):
+            return priority
+    return STANDARD
+
+def tenant_of(headers) -> Optional[int]:
+    """tenant_id claim of a valid bearer token, else None"""
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("tenant_id")
+            except JWTError:
+                return None
+    return None
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "in_flight")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+        self.in_flight = 0
+
+class Limiter:
+    """Token buckets and in-flight counters per (tenant, class)"""
+
+    # Idle full buckets are dropped once there are this many
+    MAX_BUCKETS = 10000
+
+    def __init__(self, limits: Dict[str, Limits] = None, max_in_flight: int = None):
+        self.limits = limits or class_limits()
+        self.max_in_flight = settings.RATE_LIMIT_MAX_INFLIGHT if max_in_flight is None else max_in_flight
+        self.in_flight = 0
+        self._buckets: Dict[Tuple[int, str], _Bucket] = {}
+
+    def acquire(self, tenant_id: Optional[int], priority: str, now: float = None) -> Tuple[Optional[_Bucket], float]:
+        """
+        (bucket, 0) when admitted - call release(bucket) when done - or
+        (None, seconds to wait) when refused
+        """
+        now = time.monotonic() if now is None else now
+        shed_at = SHED_AT.get(priority)
+        if shed_at is not None and self.in_flight >= shed_at * self.max_in_flight:
+            return None, 1.0
+        if tenant_id is None:
+            self.in_flight += 1
+            return None, 0.0
+
+        limits = self.limits[priority]
+        bucket = self._buckets.get((tenant_id, priority))
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                self._prune(now)
+            bucket = self._buckets[(tenant_id, priority)] = _Bucket(limits.burst, now)
+        bucket.tokens = min(limits.burst, bucket.tokens + (now - bucket.updated) * limits.rate)
+        bucket.updated = now
+        if bucket.in_flight >= limits.concurrency:
+            return None, 1.0
+        if bucket.tokens < 1:
+            return None, (1 - bucket.tokens) / limits.rate if limits.rate > 0 else 60.0
+        bucket.tokens -= 1
+        bucket.in_flight += 1
+        self.in_flight += 1
+        return bucket, 0.0
+
+    def release(self, bucket: Optional[_Bucket]):
+        self.in_flight -= 1
+        if bucket is not None:
+            bucket.in_flight -= 1
+
+    def _prune(self, now: float):
+        for key, bucket in list(self._buckets.items()):
+            limits = self.limits[key[1]]
+            if bucket.in_flight == 0 and bucket.tokens + (now - bucket.updated) * limits.rate >= limits.burst:
+                del self._buckets[key]
+
+class RateLimitMiddleware:
+    """Pure ASGI; refuses over-limit requests with 429 before routing"""
+
+    def __init__(self, app, limiter: Limiter = None):
+        self.app = app
+        self.limiter = limiter or Limiter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        priority = classify(scope["method"], scope["path"])
+        bucket, retry_after = self.limiter.acquire(tenant_of(scope["headers"]), priority)
+        if retry_after:
+            await _too_many_requests(send, priority, retry_after)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release(bucket)
+
+async def _too_many_requests(send, priority: str, retry_after: float):
+    seconds = max(1, math.ceil(retry_after))
+    body = json.dumps({"detail": f"Too many {priority} requests, retry in {seconds}s"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(seconds).encode()),
+            (b"x-priority-class", priority.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
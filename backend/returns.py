@@ -0,0 +1,213 @@
+"""
+Returns and refunds as reversal entries.
+
+A sale is never edited. Returning some of its lines writes a refund: a
+transactions row with refund_of set to the sale and negative amounts, plus
+one transaction_items row per returned line with negative quantity and
+amounts, refund_of set to the sale's line and restocked recording whether
+the units went back on the shelf. Everything that sums sales - analytics,
+the archive's daily summaries, customer stats, shift totals - therefore nets
+refunds out as they happen, without recomputing anything. Refund receipts
+count as transactions in those totals.
+
+Amounts are prorated from what the sale actually charged, cumulatively: the
+n-th returned unit of a line refunds share(line, n) - share(line, n - 1), and
+the basket total (after its discount) is prorated the same way by refunded
+subtotal. Returning a line one unit at a time therefore refunds exactly what
+returning it at once would, and the last unit refunds whatever is left.
+
+process_return() works in the caller's transaction: it locks the sale row,
+so concurrent returns of one sale queue, checks quantities against what is
+still returnable, writes the refund and queues the customer stats delta.
+The units going back on the shelf are returned as Refund.restock; the caller
+adds them with inventory.apply_deltas() as its last write before commit.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+
+import customer_stats
+import models
+import money
+
+_txn = models.Transaction.__table__
+_items = models.TransactionItem.__table__
+
+@dataclass
+class Refund:
+    """A written refund; amounts are negative, as stored"""
+    transaction: models.Transaction
+    items_sold: int
+    subtotal_cents: int
+    promotion_cents: int
+    discount_cents: int
+    total_cents: int
+    total_refunded_cents: int         # of the sale so far, this refund included (positive)
+    lines: List[dict]
+    restock: Dict[int, int]           # {product_id: units back on the shelf}
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _share(cents: int, part: int, whole: int) -> int:
+    """cents * part / whole, rounded half up to a whole cent"""
+    if not whole:
+        return 0
+    return (2 * cents * part + whole) // (2 * whole)
+
+def get_sale(db, tenant_id: int, transaction_id: int, lock: bool = False) -> Optional[models.Transaction]:
+    """The transaction with its items; lock=True holds its row until commit"""
+    query = (
+        select(models.Transaction)
+        .options(selectinload(models.Transaction.items))
+        .where(models.Transaction.id == transaction_id, models.Transaction.tenant_id == tenant_id)
+    )
+    if lock:
+        query = query.with_for_update()
+    return db.scalars(query).first()
+
+def _returned(db, sale: models.Transaction) -> Dict[int, list]:
+    """{sale item id: [quantity returned, cents refunded]} over earlier refunds"""
+    returned = defaultdict(lambda: [0, 0])
+    item_ids = [item.id for item in sale.items]
+    if not item_ids:
+        return returned
+    for item_id, quantity, amount in db.execute(
+        select(_items.c.refund_of, func.sum(_items.c.quantity), func.sum(_items.c.total_price))
+        # Refunds are never older than their sale, which prunes older partitions
+        .where(_items.c.tenant_id == sale.tenant_id, _items.c.refund_of.in_(item_ids),
+               _items.c.created_at >= sale.created_at)
+        .group_by(_items.c.refund_of)
+    ):
+        returned[item_id] = [-int(quantity), -money.to_cents(amount)]
+    return returned
+
+def _line(item: models.TransactionItem, returned_quantity: int, refunded_cents: int) -> dict:
+    return {
+        "transaction_item_id": item.id,
+        "product_id": item.product_id,
+        "product_name": item.product_name,
+        "unit_price": item.unit_price,
+        "quantity_sold": item.quantity,
+        "quantity_returned": returned_quantity,
+        "quantity_returnable": item.quantity - returned_quantity,
+        "amount_refunded": money.from_cents(refunded_cents),
+    }
+
+def return_lines(db, sale: models.Transaction) -> List[dict]:
+    """Every line of the sale with what has been returned and what is left"""
+    returned = _returned(db, sale)
+    return [_line(item, *returned.get(item.id, (0, 0))) for item in sale.items]
+
+def refunded_cents(db, sale: models.Transaction):
+    """(subtotal, total) refunded so far, positive cents"""
+    subtotal, total = db.execute(
+        select(func.coalesce(func.sum(_txn.c.subtotal), 0), func.coalesce(func.sum(_txn.c.total_amount), 0))
+        .where(_txn.c.tenant_id == sale.tenant_id, _txn.c.refund_of == sale.id,
+               _txn.c.created_at >= sale.created_at)
+    ).one()
+    return -money.to_cents(subtotal), -money.to_cents(total)
+
+def process_return(db, user: models.User, sale: models.Transaction, requested, refund_method: str,
+                   shift_id: Optional[int] = None) -> Refund:
+    """
+    Write the refund of `requested` lines (transaction_item_id, quantity,
+    restock) of a sale locked with get_sale(lock=True); commits with the
+    caller's transaction. Raises ValueError for lines that are not part of
+    the sale or exceed what is left to return.
+    """
+    items = {item.id: item for item in sale.items}
+    # Duplicate lines in one request add up; restock flags may differ
+    wanted = defaultdict(int)
+    for line in requested:
+        item = items.get(line.transaction_item_id)
+        if item is None:
+            raise ValueError(f"Item {line.transaction_item_id} is not part of sale {sale.id}")
+        wanted[(item.id, line.restock)] += line.quantity
+
+    returned = _returned(db, sale)
+    requested_by_item = defaultdict(int)
+    for (item_id, _), quantity in wanted.items():
+        requested_by_item[item_id] += quantity
+    for item_id, quantity in requested_by_item.items():
+        item, before = items[item_id], returned[item_id][0]
+        if before + quantity > item.quantity:
+            raise ValueError(
+                f"Only {item.quantity - before} of {item.product_name} left to return on sale {sale.id}"
+            )
+
+    now = _now()
+    refund_items, restock = [], defaultdict(int)
+    subtotal_cents = promotion_cents = 0
+    for (item_id, restocked), quantity in wanted.items():
+        item = items[item_id]
+        before = returned[item_id][0]
+        after = before + quantity
+        line_cents, line_discount = money.to_cents(item.total_price), money.to_cents(item.discount_amount or 0)
+        cents = _share(line_cents, after, item.quantity) - _share(line_cents, before, item.quantity)
+        discount = _share(line_discount, after, item.quantity) - _share(line_discount, before, item.quantity)
+        returned[item_id][0] = after
+        returned[item_id][1] += cents
+        subtotal_cents += cents
+        promotion_cents += discount
+        if restocked and item.product_id is not None:
+            restock[item.product_id] += quantity
+        refund_items.append(models.TransactionItem(
+            product_id=item.product_id,
+            product_name=item.product_name,
+            quantity=-quantity,
+            unit_price=item.unit_price,
+            discount_amount=money.from_cents(-discount),
+            promotion_id=item.promotion_id,
+            total_price=money.from_cents(-cents),
+            refund_of=item.id,
+            restocked=restocked,
+            tenant_id=sale.tenant_id,
+            created_at=now,
+        ))
+
+    # The basket discount is given back in proportion to the subtotal returned
+    sale_subtotal, sale_total = money.to_cents(sale.subtotal), money.to_cents(sale.total_amount)
+    before_cents, before_total = refunded_cents(db, sale)
+    total_cents = (_share(sale_total, before_cents + subtotal_cents, sale_subtotal)
+                   - _share(sale_total, before_cents, sale_subtotal))
+    discount_cents = subtotal_cents - total_cents
+
+    refund = models.Transaction(
+        tenant_id=sale.tenant_id,
+        user_id=user.id,
+        customer_id=sale.customer_id,
+        subtotal=money.from_cents(-subtotal_cents),
+        discount_amount=money.from_cents(-discount_cents),
+        discount_type=sale.discount_type,
+        total_amount=money.from_cents(-total_cents),
+        payment_method=refund_method,
+        shift_id=shift_id,
+        refund_of=sale.id,
+        created_at=now,
+        items=refund_items,
+    )
+    db.add(refund)
+    db.flush()
+
+    if sale.customer_id:
+        customer_stats.record_sale(
+            db, sale.customer_id, -total_cents, now,
+            points=customer_stats.refund_points(sale_total, before_total, total_cents)
+        )
+
+    return Refund(
+        transaction=refund,
+        items_sold=-sum(wanted.values()),
+        subtotal_cents=-subtotal_cents,
+        promotion_cents=-promotion_cents,
+        discount_cents=-discount_cents,
+        total_cents=-total_cents,
+        total_refunded_cents=before_total + total_cents,
+        lines=[_line(item, *returned.get(item.id, (0, 0))) for item in sale.items],
+        restock=dict(restock),
+    )
@@ -1,15 +1,47 @@
 """
-Production server runner
+Server runner
 Usage: python run.py
+
+- development: single uvicorn process with auto-reload
+- production:  gunicorn with multiple uvicorn workers (gunicorn_conf.py);
+               falls back to uvicorn's own worker manager where gunicorn is
+               unavailable (e.g. Windows)
 """
+import os
+import sys
+
 import uvicorn
 from settings import settings
 
-if __name__ == "__main__":
+def run_production():
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+
+    if gunicorn is not None and os.name != "nt":
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn_conf.py", "main:app"])
+
+    import serverconf
+    workers = serverconf.worker_count()
+    serverconf.apply_pool_limits(workers)
     uvicorn.run(
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG and settings.ENVIRONMENT == "development",
-        log_level="info" if settings.ENVIRONMENT == "production" else "debug"
+        workers=workers,
+        timeout_graceful_shutdown=settings.GRACEFUL_TIMEOUT,
+        log_level="info"
     )
+
+if __name__ == "__main__":
+    if settings.ENVIRONMENT == "production" and "--single" not in sys.argv:
+        run_production()
+    else:
+        uvicorn.run(
+            "main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            reload=settings.DEBUG and settings.ENVIRONMENT == "development",
+            log_level="info" if settings.ENVIRONMENT == "production" else "debug"
+        )
@@ -1,6 +1,7 @@
-from datetime import datetime
-from pydantic import BaseModel, EmailStr, validator, field_validator
-from typing import Optional, List, Union
+from datetime import datetime, time, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from pydantic import BaseModel, EmailStr, Field, validator, field_validator, model_validator
+from typing import Literal, Optional, List, Union
 import re
 
 # ==========================================
@@ -25,6 +26,9 @@ class SignupRequest(BaseModel):
     
     # Subscription
     plan_id: str
+
+    # IANA zone, e.g. "America/Chicago"; promotion time windows use it
+    time_zone: str = "UTC"
     
     # Agreements
     terms_accepted: bool
@@ -48,6 +52,15 @@ class SignupRequest(BaseModel):
             raise ValueError(f"Password missing: {', '.join(errors)}")
         return v
     
+    @field_validator('time_zone')
+    @classmethod
+    def validate_time_zone(cls, v):
+        try:
+            ZoneInfo(v)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown time zone {v!r}")
+        return v
+
     @validator('store_code', 'registration_number', pre=True)
     def validate_optional_fields(cls, v):
         """Convert empty string to None"""
@@ -124,6 +137,7 @@ class ProductBase(BaseModel):
     selling_price: float
     stock_quantity: int = 0
     min_stock_level: int = 5
+    plu: Optional[str] = None  # scale-label PLU (see barcodes.py)
     
     @validator('category_id', pre=True, always=True)
     def validate_category_id(cls, v):
@@ -154,6 +168,7 @@ class ProductUpdate(BaseModel):
     selling_price: Optional[float] = None
     stock_quantity: Optional[int] = None
     min_stock_level: Optional[int] = None
+    plu: Optional[str] = None
 
 class ProductResponse(ProductBase):
     id: int
@@ -163,6 +178,47 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True
 
+class ScannedItem(BaseModel):
+    """A ready-to-add cart line for a scanned code"""
+    product_id: int
+    product_name: str
+    quantity: int
+    unit_price: float
+    barcode: Optional[str] = None     # set for scale labels; send back on the CartItem
+    plu: Optional[str] = None
+    weight: Optional[float] = None    # kg, for weight-embedded labels
+    stock_quantity: int
+
+class BarcodeSchemeCreate(BaseModel):
+    name: str
+    prefix: str = Field(..., pattern=r"^[0-9]{1,4}$")
+    length: int = Field(13, ge=8, le=14)
+    plu_start: int = Field(..., ge=0)
+    plu_length: int = Field(..., ge=1, le=8)
+    value_start: int = Field(..., ge=0)
+    value_length: int = Field(..., ge=1, le=8)
+    value_type: Literal["weight", "price"]
+    value_decimals: int = Field(..., ge=0, le=4)
+
+    @model_validator(mode="after")
+    def check_layout(self):
+        # Both fields must fit before the check digit and must not overlap
+        check_digit = self.length - 1
+        plu = range(self.plu_start, self.plu_start + self.plu_length)
+        value = range(self.value_start, self.value_start + self.value_length)
+        if plu.stop > check_digit or value.stop > check_digit:
+            raise ValueError("PLU and value digits must end before the check digit")
+        if set(plu) & set(value):
+            raise ValueError("PLU and value digits overlap")
+        return self
+
+class BarcodeSchemeResponse(BarcodeSchemeCreate):
+    id: int
+    tenant_id: int
+
+    class Config:
+        from_attributes = True
+
 # ==========================================
 # CUSTOMER SCHEMAS
 # ==========================================
@@ -206,6 +262,7 @@ class CartItem(BaseModel):
     quantity: int
     unit_price: float
     # We calculate line total in backend to be safe
+    barcode: Optional[str] = None  # scale label this line was scanned from; re-decoded at checkout
 
 class TransactionCreate(BaseModel):
     items: List[CartItem]
@@ -213,6 +270,7 @@ class TransactionCreate(BaseModel):
     customer_id: Optional[int] = None
     discount_type: Optional[str] = None  # 'percentage' or 'fixed'
     discount_value: Optional[float] = None
+    shift_id: Optional[int] = None  # default: the cashier's own open shift
     # Total is calculated on backend for security
 
 class TransactionItemResponse(BaseModel):
@@ -221,7 +279,11 @@ class TransactionItemResponse(BaseModel):
     product_name: str
     quantity: int
     unit_price: float
+    discount_amount: float = 0.0      # promotion savings on the line
+    promotion_id: Optional[int] = None
     total_price: float
+    refund_of: Optional[int] = None   # refund lines: the sale line returned
+    restocked: Optional[bool] = None
 
     class Config:
         from_attributes = True
@@ -240,6 +302,7 @@ class TransactionDetailResponse(BaseModel):
     created_at: datetime
     items: List[TransactionItemResponse]
     customer_name: Optional[str] = None
+    refund_of: Optional[int] = None   # refunds: the sale refunded (amounts are negative)
 
     class Config:
         from_attributes = True
@@ -250,6 +313,33 @@ class TransactionResponse(BaseModel):
     created_at: datetime
     message: str
 
+class ReturnLineRequest(BaseModel):
+    transaction_item_id: int
+    quantity: int = Field(..., ge=1)
+    restock: bool = True              # False for damaged goods
+
+class ReturnRequest(BaseModel):
+    items: List[ReturnLineRequest] = Field(..., min_length=1)
+    refund_method: Optional[str] = None  # default: the sale's payment method
+    shift_id: Optional[int] = None       # default: the cashier's own open shift
+
+class ReturnLine(BaseModel):
+    transaction_item_id: int
+    product_id: Optional[int] = None
+    product_name: str
+    unit_price: float
+    quantity_sold: int
+    quantity_returned: int
+    quantity_returnable: int
+    amount_refunded: float
+
+class ReturnResponse(BaseModel):
+    refund_id: Optional[int] = None   # None when only listing
+    transaction_id: int
+    refund_amount: float = 0.0
+    total_refunded: float
+    lines: List[ReturnLine]
+
 # ==========================================
 # ANALYTICS SCHEMAS
 # ==========================================
@@ -267,6 +357,176 @@ class SalesAnalytics(BaseModel):
     total_sales: float
     transaction_count: int
 
+class ProductSuggestion(BaseModel):
+    product_id: int
+    name: str
+    barcode: Optional[str] = None
+    selling_price: float
+    stock_quantity: int
+    lift: float
+    confidence: float
+    support: float
+
+class ProductForecast(BaseModel):
+    product_id: int
+    name: str
+    stock_quantity: int
+    units_sold: int                   # over the history window
+    ma_7: float
+    ma_28: float
+    trend: Optional[float] = None     # ma_7 / ma_28; None without sales
+    velocity: float                   # units per day
+    weekday_factors: List[float]      # Mon..Sun relative to the daily mean
+    forecast_units: float             # expected units over the horizon
+    days_of_stock: Optional[float] = None  # None when the product is not selling
+
+# ==========================================
+# PROMOTION / PRICING SCHEMAS
+# ==========================================
+
+class PromotionCreate(BaseModel):
+    name: str
+    kind: Literal["percentage", "bogo", "multi_buy"]
+    product_id: Optional[int] = None
+    category_id: Optional[int] = None
+    percent: Optional[float] = Field(None, gt=0, le=100)
+    buy_quantity: Optional[int] = Field(None, ge=1)
+    get_quantity: Optional[int] = Field(None, ge=1)
+    bundle_price: Optional[float] = Field(None, ge=0)
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    daily_start: Optional[time] = None
+    daily_end: Optional[time] = None
+    days_of_week: Optional[str] = Field(None, pattern=r"^[0-6]{1,7}$")  # Monday = 0
+    min_loyalty_points: Optional[int] = Field(None, ge=0)
+    is_active: bool = True
+
+    @field_validator("starts_at", "ends_at")
+    @classmethod
+    def naive_utc(cls, v):
+        # Stored naive UTC; a timestamp column would drop the offset
+        if v is not None and v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        return v
+
+    @model_validator(mode="after")
+    def check_rule(self):
+        required = {
+            "percentage": ("percent",),
+            "bogo": ("buy_quantity", "get_quantity"),
+            "multi_buy": ("buy_quantity", "bundle_price"),
+        }[self.kind]
+        missing = [field for field in required if getattr(self, field) is None]
+        if missing:
+            raise ValueError(f"{self.kind} promotions need {', '.join(missing)}")
+        if self.product_id is not None and self.category_id is not None:
+            raise ValueError("Target a product or a category, not both")
+        if (self.daily_start is None) != (self.daily_end is None):
+            raise ValueError("daily_start and daily_end go together")
+        return self
+
+class PromotionResponse(PromotionCreate):
+    id: int
+    tenant_id: int
+
+    class Config:
+        from_attributes = True
+
+class CartPriceItem(BaseModel):
+    product_id: int
+    quantity: int = Field(..., ge=1)
+    barcode: Optional[str] = None  # scale label, as on CartItem
+
+class CartPriceRequest(BaseModel):
+    items: List[CartPriceItem]
+    customer_id: Optional[int] = None
+    discount_type: Optional[str] = None
+    discount_value: Optional[float] = None
+
+class PricedCartLine(BaseModel):
+    product_id: int
+    product_name: str
+    quantity: int
+    unit_price: float
+    discount_amount: float
+    total_price: float
+    promotion_id: Optional[int] = None
+    promotion_name: Optional[str] = None
+
+class CartPriceResponse(BaseModel):
+    items: List[PricedCartLine]
+    promotion_savings: float
+    subtotal: float                   # after promotions
+    discount_amount: float            # basket-level discount
+    total_amount: float
+
+# ==========================================
+# SHIFT SCHEMAS
+# ==========================================
+
+class ShiftOpen(BaseModel):
+    till: str = "main"
+    opening_float: float = Field(0, ge=0)
+
+class ShiftClose(BaseModel):
+    counted_cash: Optional[float] = Field(None, ge=0)
+
+class ShiftResponse(BaseModel):
+    id: int
+    till: str
+    status: str
+    opened_by: int
+    opened_at: datetime
+    closed_at: Optional[datetime] = None
+    opening_float: float
+    transaction_count: int
+    total_amount: float
+
+    class Config:
+        from_attributes = True
+
+class ShiftBreakdown(BaseModel):
+    key: str
+    label: str
+    transaction_count: int
+    amount: float                     # sales, or discount given for discount types
+
+class ShiftReport(BaseModel):
+    shift_id: int
+    till: str
+    status: str
+    opened_at: datetime
+    closed_at: Optional[datetime] = None
+    opened_by: Optional[str] = None
+    transaction_count: int
+    items_sold: int
+    subtotal: float                   # after promotions
+    promotion_savings: float
+    discount_total: float             # basket-level discounts
+    total_amount: float
+    opening_float: float
+    cash_sales: float
+    expected_cash: float
+    counted_cash: Optional[float] = None
+    cash_variance: Optional[float] = None
+    by_cashier: List[ShiftBreakdown]
+    by_payment_method: List[ShiftBreakdown]
+    by_discount_type: List[ShiftBreakdown]
+    refund_count: int = 0
+    refund_total: float = 0.0         # included (negative) in total_amount
+    by_refund_method: List[ShiftBreakdown] = []
+
+class ZReportResponse(BaseModel):
+    id: int
+    number: int
+    shift_id: int
+    till: str
+    created_at: datetime
+    report: ShiftReport
+
+    class Config:
+        from_attributes = True
+
 # ==========================================
 # RECEIPT SCHEMAS
 # ==========================================
@@ -0,0 +1,262 @@
+"""
+In-memory product search / autocomplete.
+
+Each tenant gets a ProductIndex built on first use. It holds:
+- name tokens in a sorted array, so a prefix is a bisect range
+- barcodes sorted forwards and reversed, so typing the first or the last
+  digits of a code finds it
+
+A query matches products where every query token is a prefix of some name
+token (so "org mil" finds "Organic Milk"), or, for digit queries, whose
+barcode starts or ends with the digits. Results rank exact barcode hits
+first, then names starting with the query, then more whole-word matches,
+then shorter names.
+
+Product writes in this worker update the index in place (product_saved /
+product_removed). Writes made by other workers show up when the index is
+rebuilt, every SEARCH_INDEX_TTL_SECONDS.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Dict, List, Optional
+
+import models
+from settings import settings
+
+_TOKEN = re.compile(r"[0-9a-z]+")
+
+# Barcode matching starts at this many digits
+MIN_BARCODE_DIGITS = 3
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents, so 'Müller' matches 'muller'"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(normalize(text))
+
+class _SortedPairs:
+    """Parallel sorted key/id arrays with prefix range lookups"""
+
+    def __init__(self, pairs):
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.ids = [product_id for _, product_id in pairs]
+
+    def prefix_range(self, prefix: str):
+        return bisect_left(self.keys, prefix), bisect_right(self.keys, prefix + "\uffff")
+
+    def exact_ids(self, key: str):
+        return self.ids[bisect_left(self.keys, key):bisect_right(self.keys, key)]
+
+    def prefix_ids(self, prefix: str):
+        lo, hi = self.prefix_range(prefix)
+        return self.ids[lo:hi]
+
+    def add(self, key: str, product_id: int):
+        position = bisect_right(self.keys, key)
+        self.keys.insert(position, key)
+        self.ids.insert(position, product_id)
+
+    def remove(self, key: str, product_id: int):
+        lo, hi = bisect_left(self.keys, key), bisect_right(self.keys, key)
+        for position in range(lo, hi):
+            if self.ids[position] == product_id:
+                del self.keys[position]
+                del self.ids[position]
+                return
+
+class ProductIndex:
+    """Search index over one tenant's active products"""
+
+    def __init__(self, products):
+        self.built_at = time.monotonic()
+        self.lock = threading.Lock()
+        # product_id -> (normalized name, name tokens, barcode)
+        self.docs: Dict[int, tuple] = {}
+        # product_id -> (name length, id), the final tie-break
+        self.order: Dict[int, tuple] = {}
+        tokens, names, barcodes, reversed_barcodes = [], [], [], []
+        for product_id, name, barcode in products:
+            doc = self._doc(name, barcode)
+            self.docs[product_id] = doc
+            self.order[product_id] = (len(doc[0]), product_id)
+            tokens.extend((token, product_id) for token in set(doc[1]))
+            names.append((doc[0], product_id))
+            if doc[2]:
+                barcodes.append((doc[2], product_id))
+                reversed_barcodes.append((doc[2][::-1], product_id))
+        self.tokens = _SortedPairs(tokens)
+        # Every product, shortest name first
+        self.by_length = _SortedPairs((key, key[1]) for key in self.order.values())
+        self.names = _SortedPairs(names)
+        self.barcodes = _SortedPairs(barcodes)
+        self.reversed_barcodes = _SortedPairs(reversed_barcodes)
+
+    @staticmethod
+    def _doc(name: str, barcode: Optional[str]):
+        return normalize(name), tuple(tokenize(name)), (barcode or "").strip()
+
+    def upsert(self, product_id: int, name: str, barcode: Optional[str]):
+        with self.lock:
+            self._remove(product_id)
+            doc = self._doc(name, barcode)
+            self.docs[product_id] = doc
+            self.order[product_id] = (len(doc[0]), product_id)
+            self.by_length.add(self.order[product_id], product_id)
+            for token in set(doc[1]):
+                self.tokens.add(token, product_id)
+            self.names.add(doc[0], product_id)
+            if doc[2]:
+                self.barcodes.add(doc[2], product_id)
+                self.reversed_barcodes.add(doc[2][::-1], product_id)
+
+    def remove(self, product_id: int):
+        with self.lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id: int):
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        self.by_length.remove(self.order.pop(product_id), product_id)
+        for token in set(doc[1]):
+            self.tokens.remove(token, product_id)
+        self.names.remove(doc[0], product_id)
+        if doc[2]:
+            self.barcodes.remove(doc[2], product_id)
+            self.reversed_barcodes.remove(doc[2][::-1], product_id)
+
+    def search(self, query: str, limit: int) -> List[int]:
+        """Ids of the best `limit` matches"""
+        query_tokens = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not query_tokens:
+            return []
+        with self.lock:
+            matches = self._name_matches(query_tokens)
+            digits = query.strip()
+            exact_barcodes = set()
+            if digits.isdigit() and len(digits) >= MIN_BARCODE_DIGITS:
+                exact_barcodes = set(self.barcodes.exact_ids(digits))
+                matches.update(self.barcodes.prefix_ids(digits))
+                matches.update(self.reversed_barcodes.prefix_ids(digits[::-1]))
+            if not matches:
+                return []
+
+            starts = matches.intersection(self.names.prefix_ids(normalize(query).strip()))
+            # levels[n]: products with n + 1 query tokens as whole words
+            levels = [set()]
+            for token in query_tokens:
+                hits = set(self.tokens.exact_ids(token))
+                levels.append(set())
+                for n in range(len(levels) - 2, -1, -1):
+                    promoted = levels[n] & hits
+                    levels[n] -= promoted
+                    levels[n + 1] |= promoted
+                    hits -= promoted
+                levels[0] |= hits
+
+            # Rank with set operations rather than a per-match sort key, as a
+            # one-letter query can match thousands of products. Tiers in rank
+            # order: exact barcode, name starts with the query, the rest; within
+            # each, most whole-word matches first. Then shortest name.
+            tiers = []
+            remaining = matches
+            for group in (exact_barcodes, starts, matches):
+                group = group & remaining
+                remaining = remaining - group
+                for level in reversed(levels):
+                    tier = group & level
+                    group -= tier
+                    tiers.append(tier)
+                tiers.append(group)
+
+            results = []
+            for tier in tiers:
+                results.extend(self._shortest(tier, limit - len(results)))
+                if len(results) >= limit:
+                    break
+            return results
+
+    def _shortest(self, ids: set, count: int) -> List[int]:
+        """The `count` ids with the shortest names"""
+        if len(ids) * 32 > len(self.docs):
+            # Dense: walk all products in order, stopping after `count` hits
+            return list(islice(filter(ids.__contains__, self.by_length.ids), count))
+        return heapq.nsmallest(count, ids, key=self.order.__getitem__)
+
+    def _name_matches(self, query_tokens: List[str]) -> set:
+        # Longest token first: usually the most selective range
+        candidates = set(self.tokens.prefix_ids(query_tokens[0]))
+        for token in query_tokens[1:]:
+            if not candidates:
+                break
+            lo, hi = self.tokens.prefix_range(token)
+            if len(candidates) * 16 < hi - lo:
+                # Cheaper to check the few candidates' own tokens
+                candidates = {
+                    product_id for product_id in candidates
+                    if any(name_token.startswith(token) for name_token in self.docs[product_id][1])
+                }
+            else:
+                candidates.intersection_update(self.tokens.ids[lo:hi])
+        return candidates
+
+# ==========================================
+# PER-TENANT REGISTRY
+# ==========================================
+
+_indexes: Dict[int, ProductIndex] = {}
+_build_locks: Dict[int, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+def build_index(db, tenant_id: int) -> ProductIndex:
+    product = models.Product
+    rows = db.query(product.id, product.name, product.barcode).filter(
+        product.tenant_id == tenant_id,
+        product.is_active == True
+    ).all()
+    return ProductIndex(rows)
+
+def get_index(db, tenant_id: int) -> ProductIndex:
+    """The tenant's index, (re)built when missing or older than SEARCH_INDEX_TTL_SECONDS"""
+    index = _indexes.get(tenant_id)
+    if index is not None and time.monotonic() - index.built_at < settings.SEARCH_INDEX_TTL_SECONDS:
+        return index
+    with _registry_lock:
+        build_lock = _build_locks.setdefault(tenant_id, threading.Lock())
+    # One build per tenant at a time; concurrent requests wait for it
+    with build_lock:
+        index = _indexes.get(tenant_id)
+        if index is None or time.monotonic() - index.built_at >= settings.SEARCH_INDEX_TTL_SECONDS:
+            index = build_index(db, tenant_id)
+            _indexes[tenant_id] = index
+    return index
+
+def product_saved(product):
+    """Reflect a created/updated product in its tenant's index, if built"""
+    index = _indexes.get(product.tenant_id)
+    if index is None:
+        return
+    if product.is_active is False:
+        index.remove(product.id)
+    else:
+        index.upsert(product.id, product.name, product.barcode)
+
+def product_removed(tenant_id: int, product_id: int):
+    index = _indexes.get(tenant_id)
+    if index is not None:
+        index.remove(product_id)
+
+def invalidate(tenant_id: int = None):
+    with _registry_lock:
+        if tenant_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(tenant_id, None)
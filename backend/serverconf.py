@@ -0,0 +1,47 @@
+"""
+Production server sizing.
+
+Workers are sized from the CPU count but capped so that every worker's
+SQLAlchemy pool (pool_size + max_overflow) fits inside DB_MAX_CONNECTIONS,
+the number of Postgres connections this deployment is allowed to hold.
+Used by gunicorn_conf.py and run.py.
+"""
+import os
+
+from settings import settings
+
+# Connections kept free for migrations, psql sessions and the job runner
+RESERVED_CONNECTIONS = 3
+
+# Below this a worker would queue on its own pool under normal load
+MIN_CONNECTIONS_PER_WORKER = 2
+
+def connection_budget() -> int:
+    return max(settings.DB_MAX_CONNECTIONS - RESERVED_CONNECTIONS, MIN_CONNECTIONS_PER_WORKER)
+
+def worker_count() -> int:
+    """WEB_CONCURRENCY if set, else 2 x CPU + 1, capped by the DB connection budget"""
+    if settings.WEB_CONCURRENCY > 0:
+        workers = settings.WEB_CONCURRENCY
+    else:
+        workers = (os.cpu_count() or 1) * 2 + 1
+    return max(1, min(workers, connection_budget() // MIN_CONNECTIONS_PER_WORKER))
+
+def pool_limits(workers: int):
+    """(pool_size, max_overflow) per worker so that the total stays within budget"""
+    per_worker = max(connection_budget() // workers, MIN_CONNECTIONS_PER_WORKER)
+    pool_size = min(settings.DB_POOL_SIZE, per_worker)
+    max_overflow = min(settings.DB_MAX_OVERFLOW, per_worker - pool_size)
+    return pool_size, max_overflow
+
+def apply_pool_limits(workers: int):
+    """
+    Write the per-worker pool sizes into settings (and the environment, for
+    workers that re-import settings) before database.py creates the engine.
+    """
+    pool_size, max_overflow = pool_limits(workers)
+    settings.DB_POOL_SIZE = pool_size
+    settings.DB_MAX_OVERFLOW = max_overflow
+    os.environ["DB_POOL_SIZE"] = str(pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+    return pool_size, max_overflow
@@ -32,6 +32,105 @@ class Settings(BaseSettings):
     HOST: str = "127.0.0.1"
     PORT: int = 8000
 
+    # Production server profile - see gunicorn_conf.py / serverconf.py
+    WEB_CONCURRENCY: int = 0          # 0 = size from CPU count
+    DB_MAX_CONNECTIONS: int = 60      # Postgres connections this deployment may hold
+    DB_POOL_SIZE: int = 10            # per worker, before capping to the budget
+    DB_MAX_OVERFLOW: int = 20
+    PRELOAD_APP: bool = True
+    GRACEFUL_TIMEOUT: int = 30
+
+    # Startup schema check against schema_version (off | warn | strict)
+    SCHEMA_CHECK: str = "warn"
+
+    # Query budgets (off | warn | raise) - see query_budget.py
+    QUERY_BUDGET_MODE: str = "off"
+    QUERY_REPEAT_THRESHOLD: int = 5
+
+    # Response compression - see compression.py
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    COMPRESSION_CACHE_MB: int = 32
+
+    # Cold storage for old sales - see archive.py
+    ARCHIVE_DIR: str = "sales_archive"
+    ARCHIVE_HORIZON_DAYS: int = 730
+
+    # Batched customer stat updates - see customer_stats.py
+    CUSTOMER_STATS_FLUSH_SECONDS: float = 2.0
+    CUSTOMER_STATS_BATCH_SIZE: int = 1000
+
+    # Background jobs - see jobs.py
+    JOB_WORKERS: int = 2              # runner threads per API worker (0 = standalone runner only)
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_LEASE_SECONDS: int = 300
+
+    # Demand forecasts - see forecasting.py
+    FORECAST_CACHE_SECONDS: int = 900
+
+    # Frequently-bought-together mining - see basket.py
+    BASKET_CHUNK_ROWS: int = 200000
+    BASKET_MAX_PAIRS: int = 2000000   # ~32MB of pair counts
+    BASKET_MIN_PAIR_COUNT: int = 3
+    BASKET_TOP_K: int = 10
+    BASKET_MINE_LEASE_SECONDS: int = 3600  # job lease; a mine must finish within it
+
+    # Product search index - see search.py
+    SEARCH_INDEX_TTL_SECONDS: int = 300   # full rebuild, picks up other workers' writes
+
+    # Variable-measure barcode schemes - see barcodes.py
+    BARCODE_SCHEME_CACHE_SECONDS: int = 60
+
+    # Dashboard / sales analytics result cache - see singleflight.py
+    ANALYTICS_CACHE_SECONDS: float = 5.0     # served as fresh
+    ANALYTICS_STALE_SECONDS: float = 30.0    # then served stale while one refresh runs
+
+    # Per-tenant rate limits and load shedding, per worker - see ratelimit.py
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_MAX_INFLIGHT: int = 40        # anyio's default threadpool size
+    RATE_LIMIT_CRITICAL_RPS: float = 50.0    # checkout, scanning
+    RATE_LIMIT_CRITICAL_BURST: int = 100
+    RATE_LIMIT_CRITICAL_CONCURRENCY: int = 24
+    RATE_LIMIT_STANDARD_RPS: float = 20.0    # listings, CRUD
+    RATE_LIMIT_STANDARD_BURST: int = 60
+    RATE_LIMIT_STANDARD_CONCURRENCY: int = 8
+    RATE_LIMIT_BULK_RPS: float = 2.0         # analytics, reports
+    RATE_LIMIT_BULK_BURST: int = 10
+    RATE_LIMIT_BULK_CONCURRENCY: int = 2
+
+    # Store-local edge server - see sync.py
+    EDGE_MODE: bool = False                  # DATABASE_URL is the store's SQLite file
+    EDGE_TENANT_ID: int = 0                  # the store this server serves
+    SYNC_UPSTREAM_URL: str = ""              # cloud database to replicate with
+    SYNC_INTERVAL_SECONDS: float = 15.0
+    SYNC_BATCH_SIZE: int = 500               # sales per cloud transaction
+    SYNC_CUSTOMERS_SECONDS: float = 300.0    # full customer refresh
+
+    # Sampling profiler and slow-request capture - see profiling.py
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.01      # fraction of requests kept regardless of time
+    PROFILING_SLOW_MS: float = 1000.0        # requests at least this slow are always kept
+    PROFILING_INTERVAL_MS: float = 5.0       # stack sampling period
+    PROFILING_DIR: str = "profiles"
+    PROFILING_KEEP: int = 50                 # newest profiles kept on disk
+    PROFILING_MAX_STATEMENTS: int = 500      # statement log entries per profile
+
+    # Slow query log - see querylog.py
+    QUERY_LOG_ENABLED: bool = False
+    QUERY_LOG_DIR: str = "querylog"
+    QUERY_LOG_FLUSH_SECONDS: float = 30.0    # aggregates written per worker
+    QUERY_LOG_EXPLAIN_MS: float = 200.0      # statements at least this slow may be explained
+    QUERY_LOG_EXPLAIN_RATE: float = 0.1      # fraction of those that are
+    QUERY_LOG_EXPLAIN_INTERVAL_SECONDS: float = 600.0   # per fingerprint
+    QUERY_LOG_KEEP_PLANS: int = 200
+
+    # Admin/debug endpoints (X-Admin-Token header); empty disables them
+    ADMIN_TOKEN: str = ""
+
     model_config = SettingsConfigDict(
         env_file=".env", 
         extra="ignore",
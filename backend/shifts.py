@@ -0,0 +1,227 @@
+"""
+Till shifts with incremental totals and immutable Z-reports.
+
+A cashier opens a shift on a till (one open shift per till). Every sale
+rung up on it adds to the shift's running totals in the sale's own
+transaction (record_sale): the shifts row itself, plus shift_totals rows per
+cashier, payment method, discount type and refund method. Refunds net
+their amounts out of the same totals (see returns.py). The shifts row is updated
+first and stays locked until the sale commits, so the sales of one shift
+apply their totals one after another and a first-time shift_totals insert
+cannot race.
+
+Closing a shift flips its status (waiting for sales still in flight), then
+builds the report from the shifts row and its handful of shift_totals rows,
+so closing costs the same at 50 or 5,000 sales. The report is stored as a
+JSON snapshot in z_reports, numbered per till, and never changes
+afterwards. An open shift's live report (X-report) is built the same way.
+
+A sale names its shift explicitly (shift_id) or goes to the open shift its
+cashier opened. Sales with no open shift are not assigned to any shift.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+import models
+import money
+
+CASHIER = "cashier"
+PAYMENT_METHOD = "payment_method"
+DISCOUNT_TYPE = "discount_type"
+REFUND = "refund"                # by refund method
+
+# discount_type key for promotion savings on lines
+PROMOTION = "promotion"
+
+_shifts = models.Shift.__table__
+_totals = models.ShiftTotal.__table__
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def open_shift(db, user: models.User, till: str, opening_float: float) -> models.Shift:
+    """Open a shift; raises ValueError when the till already has one open"""
+    shift = models.Shift(
+        tenant_id=user.tenant_id,
+        till=till,
+        status="open",
+        opened_by=user.id,
+        opened_at=_now(),
+        opening_float=money.from_cents(money.to_cents(opening_float)),
+    )
+    db.add(shift)
+    try:
+        # ux_shifts_open_till decides between two concurrent opens
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise ValueError(f"Till '{till}' already has an open shift")
+    return shift
+
+def sale_shift(db, tenant_id: int, user_id: int, shift_id: Optional[int] = None) -> Optional[int]:
+    """
+    Shift a sale belongs to: shift_id when given (LookupError unless it is
+    open), else the open shift this cashier opened, else None
+    """
+    if shift_id is not None:
+        found = db.scalar(select(_shifts.c.id).where(
+            _shifts.c.id == shift_id, _shifts.c.tenant_id == tenant_id, _shifts.c.status == "open"
+        ))
+        if found is None:
+            raise LookupError(f"Shift {shift_id} is not open")
+        return found
+    return db.scalar(
+        select(_shifts.c.id)
+        .where(_shifts.c.tenant_id == tenant_id, _shifts.c.opened_by == user_id, _shifts.c.status == "open")
+        .order_by(_shifts.c.opened_at.desc())
+        .limit(1)
+    )
+
+def record_sale(db, shift_id: int, cashier_id: int, payment_method: str, discount_type: Optional[str],
+                items_sold: int, subtotal_cents: int, promotion_cents: int, discount_cents: int,
+                total_cents: int, refund: bool = False):
+    """
+    Add a sale to the shift's running totals, or with refund=True a refund
+    (negative amounts, see returns.py); commits with the caller's
+    transaction. Raises ValueError when the shift was closed meanwhile.
+    """
+    values = {
+        "items_sold": _shifts.c.items_sold + items_sold,
+        "subtotal": _shifts.c.subtotal + money.from_cents(subtotal_cents),
+        "promotion_savings": _shifts.c.promotion_savings + money.from_cents(promotion_cents),
+        "discount_total": _shifts.c.discount_total + money.from_cents(discount_cents),
+        "total_amount": _shifts.c.total_amount + money.from_cents(total_cents),
+    }
+    if refund:
+        values["refund_count"] = _shifts.c.refund_count + 1
+        values["refund_total"] = _shifts.c.refund_total - money.from_cents(total_cents)
+    else:
+        values["transaction_count"] = _shifts.c.transaction_count + 1
+    result = db.execute(
+        update(_shifts).where(_shifts.c.id == shift_id, _shifts.c.status == "open").values(**values)
+    )
+    if not result.rowcount:
+        raise ValueError(f"Shift {shift_id} has been closed, open a new shift")
+
+    # Refunds net the amounts out without counting as transactions
+    count = 0 if refund else 1
+    _add(db, shift_id, CASHIER, str(cashier_id), count, total_cents)
+    _add(db, shift_id, PAYMENT_METHOD, payment_method, count, total_cents)
+    if discount_cents:
+        _add(db, shift_id, DISCOUNT_TYPE, discount_type, count, discount_cents)
+    if promotion_cents:
+        _add(db, shift_id, DISCOUNT_TYPE, PROMOTION, count, promotion_cents)
+    if refund:
+        _add(db, shift_id, REFUND, payment_method, 1, -total_cents)
+
+def _add(db, shift_id: int, dimension: str, key: str, count: int, cents: int):
+    # Safe as update-then-insert: the caller holds the shift's row lock
+    result = db.execute(
+        update(_totals)
+        .where(_totals.c.shift_id == shift_id, _totals.c.dimension == dimension, _totals.c.key == key)
+        .values(
+            transaction_count=_totals.c.transaction_count + count,
+            amount=_totals.c.amount + money.from_cents(cents)
+        )
+    )
+    if not result.rowcount:
+        db.execute(_totals.insert().values(
+            shift_id=shift_id, dimension=dimension, key=key,
+            transaction_count=count, amount=money.from_cents(cents),
+        ))
+
+# ==========================================
+# REPORTS
+# ==========================================
+
+def _amount(value) -> float:
+    return float(money.from_cents(money.to_cents(value)))
+
+def build_report(db, shift: models.Shift, counted_cash: Optional[float] = None) -> dict:
+    """Report of a shift from its running totals; JSON-ready"""
+    rows = db.execute(
+        select(_totals.c.dimension, _totals.c.key, _totals.c.transaction_count, _totals.c.amount)
+        .where(_totals.c.shift_id == shift.id)
+        .order_by(_totals.c.dimension, _totals.c.key)
+    ).all()
+    cashier_ids = {int(key) for dimension, key, _, _ in rows if dimension == CASHIER}
+    cashier_ids.add(shift.opened_by)
+    names = {
+        user_id: f"{first} {last}"
+        for user_id, first, last in db.execute(
+            select(models.User.id, models.User.first_name, models.User.last_name)
+            .where(models.User.id.in_(cashier_ids))
+        )
+    }
+
+    breakdowns = {CASHIER: [], PAYMENT_METHOD: [], DISCOUNT_TYPE: [], REFUND: []}
+    for dimension, key, count, amount in rows:
+        label = names.get(int(key), key) if dimension == CASHIER else key
+        breakdowns[dimension].append({
+            "key": key, "label": label, "transaction_count": count, "amount": _amount(amount)
+        })
+
+    cash_cents = sum(money.to_cents(entry["amount"]) for entry in breakdowns[PAYMENT_METHOD] if entry["key"] == "cash")
+    expected_cents = money.to_cents(shift.opening_float) + cash_cents
+    counted_cents = None if counted_cash is None else money.to_cents(counted_cash)
+    return {
+        "shift_id": shift.id,
+        "till": shift.till,
+        "status": shift.status,
+        "opened_at": shift.opened_at.isoformat(),
+        "closed_at": shift.closed_at.isoformat() if shift.closed_at else None,
+        "opened_by": names.get(shift.opened_by),
+        "transaction_count": shift.transaction_count,
+        "items_sold": shift.items_sold,
+        "subtotal": _amount(shift.subtotal),
+        "promotion_savings": _amount(shift.promotion_savings),
+        "discount_total": _amount(shift.discount_total),
+        "total_amount": _amount(shift.total_amount),
+        "refund_count": shift.refund_count,
+        "refund_total": _amount(shift.refund_total),
+        "opening_float": _amount(shift.opening_float),
+        "cash_sales": float(money.from_cents(cash_cents)),
+        "expected_cash": float(money.from_cents(expected_cents)),
+        "counted_cash": None if counted_cents is None else float(money.from_cents(counted_cents)),
+        "cash_variance": None if counted_cents is None else float(money.from_cents(counted_cents - expected_cents)),
+        "by_cashier": breakdowns[CASHIER],
+        "by_payment_method": breakdowns[PAYMENT_METHOD],
+        "by_discount_type": breakdowns[DISCOUNT_TYPE],
+        "by_refund_method": breakdowns[REFUND],
+    }
+
+def close_shift(db, shift: models.Shift, user: models.User, counted_cash: Optional[float] = None) -> models.ZReport:
+    """
+    Close the shift and write its Z-report; commits with the caller's
+    transaction. Raises ValueError when it is already closed.
+    """
+    closed_at = _now()
+    # Waits for sales of this shift still in flight; later ones are refused
+    result = db.execute(
+        update(_shifts)
+        .where(_shifts.c.id == shift.id, _shifts.c.status == "open")
+        .values(status="closed", closed_at=closed_at, closed_by=user.id)
+    )
+    if not result.rowcount:
+        raise ValueError(f"Shift {shift.id} is already closed")
+    # Final totals, including the sales that committed while we waited
+    db.refresh(shift)
+
+    # Only one shift per till is open, so numbering cannot race
+    number = (db.scalar(
+        select(func.max(models.ZReport.number))
+        .where(models.ZReport.tenant_id == shift.tenant_id, models.ZReport.till == shift.till)
+    ) or 0) + 1
+    z_report = models.ZReport(
+        tenant_id=shift.tenant_id,
+        shift_id=shift.id,
+        till=shift.till,
+        number=number,
+        report=build_report(db, shift, counted_cash),
+        created_at=closed_at,
+    )
+    db.add(z_report)
+    return z_report
@@ -0,0 +1,121 @@
+"""
+Request coalescing for expensive read endpoints.
+
+Group.do(key, fn) runs fn once for all concurrent callers with the same
+key: the first caller computes, the others block until it finishes and get
+the same result (or exception). When a store opens and every terminal asks
+for the same dashboard, the aggregates run once instead of once per request.
+
+Cache adds a short-TTL result cache with stale-while-revalidate on top:
+- fresh (younger than ttl): returned as is
+- stale (younger than ttl + stale_ttl): returned as is, and one background
+  refresh is started with its own session
+- missing or older: computed through the Group, so concurrent misses share
+  one computation
+
+Both are per process; each API worker coalesces its own requests.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class Group:
+    """Duplicate suppression for concurrent calls with the same key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = fn()
+            return call.value
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+class Cache:
+    """Single-flight result cache with stale-while-revalidate"""
+
+    def __init__(self, ttl: float, stale_ttl: float, session_factory):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.session_factory = session_factory
+        self._group = Group()
+        self._lock = threading.Lock()
+        # key -> (computed at, value)
+        self._entries: Dict[Hashable, tuple] = {}
+        self._refreshing = set()
+
+    def get(self, key: Hashable, compute: Callable, db):
+        """compute(db) -> value, run only on a miss and shared by concurrent misses"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self._refresh(key, compute)
+                return entry[1]
+        return self._load(key, lambda: compute(db))
+
+    def invalidate(self, match: Callable[[Hashable], bool] = None):
+        with self._lock:
+            for key in [k for k in self._entries if match is None or match(k)]:
+                del self._entries[key]
+
+    def _load(self, key: Hashable, thunk: Callable[[], Any]):
+        def run():
+            value = thunk()
+            now = time.monotonic()
+            with self._lock:
+                # Drop entries past their stale window so idle tenants don't pile up
+                horizon = self.ttl + self.stale_ttl
+                for expired in [k for k, (at, _) in self._entries.items() if now - at >= horizon]:
+                    del self._entries[expired]
+                self._entries[key] = (now, value)
+            return value
+        return self._group.do(key, run)
+
+    def _refresh(self, key: Hashable, compute: Callable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            db = self.session_factory()
+            try:
+                self._load(key, lambda: compute(db))
+            except Exception:
+                # The stale value keeps being served until it expires
+                logger.exception(f"Background refresh of {key!r} failed")
+            finally:
+                db.close()
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="cache-refresh", daemon=True).start()
@@ -0,0 +1,487 @@
+"""
+Store-local edge server: the same API on a local SQLite database, replicated
+with the cloud database in the background.
+
+With EDGE_MODE=true a server in the store serves one tenant (EDGE_TENANT_ID)
+from DATABASE_URL, a local SQLite file in WAL mode (see database.py), so
+scans and checkouts run at LAN latency and keep working through WAN
+outages. A Replicator thread started from the app lifespan syncs with
+SYNC_UPSTREAM_URL every SYNC_INTERVAL_SECONDS:
+
+- push, sales up: local transactions past the push cursor are copied in
+  batches. Each copy records its origin ("<node id>:<local id>"), so a batch
+  retried after a lost commit is skipped instead of doubled. The cursor only
+  moves after the cloud commit.
+- pull, catalog down: products whose sync_version (stamped from
+  tenants.product_version by every write, see models.py) is past the
+  pulled version; categories and promotions when their tenant version
+  moved; users and barcode schemes on every pull; customers every
+  SYNC_CUSTOMERS_SECONDS. Rows keep their cloud ids, so pushed sales refer
+  to the same products, cashiers and customers.
+
+Stock conflict rules:
+- Sales travel as deltas: the cloud applies stock_quantity - sold. Cloud
+  checkouts and returns write deltas too (see inventory.py), so edge sales
+  and cloud sales and returns of a product all count, whatever the order.
+  An absolute stock edit in the back office still overwrites deltas
+  committed since the editor loaded the product.
+- Refunds (see returns.py) are pushed like sales, with negative quantities;
+  only restocked lines give stock back.
+- The cloud owns absolute stock. A pulled product's local stock is the cloud
+  value minus the local sales not pushed yet (customer stats likewise).
+- A pushed sale is never rejected for stock, as the goods have left the
+  store. Cloud stock may go negative and is logged as an oversell.
+
+Catalog and customer edits are refused on the edge (cloud_only), since the
+next pull would overwrite them.
+
+Usage (DATABASE_URL is the local database):
+    python sync.py once       # push, then pull
+    python sync.py push
+    python sync.py pull
+    python sync.py status     # node id, cursors, unpushed sales
+"""
+import argparse
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, create_engine, func, or_, select, update
+from sqlalchemy.orm import Session
+
+import archive
+import barcodes
+import caching
+import customer_stats
+import database
+import inventory
+import models
+import money
+import returns
+import search
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# sync_state keys
+NODE_ID = "node_id"
+PUSH_CURSOR = "push_cursor"            # last local transaction id pushed
+PRODUCT_CURSOR = "product_version"     # highest products.sync_version pulled
+CATEGORY_VERSION = "category_version"  # cloud tenant versions last mirrored
+PRICING_VERSION = "pricing_version"
+CUSTOMERS_PULLED_AT = "customers_pulled_at"
+PUSHED_AT = "pushed_at"
+PULLED_AT = "pulled_at"
+
+# Cloud tenant columns that stay local: they key this server's own caches
+LOCAL_TENANT_COLUMNS = {"product_version", "category_version", "pricing_version"}
+
+# Keeps IN (...) lists under SQLite's bound parameter limit
+CHUNK = 500
+
+_state = models.SyncState.__table__
+_tenants = models.Tenant.__table__
+_products = models.Product.__table__
+_txn = models.Transaction.__table__
+_items = models.TransactionItem.__table__
+
+def cloud_only():
+    """Dependency for writes to cloud-owned data; refused on an edge server"""
+    if settings.EDGE_MODE:
+        raise HTTPException(
+            status_code=409,
+            detail="This is a store server: edit the catalog and customers in the cloud app"
+        )
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), CHUNK):
+        yield values[start:start + CHUNK]
+
+# ==========================================
+# STATE
+# ==========================================
+
+def read_state(db) -> dict:
+    return dict(db.execute(select(_state.c.key, _state.c.value)).all())
+
+def set_state(db, key: str, value):
+    if not db.execute(update(_state).where(_state.c.key == key).values(value=str(value))).rowcount:
+        db.execute(_state.insert().values(key=key, value=str(value)))
+
+def node_id(local) -> str:
+    """
+    Random id of this edge database, created once. A rebuilt database gets a
+    new one, so its restarted transaction ids never collide with old origins.
+    """
+    with Session(local) as db:
+        value = read_state(db).get(NODE_ID)
+        if value is None:
+            value = uuid.uuid4().hex[:12]
+            set_state(db, NODE_ID, value)
+            db.commit()
+        return value
+
+def create_upstream_engine(url: str = None):
+    engine = create_engine(url or settings.SYNC_UPSTREAM_URL, pool_pre_ping=True, pool_size=2, max_overflow=0)
+    if engine.dialect.name == "sqlite":
+        database.configure_sqlite(engine)
+    return engine
+
+# ==========================================
+# PUSH (SALES UP)
+# ==========================================
+
+def push(local, cloud, tenant_id: int, batch_size: int = None, log=print) -> int:
+    """Copy unpushed local sales to the cloud; returns how many were pushed"""
+    batch_size = batch_size or settings.SYNC_BATCH_SIZE
+    node = node_id(local)
+    pushed = 0
+    while True:
+        with Session(local) as db:
+            cursor = int(read_state(db).get(PUSH_CURSOR, 0))
+            sales = db.execute(
+                select(*[_txn.c[name] for name in archive.TRANSACTION_COLUMNS])
+                .where(_txn.c.tenant_id == tenant_id, _txn.c.id > cursor)
+                .order_by(_txn.c.id)
+                .limit(batch_size)
+            ).mappings().all()
+            if not sales:
+                return pushed
+            items = db.execute(
+                select(*[_items.c[name] for name in archive.ITEM_COLUMNS])
+                .where(_items.c.transaction_id.in_([sale["id"] for sale in sales]))
+                .order_by(_items.c.id)
+            ).mappings().all()
+
+        copied = _push_batch(cloud, tenant_id, node, sales, items, log)
+        with Session(local) as db:
+            set_state(db, PUSH_CURSOR, sales[-1]["id"])
+            set_state(db, PUSHED_AT, _now().isoformat())
+            db.commit()
+        pushed += copied
+        log(f"✓ Pushed {copied} sales (local ids up to {sales[-1]['id']})")
+        if len(sales) < batch_size:
+            return pushed
+
+def _push_batch(cloud, tenant_id: int, node: str, sales, items, log) -> int:
+    """One cloud transaction: sales, their items, stock deltas and customer stats"""
+    items_of = defaultdict(list)
+    for item in items:
+        items_of[item["transaction_id"]].append(item)
+    origins = {f"{node}:{sale['id']}": sale for sale in sales}
+
+    with Session(cloud) as db:
+        done = set(db.scalars(select(_txn.c.origin).where(_txn.c.origin.in_(list(origins)))))
+        # Refunds point at their sale's cloud copy, found through its origin
+        refunded = {f"{node}:{sale['refund_of']}" for sale in sales if sale["refund_of"] is not None}
+        cloud_ids = dict(db.execute(
+            select(_txn.c.origin, _txn.c.id).where(_txn.c.origin.in_(list(refunded)))
+        ).all()) if refunded else {}
+        copies = {}
+        sold = defaultdict(int)
+        for origin, sale in origins.items():
+            if origin in done:
+                continue
+            txn = models.Transaction(
+                **{name: sale[name] for name in archive.TRANSACTION_COLUMNS if name not in ("id", "refund_of")},
+                origin=origin
+            )
+            if sale["refund_of"] is not None:
+                sale_origin = f"{node}:{sale['refund_of']}"
+                if sale_origin in copies:
+                    # Sale in this same batch: flush it for its id
+                    db.flush()
+                    cloud_ids[sale_origin] = copies[sale_origin].id
+                txn.refund_of = cloud_ids.get(sale_origin)
+            points = None
+            if txn.refund_of is not None and sale["customer_id"]:
+                # Points come back on what is left of the sale, as on the store
+                # server; the query flushes this batch's earlier refunds
+                refunded_sale = db.query(models.Transaction).filter(models.Transaction.id == txn.refund_of).one()
+                points = customer_stats.refund_points(
+                    money.to_cents(refunded_sale.total_amount), returns.refunded_cents(db, refunded_sale)[1],
+                    -money.to_cents(sale["total_amount"])
+                )
+            # Item-level refund links stay on the store server, where the
+            # sale's returns are handled
+            txn.items = [
+                models.TransactionItem(
+                    **{name: item[name] for name in archive.ITEM_COLUMNS
+                       if name not in ("id", "transaction_id", "refund_of")}
+                )
+                for item in items_of[sale["id"]]
+            ]
+            db.add(txn)
+            copies[origin] = txn
+            for item in items_of[sale["id"]]:
+                # Refund lines are negative; unsellable returns never reached the shelf
+                if item["restocked"] is not False:
+                    sold[item["product_id"]] += item["quantity"]
+            if sale["customer_id"]:
+                customer_stats.record_sale(
+                    db, sale["customer_id"], money.to_cents(sale["total_amount"]), sale["created_at"], points=points
+                )
+
+        if sold:
+            # Deltas, never absolute values, written last: they hold the
+            # tenant and product locks until the commit (see inventory.py).
+            # The stamp sends the new stock back down to every edge
+            db.flush()
+            inventory.apply_deltas(db, tenant_id, {product_id: -quantity for product_id, quantity in sold.items()})
+            for product_id, name, stock in db.execute(
+                select(_products.c.id, _products.c.name, _products.c.stock_quantity)
+                .where(_products.c.id.in_(list(sold)), _products.c.stock_quantity < 0)
+            ):
+                logger.warning(f"Oversold: product {product_id} ({name}) of tenant {tenant_id} at {stock}")
+        db.commit()
+    return len(origins) - len(done)
+
+# ==========================================
+# PULL (CATALOG DOWN)
+# ==========================================
+
+def _rows(db, table, *where):
+    return [dict(row) for row in db.execute(select(table).where(*where).order_by(table.c.id)).mappings()]
+
+def _upsert(db, table, rows):
+    """Insert or overwrite rows, keeping their cloud ids"""
+    for chunk in _chunks(rows):
+        existing = set(db.scalars(select(table.c.id).where(table.c.id.in_([row["id"] for row in chunk]))))
+        inserts = [row for row in chunk if row["id"] not in existing]
+        updates = [
+            {**{key: value for key, value in row.items() if key != "id"}, "_id": row["id"]}
+            for row in chunk if row["id"] in existing
+        ]
+        if inserts:
+            db.execute(table.insert(), inserts)
+        if updates:
+            db.execute(table.update().where(table.c.id == bindparam("_id")), updates)
+
+def _mirror(db, table, tenant_id: int, rows) -> int:
+    """Make the tenant's local rows equal to `rows`; returns the rows changed or removed"""
+    ids = {row["id"] for row in rows}
+    local = {row["id"]: row for row in _rows(db, table, table.c.tenant_id == tenant_id)}
+    gone = [row_id for row_id in local if row_id not in ids]
+    for chunk in _chunks(gone):
+        db.execute(table.delete().where(table.c.id.in_(chunk)))
+    changed = [row for row in rows if local.get(row["id"]) != row]
+    _upsert(db, table, changed)
+    return len(changed) + len(gone)
+
+def _unpushed(db, tenant_id: int, cursor: int):
+    """Stock and customer stats of local sales the cloud has not seen yet"""
+    stock = dict(db.execute(
+        select(_items.c.product_id, func.sum(_items.c.quantity))
+        .where(_items.c.tenant_id == tenant_id, _items.c.transaction_id > cursor,
+               or_(_items.c.restocked.is_(None), _items.c.restocked.is_(True)))
+        .group_by(_items.c.product_id)
+    ).all())
+    rows = db.execute(
+        select(_txn.c.customer_id, _txn.c.total_amount, _txn.c.created_at, _txn.c.refund_of)
+        .where(_txn.c.tenant_id == tenant_id, _txn.c.id > cursor, _txn.c.customer_id.is_not(None))
+        .order_by(_txn.c.id)
+    ).all()
+    # Refunds take points back on what is left of their sale, so replay each
+    # refunded sale: {sale id: [sale cents, refunded cents before the cursor]}
+    refunded = {}
+    sale_ids = list({row.refund_of for row in rows} - {None})
+    if sale_ids:
+        refunded = {sale_id: [money.to_cents(total), 0] for sale_id, total in db.execute(
+            select(_txn.c.id, _txn.c.total_amount).where(_txn.c.id.in_(sale_ids))
+        )}
+        for sale_id, total in db.execute(
+            select(_txn.c.refund_of, _txn.c.total_amount).where(_txn.c.refund_of.in_(sale_ids), _txn.c.id <= cursor)
+        ):
+            refunded[sale_id][1] -= money.to_cents(total)
+    customers = {}
+    for customer_id, total, sold_at, refund_of in rows:
+        entry = customers.setdefault(customer_id, [0, 0, sold_at])
+        cents = money.to_cents(total)
+        entry[0] += cents
+        if refund_of in refunded:
+            sale_cents, before = refunded[refund_of]
+            entry[1] += customer_stats.refund_points(sale_cents, before, -cents)
+            refunded[refund_of][1] = before - cents
+        else:
+            entry[1] += customer_stats.loyalty_points_for(cents)
+        entry[2] = max(entry[2], sold_at)
+    return stock, customers
+
+def pull(local, cloud, tenant_id: int, customers: bool = True, log=print) -> dict:
+    """Bring the tenant's catalog down from the cloud; returns rows changed per table"""
+    with Session(local) as db:
+        state = read_state(db)
+    product_cursor = int(state[PRODUCT_CURSOR]) if PRODUCT_CURSOR in state else None
+
+    # Read the cloud side first; the local transaction below stays short
+    with Session(cloud) as src:
+        tenant = src.execute(select(_tenants).where(_tenants.c.id == tenant_id)).mappings().first()
+        if tenant is None:
+            raise LookupError(f"Tenant {tenant_id} not found upstream")
+        tenant = dict(tenant)
+        users = _rows(src, models.User.__table__, models.User.tenant_id == tenant_id)
+        schemes = _rows(src, models.BarcodeScheme.__table__, models.BarcodeScheme.tenant_id == tenant_id)
+        categories = promotion_rows = customer_rows = None
+        if str(tenant["category_version"]) != state.get(CATEGORY_VERSION):
+            categories = _rows(src, models.Category.__table__, models.Category.tenant_id == tenant_id)
+        if str(tenant["pricing_version"]) != state.get(PRICING_VERSION):
+            promotion_rows = _rows(src, models.Promotion.__table__, models.Promotion.tenant_id == tenant_id)
+        where = [_products.c.tenant_id == tenant_id]
+        if product_cursor is not None:
+            where.append(_products.c.sync_version > product_cursor)
+        products = _rows(src, _products, *where)
+        if customers:
+            customer_rows = _rows(src, models.Customer.__table__, models.Customer.tenant_id == tenant_id)
+            # Sales already pushed but not yet flushed into the cloud rows
+            pending = customer_stats.pending_totals(src, [row["id"] for row in customer_rows])
+            for row in customer_rows:
+                cents, points, last = pending.get(row["id"], (0, 0, None))
+                _add_stats(row, cents, points, last)
+
+    changed = {}
+    with Session(local) as db:
+        # A write first: on SQLite it takes the write lock, so no local sale
+        # can commit between reading the unpushed sales and applying them
+        set_state(db, PULLED_AT, _now().isoformat())
+        push_cursor = int(read_state(db).get(PUSH_CURSOR, 0))
+        unpushed_stock, unpushed_customers = _unpushed(db, tenant_id, push_cursor)
+
+        local_tenant = {key: value for key, value in tenant.items() if key not in LOCAL_TENANT_COLUMNS}
+        _upsert(db, _tenants, [local_tenant])
+        changed["users"] = _mirror(db, models.User.__table__, tenant_id, users)
+        changed["barcode_schemes"] = _mirror(db, models.BarcodeScheme.__table__, tenant_id, schemes)
+        if categories is not None:
+            changed["categories"] = _mirror(db, models.Category.__table__, tenant_id, categories)
+            set_state(db, CATEGORY_VERSION, tenant["category_version"])
+        if promotion_rows is not None:
+            changed["promotions"] = _mirror(db, models.Promotion.__table__, tenant_id, promotion_rows)
+            set_state(db, PRICING_VERSION, tenant["pricing_version"])
+        if products:
+            for row in products:
+                row["stock_quantity"] = (row["stock_quantity"] or 0) - unpushed_stock.get(row["id"], 0)
+            _upsert(db, _products, products)
+            set_state(db, PRODUCT_CURSOR, max(row["sync_version"] for row in products))
+        changed["products"] = len(products)
+        if customer_rows is not None:
+            for row in customer_rows:
+                cents, points, last = unpushed_customers.get(row["id"], (0, 0, None))
+                _add_stats(row, cents, points, last)
+            local_ids = db.scalars(
+                select(models.Customer.id).where(models.Customer.tenant_id == tenant_id)
+            ).all()
+            # Local deltas only ever describe local sales, which the rows above
+            # already count (pushed ones upstream, the rest just added)
+            for chunk in _chunks(local_ids):
+                db.execute(models.CustomerStatDelta.__table__.delete().where(
+                    models.CustomerStatDelta.customer_id.in_(chunk)
+                ))
+            changed["customers"] = _mirror(db, models.Customer.__table__, tenant_id, customer_rows)
+            set_state(db, CUSTOMERS_PULLED_AT, _now().isoformat())
+
+        caching.bump_versions(
+            db, tenant_id,
+            products=bool(products or changed.get("categories")),
+            categories=bool(changed.get("categories")),
+            pricing=bool(products or changed.get("promotions")),
+        )
+        db.commit()
+
+    # This process's in-memory indexes; other workers catch up on their TTLs
+    if products:
+        search.invalidate(tenant_id)
+    if changed["barcode_schemes"]:
+        barcodes.invalidate(tenant_id)
+    log("✓ Pulled " + ", ".join(f"{count} {table}" for table, count in changed.items()))
+    return changed
+
+def _add_stats(row: dict, cents: int, points: int, last):
+    if not cents and not points:
+        return
+    row["total_purchases"] = money.from_cents(money.to_cents(row["total_purchases"]) + cents)
+    row["loyalty_points"] = (row["loyalty_points"] or 0) + points
+    if last is not None and (row["last_purchase_date"] is None or row["last_purchase_date"] < last):
+        row["last_purchase_date"] = last
+
+# ==========================================
+# BACKGROUND REPLICATION
+# ==========================================
+
+class Replicator:
+    """Background thread that pushes sales and pulls the catalog every interval"""
+
+    def __init__(self, local, cloud=None, tenant_id: int = None, interval: float = None):
+        self.local = local
+        self.cloud = cloud
+        self.tenant_id = tenant_id or settings.EDGE_TENANT_ID
+        self.interval = settings.SYNC_INTERVAL_SECONDS if interval is None else interval
+        self._customers_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="edge-replicator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def sync_once(self):
+        if self.cloud is None:
+            self.cloud = create_upstream_engine()
+        push(self.local, self.cloud, self.tenant_id, log=logger.info)
+        now = time.monotonic()
+        customers = self._customers_at is None or now - self._customers_at >= settings.SYNC_CUSTOMERS_SECONDS
+        pull(self.local, self.cloud, self.tenant_id, customers=customers, log=logger.info)
+        if customers:
+            self._customers_at = now
+
+    def _run(self):
+        while True:
+            try:
+                self.sync_once()
+            except Exception:
+                # Offline or failing upstream: sales keep queueing locally
+                logger.exception("Edge sync failed")
+            if self._stop.wait(self.interval):
+                return
+
+def status(local, tenant_id: int) -> dict:
+    with Session(local) as db:
+        state = read_state(db)
+        cursor = int(state.get(PUSH_CURSOR, 0))
+        unpushed = db.scalar(
+            select(func.count()).select_from(_txn).where(_txn.c.tenant_id == tenant_id, _txn.c.id > cursor)
+        )
+    return {**state, "unpushed_sales": unpushed}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replicate a store-local edge database with the cloud")
+    parser.add_argument("command", choices=["once", "push", "pull", "status"])
+    parser.add_argument("--tenant", type=int, default=settings.EDGE_TENANT_ID, help="store tenant id")
+    parser.add_argument("--upstream", default=None, help="cloud database URL (default SYNC_UPSTREAM_URL)")
+    args = parser.parse_args()
+    if not args.tenant:
+        parser.error("set EDGE_TENANT_ID or pass --tenant")
+
+    if args.command == "status":
+        for key, value in sorted(status(database.engine, args.tenant).items()):
+            print(f"{key:>20}: {value}")
+    else:
+        upstream = create_upstream_engine(args.upstream)
+        if args.command in ("once", "push"):
+            push(database.engine, upstream, args.tenant)
+        if args.command in ("once", "pull"):
+            pull(database.engine, upstream, args.tenant)
+        print("\n✅ Sync complete")
@@ -0,0 +1,17 @@
+"""
+Shared test setup: the app runs against a throwaway SQLite database.
+
+The engine is created when database.py is imported, so DATABASE_URL has to
+be set here, before any test module imports the app.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_db_dir = tempfile.mkdtemp(prefix="pos-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'pos.db')}"
+# Tests fire far more requests per tenant than the limits allow
+os.environ["RATE_LIMIT_ENABLED"] = "false"
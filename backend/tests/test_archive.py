@@ -0,0 +1,82 @@
+"""
+Archiving a month that is already in cold storage keeps what was archived
+before and adds the late sales to both the files and the day summaries.
+"""
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+TENANT_ID = 7001
+MONTH = date(2024, 3, 1)
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    from migrate_database import migrate_database
+    migrate_database()
+
+    import database
+    from settings import settings
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path))
+    return database.engine
+
+def add_sale(conn, sale_id: int, created_at: datetime, total: str, quantity: int):
+    import models
+    conn.execute(models.Transaction.__table__.insert(), {
+        "id": sale_id, "tenant_id": TENANT_ID, "user_id": 1, "subtotal": Decimal(total),
+        "discount_amount": Decimal(0), "total_amount": Decimal(total), "payment_method": "cash",
+        "created_at": created_at,
+    })
+    conn.execute(models.TransactionItem.__table__.insert(), {
+        "transaction_id": sale_id, "product_id": 1, "product_name": "Tea", "quantity": quantity,
+        "unit_price": Decimal(total) / quantity, "total_price": Decimal(total), "discount_amount": Decimal(0),
+        "tenant_id": TENANT_ID, "created_at": created_at,
+    })
+
+def summaries(conn):
+    import models
+    summary = models.DailySalesSummary.__table__
+    rows = conn.execute(
+        summary.select().where(summary.c.tenant_id == TENANT_ID).order_by(summary.c.day)
+    ).mappings().all()
+    return {row["day"]: (Decimal(row["total_sales"]), row["transaction_count"], row["items_sold"]) for row in rows}
+
+def test_archiving_a_month_twice_keeps_earlier_sales(engine):
+    import pyarrow.parquet as pq
+    import archive
+
+    with engine.begin() as conn:
+        add_sale(conn, 700101, datetime(2024, 3, 4, 10), "10.00", 2)
+        add_sale(conn, 700102, datetime(2024, 3, 4, 15), "5.50", 1)
+        add_sale(conn, 700103, datetime(2024, 3, 20, 9), "3.25", 1)
+        assert archive.archive_month(conn, TENANT_ID, MONTH) == 3
+
+    # A store pushes a sale it made in March after the month was archived
+    with engine.begin() as conn:
+        add_sale(conn, 700104, datetime(2024, 3, 4, 18), "2.00", 4)
+        assert archive.archive_month(conn, TENANT_ID, MONTH) == 1
+
+    directory = archive.month_dir(TENANT_ID, MONTH)
+    transactions = pq.read_table(os.path.join(directory, "transactions.parquet"))
+    items = pq.read_table(os.path.join(directory, "items.parquet"))
+    assert sorted(transactions["id"].to_pylist()) == [700101, 700102, 700103, 700104]
+    assert sorted(items["transaction_id"].to_pylist()) == [700101, 700102, 700103, 700104]
+
+    with engine.connect() as conn:
+        assert summaries(conn) == {
+            date(2024, 3, 4): (Decimal("17.50"), 3, 7),
+            date(2024, 3, 20): (Decimal("3.25"), 1, 1),
+        }
+
+    import database
+    db = database.SessionLocal()
+    try:
+        assert archive.daily_sales(db, TENANT_ID, datetime(2024, 3, 1), datetime(2024, 4, 1)) == {
+            date(2024, 3, 4): (Decimal("17.50"), 3),
+            date(2024, 3, 20): (Decimal("3.25"), 1),
+        }
+    finally:
+        db.close()
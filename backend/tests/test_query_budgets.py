@@ -0,0 +1,130 @@
+"""
+Every route declared with @query_budget stays within its budget and issues
+no repeated statement shapes (N+1) against a store with real-looking data.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+pytest_plugins = ["query_budget"]
+
+PASSWORD = "Passw0rd!"
+
+@pytest.fixture(scope="module")
+def store():
+    """A signed-up tenant with a catalog, customers, sales, a return and a closed shift"""
+    from migrate_database import migrate_database
+    migrate_database()
+
+    import basket
+    import customer_stats
+    import database
+    import main
+
+    with TestClient(main.app) as client:
+        response = client.post("/api/v1/auth/signup", json={
+            "store_name": "Budget Store", "contact_phone": "1", "address": "a", "city": "c", "state": "s",
+            "first_name": "F", "last_name": "L", "email": "budget@example.com", "password": PASSWORD,
+            "plan_id": "basic", "terms_accepted": True,
+        })
+        assert response.status_code == 200, response.text
+        response = client.post("/api/v1/auth/login", json={"email": "budget@example.com", "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        categories = [client.post("/api/v1/categories", json={"name": name}, headers=headers).json()
+                      for name in ("Fruit", "Dairy")]
+        products = []
+        for i in range(10):
+            response = client.post("/api/v1/products", json={
+                "name": f"Item {i}", "barcode": f"40000{i:02d}", "category_id": categories[i % 2]["id"],
+                "cost_price": 1.1, "selling_price": 2.35, "stock_quantity": 500,
+            }, headers=headers)
+            assert response.status_code == 200, response.text
+            products.append(response.json())
+        customers = [client.post("/api/v1/customers", json={"name": f"Customer {i}"}, headers=headers).json()
+                     for i in range(3)]
+
+        shift = client.post("/api/v1/shifts/open", json={"till": "main", "opening_float": 50}, headers=headers).json()
+        sales = []
+        for n in range(6):
+            lines = products[n:n + 4]
+            response = client.post("/api/v1/transactions/create", json={
+                "items": [{"product_id": p["id"], "product_name": p["name"], "quantity": 2, "unit_price": 2.35}
+                          for p in lines],
+                "payment_method": "cash" if n % 2 else "card",
+                "customer_id": customers[n % 3]["id"],
+            }, headers=headers)
+            assert response.status_code == 200, response.text
+            sales.append(response.json())
+
+        sale = sales[-1]
+        items = client.get(f"/api/v1/transactions/{sale['id']}", headers=headers).json()["items"]
+        response = client.post(f"/api/v1/transactions/{sale['id']}/returns", json={
+            "items": [{"transaction_item_id": items[0]["id"], "quantity": 1}],
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+        response = client.post(f"/api/v1/shifts/{shift['id']}/close", json={"counted_cash": 60}, headers=headers)
+        assert response.status_code == 200, response.text
+
+        customer_stats.flush_pending(database.engine)
+        db = database.SessionLocal()
+        try:
+            basket.mine_tenant(db, products[0]["tenant_id"], log=lambda *a: None)
+            db.commit()
+        finally:
+            db.close()
+
+        yield {
+            "client": client, "headers": headers, "products": products, "customers": customers,
+            "sale": sale, "shift": shift,
+        }
+
+def budgeted_routes():
+    import main
+    return {
+        (method, route.path)
+        for route in main.app.routes
+        if getattr(getattr(route, "endpoint", None), "__query_budget__", None) is not None
+        for method in route.methods
+    }
+
+def requests_for(store):
+    product = store["products"][0]
+    sale_id = store["sale"]["id"]
+    shift_id = store["shift"]["id"]
+    return {
+        ("POST", "/api/v1/auth/login"): {"json": {"email": "budget@example.com", "password": PASSWORD}},
+        ("GET", "/api/v1/products"): {},
+        ("GET", "/api/v1/products/by-barcode/{barcode}"): {"url": f"/api/v1/products/by-barcode/{product['barcode']}"},
+        ("GET", "/api/v1/products/scan/{code}"): {"url": f"/api/v1/products/scan/{product['barcode']}"},
+        ("GET", "/api/v1/products/search"): {"params": {"q": "Item"}},
+        ("GET", "/api/v1/products/{product_id}/suggestions"): {"url": f"/api/v1/products/{product['id']}/suggestions"},
+        ("GET", "/api/v1/categories"): {},
+        ("GET", "/api/v1/customers"): {"params": {"search": "Cust"}},
+        ("POST", "/api/v1/cart/price"): {"json": {
+            "items": [{"product_id": p["id"], "quantity": 2} for p in store["products"][:5]],
+            "customer_id": store["customers"][0]["id"],
+        }},
+        ("GET", "/api/v1/shifts"): {},
+        ("GET", "/api/v1/shifts/{shift_id}/report"): {"url": f"/api/v1/shifts/{shift_id}/report"},
+        ("GET", "/api/v1/shifts/{shift_id}/z-report"): {"url": f"/api/v1/shifts/{shift_id}/z-report"},
+        ("GET", "/api/v1/transactions"): {},
+        ("GET", "/api/v1/transactions/{transaction_id}"): {"url": f"/api/v1/transactions/{sale_id}"},
+        ("GET", "/api/v1/transactions/{transaction_id}/returns"): {"url": f"/api/v1/transactions/{sale_id}/returns"},
+        ("GET", "/api/v1/transactions/{transaction_id}/receipt"): {"url": f"/api/v1/transactions/{sale_id}/receipt"},
+        ("GET", "/api/v1/analytics/dashboard"): {},
+        ("GET", "/api/v1/analytics/sales"): {"params": {"days": 30}},
+        ("GET", "/api/v1/analytics/forecast"): {},
+    }
+
+def test_every_budgeted_route_is_exercised(store):
+    assert budgeted_routes() <= set(requests_for(store)), "add a request for the new @query_budget route"
+
+@pytest.mark.usefixtures("enforce_query_budgets")
+@pytest.mark.parametrize("route", sorted(budgeted_routes()), ids=lambda r: f"{r[0]} {r[1]}")
+def test_route_stays_within_budget(store, route):
+    method, path = route
+    request = dict(requests_for(store)[route])
+    url = request.pop("url", path)
+    response = store["client"].request(method, url, headers=store["headers"], **request)
+    assert response.status_code == 200, response.text
+    assert "x-query-count" in response.headers